@@ -11,15 +11,94 @@ class Settings(BaseSettings):
     gmail_credentials_path: str | None = Field(None, env="GMAIL_CREDENTIALS_PATH")
     gmail_token_path: str | None = Field(None, env="GMAIL_TOKEN_PATH")
     gmail_user: str | None = Field(None, env="GMAIL_USER")
+    # Several mailboxes: a JSON list of {name, token_path, credentials_path, user_id,
+    # quota_units_per_second, burst_units}; without it the token/credentials above are the only mailbox
+    mailboxes_path: str | None = Field(None, env="MAILBOXES_PATH")
+    mailbox_state_path: str = Field(str(Path(__file__).resolve().parents[1] / "data" / "mailbox_state.json"), env="MAILBOX_STATE_PATH")
+    # Gmail API quota: per mailbox (user) per second, and per project across all mailboxes
+    gmail_quota_units_per_second: float = Field(250.0, env="GMAIL_QUOTA_UNITS_PER_SECOND")
+    gmail_burst_units: float = Field(25.0, env="GMAIL_BURST_UNITS")
+    gmail_project_quota_units_per_second: float = Field(20000.0, env="GMAIL_PROJECT_QUOTA_UNITS_PER_SECOND")
+    # messages fetched in parallel per mailbox, and mailboxes synced at once
+    gmail_fetch_concurrency: int = Field(4, env="GMAIL_FETCH_CONCURRENCY")
+    gmail_max_parallel_mailboxes: int = Field(8, env="GMAIL_MAX_PARALLEL_MAILBOXES")
+    gmail_max_retries: int = Field(5, env="GMAIL_MAX_RETRIES")
     # SMTP for sending replies
     smtp_host: str | None = Field(None, env="SMTP_HOST")
     smtp_port: int | None = Field(587, env="SMTP_PORT")
     smtp_user: str | None = Field(None, env="SMTP_USER")
     smtp_password: str | None = Field(None, env="SMTP_PASSWORD")
+    # Turn off only for local relays and test sinks that do not offer TLS
+    smtp_starttls: bool = Field(True, env="SMTP_STARTTLS")
+    # Durable send outbox (SQLite, shared by all workers): retries back off from the base delay,
+    # and a claim older than the lease is treated as a crashed sender and requeued
+    outbox_path: str = Field(str(Path(__file__).resolve().parents[1] / "data" / "outbox.db"), env="OUTBOX_PATH")
+    outbox_max_attempts: int = Field(5, env="OUTBOX_MAX_ATTEMPTS")
+    outbox_retry_base_seconds: float = Field(30.0, env="OUTBOX_RETRY_BASE_SECONDS")
+    outbox_lease_seconds: float = Field(300.0, env="OUTBOX_LEASE_SECONDS")
+    outbox_concurrency: int = Field(4, env="OUTBOX_CONCURRENCY")
+    outbox_worker_enabled: bool = Field(True, env="OUTBOX_WORKER_ENABLED")
+    outbox_poll_seconds: float = Field(5.0, env="OUTBOX_POLL_SECONDS")
     gemini_api_key: str | None = Field(None, env="GEMINI_API_KEY")
+    gemini_model: str = Field("gemini-1.5-flash", env="GEMINI_MODEL")
+    # Draft model: "auto" (Gemini when a key is set), "gemini" or "stub"
+    draft_model: str = Field("auto", env="DRAFT_MODEL")
+    llm_timeout_seconds: float = Field(30.0, env="LLM_TIMEOUT_SECONDS")
+    llm_max_concurrency: int = Field(8, env="LLM_MAX_CONCURRENCY")
+    llm_batch_window_ms: int = Field(10, env="LLM_BATCH_WINDOW_MS")
+    llm_max_batch: int = Field(8, env="LLM_MAX_BATCH")
+    llm_breaker_failures: int = Field(5, env="LLM_BREAKER_FAILURES")
+    llm_breaker_reset_seconds: float = Field(30.0, env="LLM_BREAKER_RESET_SECONDS")
+    # Prompt assembly: total token budget and the share of it the email body may use
+    prompt_token_budget: int = Field(2000, env="PROMPT_TOKEN_BUDGET")
+    prompt_body_share: float = Field(0.6, env="PROMPT_BODY_SHARE")
+    # Cleaned body (no HTML, quoted thread or signature) kept for analysis and drafting
+    clean_body_max_chars: int = Field(5000, env="CLEAN_BODY_MAX_CHARS")
+    # Priority scoring (services/scoring.py): base weights applied at ingest, plus points per hour
+    # an email waits unanswered, so old mail overtakes newer urgent mail after a while
+    score_urgent_weight: float = Field(5.0, env="SCORE_URGENT_WEIGHT")
+    score_negative_weight: float = Field(2.0, env="SCORE_NEGATIVE_WEIGHT")
+    score_short_body_weight: float = Field(0.0, env="SCORE_SHORT_BODY_WEIGHT")
+    score_aging_per_hour: float = Field(0.1, env="SCORE_AGING_PER_HOUR")
+    # Near-duplicate clustering at ingest (services/clustering.py): emails whose MinHash similarity to a
+    # cluster's first email reaches the threshold, within the window of it, join that cluster
+    cluster_enabled: bool = Field(True, env="CLUSTER_ENABLED")
+    cluster_threshold: float = Field(0.7, env="CLUSTER_THRESHOLD")
+    cluster_window_hours: float = Field(24.0, env="CLUSTER_WINDOW_HOURS")
+    # Store backend: "memory" (per process) or "sqlite" (a WAL database shared by all workers)
+    store_backend: str = Field("memory", env="STORE_BACKEND")
+    sqlite_path: str = Field(str(Path(__file__).resolve().parents[1] / "data" / "store.db"), env="SQLITE_PATH")
+    # Store persistence (memory backend only): columnar snapshots plus a change log, restored on startup
+    snapshot_enabled: bool = Field(True, env="SNAPSHOT_ENABLED")
+    snapshot_dir: str = Field(str(Path(__file__).resolve().parents[1] / "data" / "snapshot"), env="SNAPSHOT_DIR")
+    snapshot_interval_seconds: float = Field(300.0, env="SNAPSHOT_INTERVAL_SECONDS")
+    # Prometheus metrics at GET /metrics; when disabled, timers and counters are no-ops
+    metrics_enabled: bool = Field(True, env="METRICS_ENABLED")
+    # Request profiling: sampled requests slower than the threshold keep a profile in a ring
+    # served at /debug/profiles; mode is "cprofile" (pstats) or "sample" (collapsed stacks).
+    # Off unless enabled: the X-Profile header and /debug/profiles only work with profiling on
+    profiling_enabled: bool = Field(False, env="PROFILING_ENABLED")
+    profiling_allow_header: bool = Field(False, env="PROFILING_ALLOW_HEADER")
+    profiling_sample_rate: float = Field(0.1, env="PROFILING_SAMPLE_RATE")
+    profiling_threshold_ms: float = Field(1000.0, env="PROFILING_THRESHOLD_MS")
+    profiling_max_profiles: int = Field(20, env="PROFILING_MAX_PROFILES")
+    profiling_mode: str = Field("cprofile", env="PROFILING_MODE")
+    profiling_sample_interval_ms: float = Field(5.0, env="PROFILING_SAMPLE_INTERVAL_MS")
+    # Bulk export (GET /emails/export and python -m app.services.export): emails read and encoded per batch,
+    # which is also the Parquet row group size
+    export_batch_size: int = Field(2000, env="EXPORT_BATCH_SIZE")
     embeddings_model: str = Field("all-MiniLM-L6-v2", env="EMBEDDINGS_MODEL")
     rag_top_k: int = Field(3, env="RAG_TOP_K")
     response_temperature: float = Field(0.4, env="RESPONSE_TEMPERATURE")
+    # Draft cache (LRU + TTL, persisted as JSONL so restarts keep paid-for drafts)
+    draft_cache_path: str | None = Field(str(Path(__file__).resolve().parents[1] / "data" / "draft_cache.jsonl"), env="DRAFT_CACHE_PATH")
+    draft_cache_max_entries: int = Field(1000, env="DRAFT_CACHE_MAX_ENTRIES")
+    draft_cache_ttl_seconds: int = Field(86400, env="DRAFT_CACHE_TTL_SECONDS")
+    # Background pre-drafting after ingestion
+    predraft_enabled: bool = Field(True, env="PREDRAFT_ENABLED")
+    predraft_limit: int = Field(200, env="PREDRAFT_LIMIT")
+    predraft_batch_size: int = Field(20, env="PREDRAFT_BATCH_SIZE")
+    predraft_concurrency: int = Field(4, env="PREDRAFT_CONCURRENCY")
     allowed_origins: str = Field("*", env="ALLOWED_ORIGINS")
     csv_path: str = Field(str(Path(__file__).resolve().parents[2] / "68b1acd44f393_Sample_Support_Emails_Dataset.csv"), env="CSV_PATH")
 
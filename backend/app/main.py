@@ -1,11 +1,48 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .config import get_settings
 from .routes.emails import router as emails_router
+from .routes.profiles import router as profiles_router
+from .services.email_send import start_outbox_worker, stop_outbox_worker
+from .services.email_fetch import stop_fetch_pools
+from .services import metrics
+from .services.profiling import profile_request
 
 settings = get_settings()
+metrics.ENABLED = settings.metrics_enabled
 
-app = FastAPI(title="AI Communication Assistant", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional integrations are imported and started here, and only when configured,
+    # so a CSV-only deployment never loads the Gmail client, numpy or smtplib.
+    snapshots = settings.snapshot_enabled and settings.store_backend == 'memory'
+    if snapshots:
+        # the SQLite backend is durable on its own; snapshots persist the in-memory store
+        from .services.snapshot import start_persistence
+        start_persistence(settings.snapshot_dir, settings.snapshot_interval_seconds)
+    gmail = bool(settings.gmail_credentials_path or settings.gmail_token_path or settings.mailboxes_path)
+    if gmail:
+        from .services.gmail_client import start_gmail_client
+        error = start_gmail_client()
+        if error:
+            print(f"Gmail client not started: {error}")
+    if settings.outbox_worker_enabled and settings.smtp_host:
+        start_outbox_worker(settings.outbox_poll_seconds, settings.outbox_lease_seconds)
+    yield
+    stop_outbox_worker()
+    stop_fetch_pools()
+    if gmail:
+        from .services.gmail_client import stop_gmail_client
+        stop_gmail_client()
+    if snapshots:
+        from .services.snapshot import stop_persistence
+        stop_persistence()
+
+
+app = FastAPI(title="AI Communication Assistant", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,11 +52,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    # Opt-in: PROFILING_ENABLED samples requests; with PROFILING_ALLOW_HEADER too, X-Profile: 1 forces one
+    return await profile_request(request, call_next)
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(emails_router)
+if settings.profiling_enabled:
+    # captured profiles are served without auth, so only when profiling was turned on
+    app.include_router(profiles_router)
 
 @app.get("/")
 async def root():
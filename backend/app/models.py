@@ -10,19 +10,6 @@ class ExtractionResult(BaseModel):
     sentiment: str | None = None
     urgency_reason: str | None = None
 
-class EmailRecord(BaseModel):
-    id: Optional[str] = Field(None, alias="_id")
-    message_id: str
-    sender: str
-    subject: str
-    body: str
-    received_at: datetime
-    sentiment: Optional[str] = None
-    priority: Optional[str] = None
-    priority_score: Optional[float] = None
-    extraction: Optional[ExtractionResult] = None
-    status: str = "new"  # new, processed, responded
-
 class ResponseDraft(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     email_id: str
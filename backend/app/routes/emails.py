@@ -1,23 +1,49 @@
-from fastapi import APIRouter
+import time
+from fastapi import APIRouter, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from ..services.csv_ingest import load_csv
 from ..services.email_fetch import fetch_from_gmail_inbox
-from ..services.store import list_emails_sorted, get_email, add_response, clear_all_data
-from ..services.response import generate_draft
-from ..services.email_send import send_email_reply, send_bulk_replies
+from ..services.store import list_emails_sorted, get_email, latest_open_draft, clear_all_data, thread_sizes, load_full
+from ..services.store import list_clusters, cluster_members
+from ..services.response import generate_draft, stream_draft, preview_prompt
+from ..services.predraft import predraft_pending
+from ..services.email_send import (send_email_reply, send_bulk_replies, send_cluster_reply, drain_outbox,
+                                   cluster_template)
+from ..services.outbox import get_outbox
+from ..services.export import parse_request, export_chunks
+from ..services.mailboxes import load_mailboxes, get_cursors
+from ..services.records import to_iso, to_epoch
+from ..services.scoring import effective_score
 from ..config import get_settings
-from ..services.store import compute_stats
+from ..services.store import compute_stats, rollup_timeseries
 
 router = APIRouter(prefix="/emails", tags=["emails"])
 
 @router.post('/clear')
-async def clear_data():
+def clear_data():
     """Clear all stored email data"""
     return clear_all_data()
 
+def _schedule_predraft(background_tasks: BackgroundTasks, result: dict):
+    if get_settings().predraft_enabled and result.get('stored'):
+        background_tasks.add_task(predraft_pending)
+
+
+@router.post('/snapshot')
+def snapshot_now():
+    """Write a store checkpoint immediately"""
+    from ..services.snapshot import get_manager
+    manager = get_manager()
+    if manager is None:
+        return {"error": "snapshots are disabled"}
+    return manager.checkpoint(force=True)
+
 @router.post('/load_csv')
-async def load_from_csv(path: str | None = None):
+def load_from_csv(background_tasks: BackgroundTasks, path: str | None = None):
     settings = get_settings()
-    return load_csv(path or settings.csv_path)
+    result = load_csv(path or settings.csv_path)
+    _schedule_predraft(background_tasks, result)
+    return result
 
 @router.get('/filters')
 async def get_filter_categories():
@@ -32,40 +58,152 @@ async def get_filter_categories():
     }
 
 @router.post('/load_inbox')
-async def load_from_inbox(limit: int = 100, filter_category: str = "all"):
-    """Load support emails from Gmail inbox using Gmail API with category filtering"""
-    return fetch_from_gmail_inbox(limit=limit, filter_category=filter_category)
+def load_from_inbox(background_tasks: BackgroundTasks, limit: int = 100, filter_category: str = "all",
+                    mailbox: str | None = None):
+    """Load support emails from every registered Gmail mailbox (or one), up to ``limit`` per mailbox"""
+    # a plain def: the sync blocks on Gmail, so it runs in the threadpool, not on the event loop
+    result = fetch_from_gmail_inbox(limit=limit, filter_category=filter_category, mailbox=mailbox)
+    _schedule_predraft(background_tasks, result)
+    return result
+
+@router.get('/mailboxes')
+def list_mailboxes():
+    """Registered mailboxes with their quota budget and sync cursor"""
+    settings = get_settings()
+    cursors = get_cursors()
+    return [
+        {
+            "name": m.name,
+            "user_id": m.user_id,
+            "quota_units_per_second": m.quota_units_per_second or settings.gmail_quota_units_per_second,
+            "cursor": to_iso(cursors.get(m.name)),
+        }
+        for m in load_mailboxes()
+    ]
+
+@router.post('/predraft')
+def predraft(limit: int | None = None):
+    """Generate drafts for pending emails now, highest priority first"""
+    return predraft_pending(limit=limit)
 
 @router.get('/')
-async def list_emails(limit: int = 50):
-    docs = list_emails_sorted(limit=limit)
-    return [{k: v for k, v in d.items() if k != 'body'} for d in docs]
+def list_emails(limit: int = 50):
+    """Conversations in SLA order: base priority plus the aging of unanswered mail"""
+    rows = load_full(list_emails_sorted(limit=limit))
+    sizes = thread_sizes([row.thread_key for row in rows])
+    now = time.time()
+    return [
+        {**row.to_api(include_body=False), 'thread_size': sizes.get(row.thread_key, 1),
+         'sla_score': round(effective_score(row, now), 3)}
+        for row in rows
+    ]
+
+@router.get('/stats')
+def stats():
+    return compute_stats()
+
+@router.get('/stats/timeseries')
+def stats_timeseries(start: str | None = Query(None, alias='from'), end: str | None = Query(None, alias='to'),
+                     granularity: str = 'day'):
+    """Per-period counts by category, sentiment and priority plus response-time quantiles, from the rollups"""
+    end_ts = to_epoch(end) if end else int(time.time())
+    start_ts = to_epoch(start) if start else None
+    if end_ts is None or (start and start_ts is None):
+        return {"error": "'from' and 'to' must be ISO-8601 timestamps"}
+    if start_ts is None:
+        start_ts = end_ts - 30 * 86400
+    return rollup_timeseries(start_ts, end_ts, granularity)
+
+@router.get('/outbox')
+def outbox_status(status: str | None = None, limit: int = 100):
+    """Send queue counts by status and the most recent items (without message bodies)"""
+    box = get_outbox()
+    return {"counts": box.counts(), "items": box.list_items(status=status, limit=limit)}
+
+@router.post('/outbox/drain')
+def drain():
+    """Send every due outbox item now instead of waiting for the background sender"""
+    return drain_outbox()
+
+@router.get('/clusters')
+def clusters(min_size: int = 2, limit: int = 50):
+    """Near-duplicate clusters, largest first, each with its first email"""
+    result = []
+    for cluster in list_clusters(min_size=min_size, limit=limit):
+        first = get_email(cluster['id'])
+        result.append({**cluster, "email": first.to_api(include_body=False) if first else None})
+    return result
+
+@router.get('/clusters/{cluster_id}')
+def cluster_detail(cluster_id: str):
+    """Members of a cluster, oldest first, and the sender-neutral draft each of them would be sent"""
+    members = cluster_members(cluster_id)
+    if not members:
+        return {"error": "not found"}
+    return {
+        "id": cluster_id,
+        "size": len(members),
+        "members": [row.to_api(include_body=False) for row in members],
+        "draft": cluster_template(cluster_id),
+    }
+
+@router.post('/clusters/{cluster_id}/send')
+def send_cluster(cluster_id: str, draft: str = None):
+    """Send one reviewed draft to every unanswered member of the cluster"""
+    return send_cluster_reply(cluster_id, draft)
+
+@router.get('/export')
+def export(format: str = 'csv', columns: str | None = None, compression: str | None = None,
+           start: str | None = Query(None, alias='from'), end: str | None = Query(None, alias='to'),
+           status: str | None = None, priority: str | None = None, sentiment: str | None = None,
+           category: str | None = None, mailbox: str | None = None):
+    """Stream every matching email with its extraction and draft as CSV, NDJSON or Parquet, in constant memory"""
+    plan = parse_request(format, columns, compression, start, end, status=status, priority=priority,
+                         sentiment=sentiment, matched_category=category, mailbox=mailbox)
+    if 'error' in plan:
+        return plan
+    return StreamingResponse(export_chunks(plan), media_type=plan['media_type'],
+                             headers={'Content-Disposition': f'attachment; filename="{plan["filename"]}"'})
 
 @router.get('/{email_id}')
-async def get_email_detail(email_id: str):
+def get_email_detail(email_id: str):
     doc = get_email(email_id)
     if not doc:
         return {"error": "not found"}
-    return doc
+    response = latest_open_draft(email_id)
+    return {**doc.to_api(), "draft": response['draft'] if response else None}
 
 @router.post('/{email_id}/draft')
-async def make_draft(email_id: str):
+def make_draft(email_id: str):
+    # sync handler: runs in the threadpool so concurrent clicks can share one generation
     draft = generate_draft(email_id)
     if not draft:
         return {"error": "email not found"}
-    # store response draft
-    add_response(email_id, draft)
     return {"draft": draft}
 
+@router.get('/{email_id}/prompt')
+def get_prompt(email_id: str):
+    """Prompt that would be sent for this email, with token counts per section"""
+    built = preview_prompt(email_id)
+    if not built:
+        return {"error": "email not found"}
+    return built
+
+@router.get('/{email_id}/draft/stream')
+def make_draft_stream(email_id: str):
+    """Stream the draft as plain text chunks while the model generates it"""
+    tokens = stream_draft(email_id)
+    if tokens is None:
+        return {"error": "email not found"}
+    return StreamingResponse(tokens, media_type='text/plain; charset=utf-8')
+
 @router.post('/{email_id}/send')
-async def send_reply(email_id: str, draft: str = None):
+def send_reply(email_id: str, draft: str = None):
+    # sync handler: the outbox write and SMTP send block, so they run in the threadpool, off the event loop
     if not draft:
         # Use existing draft
-        from ..services.store import RESPONSES
-        for response in RESPONSES.values():
-            if response['email_id'] == email_id and not response.get('final', False):
-                draft = response['draft']
-                break
+        response = latest_open_draft(email_id)
+        draft = response['draft'] if response else None
         if not draft:
             return {"error": "No draft found. Generate a draft first."}
     
@@ -73,11 +211,7 @@ async def send_reply(email_id: str, draft: str = None):
     return result
 
 @router.post('/send_bulk')
-async def send_bulk(priority_filter: str = None):
+def send_bulk(priority_filter: str = None):
     """Send replies to multiple emails. priority_filter: 'urgent' or None for all"""
     result = send_bulk_replies(priority_filter)
     return result
-
-@router.get('/stats')
-async def stats():
-    return compute_stats()
@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from ..services.profiling import get_ring
+
+router = APIRouter(prefix="/debug/profiles", tags=["profiling"])
+
+@router.get('/')
+async def list_profiles():
+    """Captured request profiles, newest first"""
+    return [p.summary() for p in get_ring().list()]
+
+@router.get('/{profile_id}')
+async def download_profile(profile_id: int):
+    """The profile as a file: pstats (snakeviz, flameprof) or collapsed stacks (flamegraph.pl, speedscope)"""
+    profile = get_ring().get(profile_id)
+    if not profile:
+        return {"error": "profile not found"}
+    if profile.mode == 'cprofile':
+        filename, media_type = f"profile-{profile.id}.pstats", "application/octet-stream"
+    else:
+        filename, media_type = f"profile-{profile.id}.collapsed", "text/plain; charset=utf-8"
+    return Response(profile.data, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -0,0 +1,243 @@
+from __future__ import annotations
+from itertools import repeat
+from typing import Any, Dict, List
+import threading
+import uuid
+from ..config import get_settings
+from . import store
+from .records import EmailRow
+from .metrics import EMAILS_CLUSTERED
+
+# Near-duplicate clustering at ingest, so an outage storm of near-identical
+# emails becomes one cluster that is drafted once and answered together.
+#
+# Each email gets a MinHash signature (NUM_PERM minimum hashes) over the word
+# 3-grams of its subject and cleaned body. The signature is cut into BANDS bands,
+# and every band hashes to a bucket key. Emails that share any bucket are
+# candidates, and one joins a candidate cluster when the signatures agree on at
+# least CLUSTER_THRESHOLD of their positions, which estimates the Jaccard
+# similarity of the 3-gram sets. With 16 bands of 4 rows, a pair at similarity
+# 0.8 shares a bucket with probability 0.9999, and a pair at 0.3 with 0.12.
+#
+# The store keeps bucket -> newest cluster for the clusters started in the last
+# CLUSTER_WINDOW_HOURS. A new email therefore costs BANDS lookups whatever the
+# size of the inbox. A cluster is named after its first email. Emails that never
+# gained a duplicate keep cluster_id None.
+#
+# Hashing runs once per ingest batch in numpy, with no Python work per word:
+# the batch is one byte array, words are runs of letters and digits hashed with
+# a polynomial prefix sum, consecutive words combine into 3-gram hashes, and
+# each permutation is one multiply-shift hash over all 3-grams followed by a
+# per-email minimum.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+# band index goes in the top bits so equal band values in different bands never collide
+BAND_SHIFT = 58
+# polynomial word hash base (odd, so it has an inverse mod 2^64)
+WORD_BASE = 0x100000001B3
+# batch bytes covered by the cached power tables (8 MB for both); longer batches build their own
+POWER_CACHE_SIZE = 1 << 19
+
+_hash_params = None
+# byte -> part of a word (ASCII letters and digits, and any non-ASCII UTF-8 byte)
+_word_bytes = None
+# WORD_BASE^i and its inverse^i for i < POWER_CACHE_SIZE
+_powers = None
+# held from the bucket lookup until the batch's rows and clusters are stored, so concurrent
+# ingests never start two clusters for the same duplicates or join a cluster whose first email is missing
+_lock = threading.Lock()
+
+
+def _params():
+    """Seeded odd multipliers and offsets of the multiply-shift hashes, one per permutation"""
+    global _hash_params
+    if _hash_params is None:
+        import numpy as np
+        rng = np.random.default_rng(20240611)
+        a = rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        b = rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+        _hash_params = (a, b)
+    return _hash_params
+
+
+def _build_powers(n: int):
+    import numpy as np
+    tables = []
+    for base in (WORD_BASE, pow(WORD_BASE, -1, 1 << 64)):
+        steps = np.full(n, base, dtype=np.uint64)
+        if n:
+            steps[0] = 1
+        tables.append(np.cumprod(steps))
+    return tables[0], tables[1]
+
+
+def _power_tables(n: int):
+    """WORD_BASE^i and its inverse^i for i < n; only the first POWER_CACHE_SIZE are kept between batches"""
+    global _powers
+    if n > POWER_CACHE_SIZE:
+        return _build_powers(n)
+    if _powers is None:
+        _powers = _build_powers(POWER_CACHE_SIZE)
+    return _powers[0][:n], _powers[1][:n]
+
+
+def _word_hashes(texts: List[str]):
+    """Hash of every word of every text, in order, and the number of words per text"""
+    global _word_bytes
+    import numpy as np
+
+    if _word_bytes is None:
+        table = np.zeros(256, dtype=bool)
+        table[list(b'abcdefghijklmnopqrstuvwxyz0123456789')] = True
+        table[0x80:] = True
+        _word_bytes = table
+    # NUL separates the texts
+    joined = '\x00'.join(text.replace('\x00', ' ') for text in texts)
+    data = np.frombuffer(joined.lower().encode('utf-8'), dtype=np.uint8)
+    edges = np.diff(_word_bytes[data].astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    counts = np.bincount(np.cumsum(data == 0)[starts], minlength=len(texts))
+    # prefix[i] = sum of byte_k * base^-k, so a word's hash is (prefix[end] - prefix[start - 1]) * base^end
+    powers, inverse = _power_tables(len(data))
+    prefix = np.cumsum((data.astype(np.uint64) + np.uint64(1)) * inverse)
+    before = np.where(starts > 0, prefix[starts - 1], np.uint64(0))
+    return (prefix[ends] - before) * powers[ends], counts
+
+
+def signatures(texts: List[str]):
+    """(len(texts), NUM_PERM) uint32 MinHash signatures, and a mask of the texts that had any words"""
+    import numpy as np
+
+    flat, counts = _word_hashes(texts)
+
+    # lay the texts out with two zero words after each, so a text shorter than 3 words still gets one 3-gram
+    padded_starts = np.concatenate(([0], np.cumsum(counts + 2)[:-1]))
+    word_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    padded = np.zeros(len(flat) + 2 * len(texts), dtype=np.uint64)
+    padded[np.repeat(padded_starts - word_starts, counts) + np.arange(len(flat))] = flat
+    grams = padded[:-2] * np.uint64(0x9E3779B97F4A7C15) + padded[1:-1] * np.uint64(0xC2B2AE3D27D4EB4F) + padded[2:]
+    gram_counts = np.where(counts > 0, np.maximum(counts - 2, 1), 0)
+    gram_starts = np.concatenate(([0], np.cumsum(gram_counts)[:-1]))
+    grams = grams[np.repeat(padded_starts - gram_starts, gram_counts) + np.arange(int(gram_counts.sum()))]
+
+    present = gram_counts > 0
+    result = np.full((len(texts), NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    if not present.any():
+        return result, present
+    starts = gram_starts[present]
+    a, b = _params()
+    columns = np.empty((NUM_PERM, len(starts)), dtype=np.uint64)
+    # one permutation at a time keeps the working set in cache
+    for i in range(NUM_PERM):
+        columns[i] = np.minimum.reduceat((grams * a[i] + b[i]) >> np.uint64(32), starts)
+    result[present] = columns.T
+    return result, present
+
+
+def band_keys(sigs):
+    """(n, BANDS) int64 bucket keys: each band's ROWS_PER_BAND values folded into one hash, band index on top"""
+    import numpy as np
+
+    bands = sigs.reshape(len(sigs), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    folded = np.zeros(bands.shape[:2], dtype=np.uint64)
+    for j in range(ROWS_PER_BAND):
+        folded = folded * np.uint64(0x9E3779B97F4A7C15) + bands[:, :, j]
+    folded &= np.uint64((1 << BAND_SHIFT) - 1)
+    band_index = np.arange(BANDS, dtype=np.uint64) << np.uint64(BAND_SHIFT)
+    return (folded | band_index).astype(np.int64)
+
+
+def _decode(signature: str):
+    """Stored signatures keep the low 16 bits of each value (b-bit MinHash), hex-encoded"""
+    import numpy as np
+    return np.frombuffer(bytes.fromhex(signature), dtype=np.uint16)
+
+
+def _text(row: EmailRow) -> str:
+    return f"{store.REPLY_PREFIX_REGEX.sub('', row.subject)} {row.clean_body or row.body or ''}"
+
+
+def assign_clusters(rows: List[EmailRow]) -> int:
+    """Set cluster_id on new rows before they are stored; returns how many joined an existing cluster.
+
+    Rows get their id here if they have none, since a cluster is named after
+    its first email. A row that starts a cluster keeps cluster_id None until a
+    second email joins it. Ingest paths use store_clustered, which also stores
+    the rows before another batch can look their clusters up.
+    """
+    with _lock:
+        return _assign(rows)
+
+
+def store_clustered(rows: List[EmailRow]) -> int:
+    """assign_clusters and upsert_many under one lock; returns how many rows were stored"""
+    if not rows:
+        return 0
+    with _lock:
+        _assign(rows)
+        return store.upsert_many(rows)
+
+
+def _assign(rows: List[EmailRow]) -> int:
+    import numpy as np
+
+    settings = get_settings()
+    if not settings.cluster_enabled or not rows:
+        return 0
+    window = store.cluster_window_seconds()
+    threshold = settings.cluster_threshold
+    for row in rows:
+        if not row.id:
+            row.id = str(uuid.uuid4())
+    sigs, present = signatures([_text(row) for row in rows])
+    key_array = band_keys(sigs)
+    keys = key_array.tolist()
+    compact = sigs.astype(np.uint16)
+    hexes = [sig.tobytes().hex() for sig in compact]
+    present = present.tolist()
+
+    # bucket -> cluster id, from the store and then from clusters this batch starts
+    known = store.lsh_lookup(np.unique(key_array[np.asarray(present)]).tolist())
+    buckets = {key: cluster['id'] for key, cluster in known.items()}
+    clusters: Dict[str, Dict[str, Any]] = {cluster['id']: cluster for cluster in known.values()}
+    decoded = {cid: _decode(cluster['signature']) for cid, cluster in clusters.items()}
+    # rows of this batch by id; they are not stored yet
+    batch_rows = {row.id: row for row in rows}
+    new_clusters = []
+    shared = []
+    joined = 0
+    for i, row in enumerate(rows):
+        if not present[i]:
+            continue
+        candidates = set(map(buckets.get, keys[i]))
+        candidates.discard(None)
+        candidates = [cid for cid in candidates if abs(row.received_at - clusters[cid]['received_at']) <= window]
+        if candidates:
+            scores = (np.stack([decoded[cid] for cid in candidates]) == compact[i]).mean(axis=1)
+            best = int(scores.argmax())
+            if scores[best] >= threshold:
+                cid = candidates[best]
+                row.cluster_id = cid
+                joined += 1
+                first = batch_rows.get(cid)
+                if first is not None:
+                    first.cluster_id = cid
+                elif cid not in shared:
+                    shared.append(cid)
+                continue
+        cid = row.id
+        cluster = {'id': cid, 'signature': hexes[i], 'received_at': row.received_at, 'keys': keys[i]}
+        new_clusters.append(cluster)
+        clusters[cid] = cluster
+        decoded[cid] = compact[i]
+        buckets.update(zip(keys[i], repeat(cid)))
+    store.add_clusters(new_clusters)
+    for cid in shared:
+        first = store.get_email(cid)
+        if first is not None and first.cluster_id != cid:
+            store.update_email(cid, cluster_id=cid)
+    EMAILS_CLUSTERED.inc(joined)
+    return joined
@@ -0,0 +1,158 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import threading
+import time
+
+
+def draft_key(email: Any, context: Any, model: str, template_version: str) -> str:
+    """Hash everything that can change the generated draft (the id feeds the ticket reference)"""
+    doc = email.to_doc()
+    payload = {
+        'id': doc['id'],
+        'sender': doc['sender'],
+        'subject': doc['subject'],
+        'body': doc['body'],
+        'sentiment': doc['sentiment'],
+        'priority': doc['priority'],
+        'extraction': doc['extraction'] or {},
+        'context': context,
+        'model': model,
+        'template': template_version,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8', errors='ignore')).hexdigest()
+
+
+class DraftCache:
+    """Bounded LRU + TTL cache of generated drafts, persisted as an append-only JSONL log.
+
+    Every put appends one line; the log is rewritten from the live entries
+    once it holds more than twice ``max_entries`` lines, so restarts stay cheap.
+    """
+
+    def __init__(self, path: str | None, max_entries: int = 1000, ttl_seconds: int = 86400):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._log_lines = 0
+        self._load()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def _insert(self, key: str, stored_at: float, draft: str):
+        self._entries[key] = (stored_at, draft)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        now = time.time()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    if self._expired(item['t'], now):
+                        self._entries.pop(item['k'], None)
+                        continue
+                    self._insert(item['k'], item['t'], item['d'])
+        except OSError as e:
+            print(f"Draft cache load failed: {e}")
+            return
+        if self._log_lines > 2 * self.max_entries:
+            self._compact()
+
+    def _compact(self):
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for key, (stored_at, draft) in self._entries.items():
+                f.write(json.dumps({'k': key, 't': stored_at, 'd': draft}) + '\n')
+        tmp.replace(self.path)
+        self._log_lines = len(self._entries)
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            stored_at, draft = item
+            if self._expired(stored_at, time.time()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return draft
+
+    def put(self, key: str, draft: str):
+        stored_at = time.time()
+        with self._lock:
+            self._insert(key, stored_at, draft)
+            if not self.path:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'k': key, 't': stored_at, 'd': draft}) + '\n')
+                self._log_lines += 1
+                if self._log_lines > 2 * self.max_entries:
+                    self._compact()
+            except OSError as e:
+                print(f"Draft cache write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path and self.path.exists():
+                self.path.unlink()
+            self._log_lines = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+_INFLIGHT: Dict[str, _Call] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def single_flight(key: str, fn: Callable[[], Any]) -> Any:
+    """Run ``fn`` once per key; concurrent callers with the same key wait for that result"""
+    with _INFLIGHT_LOCK:
+        call = _INFLIGHT.get(key)
+        leader = call is None
+        if leader:
+            call = _INFLIGHT[key] = _Call()
+    if not leader:
+        call.done.wait()
+        if call.error:
+            raise call.error
+        return call.result
+    try:
+        call.result = fn()
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+        call.done.set()
@@ -1,19 +1,23 @@
 import base64
-import json
 import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from pathlib import Path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from typing import Dict
 
 from ..config import get_settings
-from .store import upsert_email
+from .gmail_client import get_gmail_client
+from .mailboxes import Mailbox, load_mailboxes, acquire_quota, mailbox_bucket, get_cursors, CURSOR_OVERLAP_SECONDS
+from .store import find_by_message_id, has_mailbox_emails
+from .normalize import normalize_body
+from .scoring import base_score
+from .clustering import store_clustered
+from .records import EmailRow, Extraction, Sentiment, Priority, Status, Category
+from .metrics import (timed, GMAIL_SECONDS, GMAIL_QUOTA_WAIT_SECONDS, NLP_SECONDS, EMAILS_FETCHED,
+                      EMAILS_STORED, EMAILS_DEDUPED, EMAILS_FAILED, GMAIL_RETRIES)
 
-# Gmail API scopes
-SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 FILTER_KEYWORDS = {
     "support": ["support", "customer support", "tech support", "help desk"],
     "query": ["query", "question", "inquiry", "ask", "clarification"],
@@ -30,59 +34,53 @@ def _hash_message_id(raw: str) -> str:
     return hashlib.sha256(raw.encode("utf-8", errors="ignore")).hexdigest()
 
 
-def _get_gmail_service():
-    """Get authenticated Gmail service using OAuth2"""
-    settings = get_settings()
-    creds = None
-    
-    # Load existing token
-    token_path = settings.gmail_token_path or "token.json"
-    if Path(token_path).exists():
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    
-    # If there are no (valid) credentials available, let the user log in
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            credentials_path = settings.gmail_credentials_path or "credentials.json"
-            if not Path(credentials_path).exists():
-                return None, "Gmail credentials.json file not found. Please download it from Google Cloud Console."
-            
-            # Check if it's the correct type of credentials
-            try:
-                with open(credentials_path, 'r') as f:
-                    cred_data = json.load(f)
-                    
-                # Check if it's a service account (wrong type)
-                if cred_data.get('type') == 'service_account':
-                    return None, "Invalid credentials: Service Account detected. Gmail API requires Desktop Application credentials for personal email access."
-                
-                # Check if it has the correct structure for installed app
-                if 'installed' not in cred_data and 'web' not in cred_data:
-                    return None, "Invalid credentials: Must be OAuth2 Desktop Application credentials, not Service Account."
-                    
-            except Exception as e:
-                return None, f"Error reading credentials file: {e}"
-            
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
-                creds = flow.run_local_server(port=0)
-            except Exception as e:
-                return None, f"OAuth2 flow failed: {e}"
-        
-        # Save the credentials for the next run
-        try:
-            with open(token_path, 'w') as token:
-                token.write(creds.to_json())
-        except Exception as e:
-            return None, f"Failed to save token: {e}"
-    
-    try:
-        service = build('gmail', 'v1', credentials=creds)
-        return service, None
-    except Exception as e:
-        return None, f"Failed to build Gmail service: {str(e)}"
+# messages per mailbox when the caller gives no limit
+DEFAULT_FETCH_LIMIT = 50
+# Gmail returns at most this many ids per list page
+LIST_PAGE_SIZE = 500
+MAX_BACKOFF_SECONDS = 32.0
+# dedupe check and insert happen together, so two mailboxes holding the same message store it once
+_store_lock = threading.Lock()
+# Worker pools live as long as the app (shut down from the lifespan), so each worker thread keeps its
+# Gmail service and TLS connection (services/gmail_client.py) from one poll to the next
+_sync_pool: ThreadPoolExecutor | None = None
+_message_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _mailbox_pool() -> ThreadPoolExecutor:
+    """Runs one sync per mailbox, up to GMAIL_MAX_PARALLEL_MAILBOXES at once"""
+    global _sync_pool
+    with _pools_lock:
+        if _sync_pool is None:
+            _sync_pool = ThreadPoolExecutor(max_workers=max(1, get_settings().gmail_max_parallel_mailboxes),
+                                            thread_name_prefix='gmail-sync')
+        return _sync_pool
+
+
+def _message_pool(mailbox: Mailbox) -> ThreadPoolExecutor:
+    """Fetches one mailbox's messages, GMAIL_FETCH_CONCURRENCY at a time"""
+    with _pools_lock:
+        pool = _message_pools.get(mailbox.name)
+        if pool is None:
+            pool = _message_pools[mailbox.name] = ThreadPoolExecutor(
+                max_workers=get_settings().gmail_fetch_concurrency, thread_name_prefix=f'gmail-{mailbox.name}')
+        return pool
+
+
+def stop_fetch_pools():
+    global _sync_pool
+    with _pools_lock:
+        pools = list(_message_pools.values()) + ([_sync_pool] if _sync_pool else [])
+        _message_pools.clear()
+        _sync_pool = None
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+def _get_gmail_service(mailbox: Mailbox | None = None):
+    """Authenticated Gmail service for the mailbox from its long-lived client (services/gmail_client.py)"""
+    return get_gmail_client(mailbox).service()
 
 
 def _decode_base64_safe(data: str) -> str:
@@ -99,191 +97,292 @@ def _decode_base64_safe(data: str) -> str:
         return ""
 
 
-def _extract_email_body(payload) -> str:
-    """Extract text body from Gmail message payload"""
-    body_parts = []
+def _extract_email_body(payload) -> tuple[str, bool]:
+    """Extract text body from Gmail message payload; returns (body, is_html)"""
+    plain_parts = []
+    html_parts = []
     
     def extract_text_parts(part):
         if part.get('mimeType') == 'text/plain':
             body_data = part.get('body', {}).get('data', '')
             if body_data:
-                body_parts.append(_decode_base64_safe(body_data))
+                plain_parts.append(_decode_base64_safe(body_data))
         elif part.get('mimeType') == 'text/html':
             # Fallback to HTML if no plain text
             body_data = part.get('body', {}).get('data', '')
-            if body_data and not body_parts:  # Only if no plain text found
-                body_parts.append(_decode_base64_safe(body_data))
+            if body_data:
+                html_parts.append(_decode_base64_safe(body_data))
         elif 'parts' in part:
             for subpart in part['parts']:
                 extract_text_parts(subpart)
     
     extract_text_parts(payload)
-    return '\n'.join(body_parts)[:10000]  # Limit body size
+    if plain_parts:
+        return '\n'.join(plain_parts)[:10000], False  # Limit body size
+    return '\n'.join(html_parts)[:10000], bool(html_parts)
 
 
-def fetch_from_gmail_inbox(limit: int | None = None, filter_category: str = "all") -> dict:
-    """Fetch real emails from Gmail inbox using Gmail API with advanced filtering"""
+def _search_query(filter_category: str) -> str | None:
+    """Gmail search for the category; None for an unknown category"""
+    if filter_category == "all":
+        # Search for any support-related emails from all categories
+        all_keywords = []
+        for category_keywords in FILTER_KEYWORDS.values():
+            all_keywords.extend(category_keywords[:2])  # Take first 2 keywords per category
+        query_parts = [f'subject:"{keyword}"' for keyword in all_keywords[:15]]  # Limit query length
+        return ' OR '.join(query_parts)
+    if filter_category in FILTER_KEYWORDS:
+        query_parts = [f'subject:"{keyword}"' for keyword in FILTER_KEYWORDS[filter_category]]
+        return ' OR '.join(query_parts)
+    return None
+
+
+def _retry_delay(error: Exception, attempt: int) -> tuple[str | None, float]:
+    """(reason, seconds) when the call should be retried, (None, 0) when not"""
+    from googleapiclient.errors import HttpError
+
+    if not isinstance(error, HttpError):
+        return None, 0.0
+    status = error.resp.status
+    content = error.content or b''
+    if status == 429 or (status == 403 and b'ateLimitExceeded' in content):
+        reason = 'rate_limit'
+    elif status >= 500:
+        reason = 'server_error'
+    else:
+        return None, 0.0
+    retry_after = error.resp.get('retry-after')
+    if retry_after and retry_after.isdigit():
+        return reason, float(retry_after)
+    # exponential backoff with jitter, as the Gmail API docs recommend
+    return reason, min(MAX_BACKOFF_SECONDS, 2 ** attempt) + random.random()
+
+
+def _execute(mailbox: Mailbox, call: str, request):
+    """Run a Gmail request within the mailbox's quota, retrying rate limits and server errors"""
+    retries = get_settings().gmail_max_retries
+    for attempt in range(retries + 1):
+        waited = acquire_quota(mailbox, call)
+        GMAIL_QUOTA_WAIT_SECONDS.observe(waited, mailbox=mailbox.name)
+        try:
+            with timed(GMAIL_SECONDS, call=call):
+                return request.execute()
+        except Exception as e:
+            reason, delay = _retry_delay(e, attempt)
+            if reason is None or attempt == retries:
+                raise
+            GMAIL_RETRIES.inc(mailbox=mailbox.name, reason=reason)
+            if reason == 'rate_limit':
+                # Gmail thinks this mailbox is over quota: hold back every call to it, not just this one
+                mailbox_bucket(mailbox).penalize(delay)
+            else:
+                time.sleep(delay)
+
+
+def _process_message(msg: dict, filter_category: str, mailbox: str) -> EmailRow | None:
+    """Analyse a full Gmail message; None when its subject does not match the filter"""
     settings = get_settings()
-    
-    service, error = _get_gmail_service()
+    payload = msg['payload']
+    headers = {h['name']: h['value'] for h in payload.get('headers', [])}
+
+    subject = headers.get('Subject', '').strip()
+    sender = headers.get('From', '').strip()
+    date_str = headers.get('Date', '')
+
+    # Double-check filter match (Gmail search might be broad)
+    if filter_category != "all":
+        category_keywords = FILTER_KEYWORDS.get(filter_category, [])
+        if not any(keyword.lower() in subject.lower() for keyword in category_keywords):
+            return None
+    else:
+        # For "all" filter, check if subject contains any support keywords
+        all_keywords = []
+        for cat_keywords in FILTER_KEYWORDS.values():
+            all_keywords.extend(cat_keywords)
+        if not any(keyword.lower() in subject.lower() for keyword in all_keywords):
+            return None
+
+    message_id = headers.get('Message-ID') or headers.get('Message-Id') or _hash_message_id(sender + subject)
+
+    # Extract body; analysis runs on the cleaned text, the raw body is kept for display
+    body, is_html = _extract_email_body(payload)
+    clean_body = normalize_body(body, is_html=is_html, max_chars=settings.clean_body_max_chars)
+
+    # Parse date
+    received_at = datetime.now(timezone.utc)
+    if date_str:
+        try:
+            from email.utils import parsedate_to_datetime
+            received_at = parsedate_to_datetime(date_str)
+            if received_at.tzinfo is None:
+                received_at = received_at.replace(tzinfo=timezone.utc)
+        except Exception:
+            pass
+
+    # Determine matched category for this email
+    matched_category = filter_category if filter_category != "all" else "general"
+    if filter_category == "all":
+        # Find best matching category
+        for cat, keywords in FILTER_KEYWORDS.items():
+            if any(keyword.lower() in subject.lower() for keyword in keywords):
+                matched_category = cat
+                break
+
+    # Analyze email using same simple analysis as CSV for consistency
+    from .nlp import simple_sentiment, urgency, extract_info
+    with timed(NLP_SECONDS):
+        sent = simple_sentiment(clean_body)
+        urg, reason = urgency(clean_body + ' ' + subject)
+        phones, emails, phrases = extract_info(clean_body)
+    priority_score = base_score(urg, sent, clean_body)
+
+    return EmailRow(
+        id='',
+        message_id=message_id,
+        thread_id=msg.get('threadId'),
+        in_reply_to=headers.get('In-Reply-To'),
+        references=tuple(headers.get('References', '').split()),
+        subject=subject,
+        sender=sender,
+        body=body,
+        clean_body=clean_body,
+        received_at=int(received_at.timestamp()),
+        sentiment=Sentiment(sent),
+        priority=Priority(urg),
+        priority_score=priority_score,
+        matched_category=Category(matched_category),
+        extraction=Extraction(tuple(phones), tuple(emails), tuple(phrases), reason),
+        status=Status.PENDING,
+        mailbox=mailbox,
+    )
+
+
+def fetch_mailbox(mailbox: Mailbox, limit: int = DEFAULT_FETCH_LIMIT, filter_category: str = "all") -> dict:
+    """Sync one mailbox: list new messages after its cursor, fetch them in parallel within its quota, store them"""
+    from googleapiclient.errors import HttpError
+
+    service, error = _get_gmail_service(mailbox)
     if error:
         return {"fetched": 0, "stored": 0, "reason": error}
-    
+    search_query = _search_query(filter_category)
+    if search_query is None:
+        return {"fetched": 0, "stored": 0, "reason": f"Invalid filter category: {filter_category}"}
+
+    cursors = get_cursors()
+    cursor = cursors.get(mailbox.name)
+    if cursor and not has_mailbox_emails(mailbox.name):
+        # the store was cleared (or not persisted) since the cursor was saved: list from the start
+        cursor = None
+    final_query = f'in:inbox ({search_query})'
+    if cursor:
+        final_query += f' after:{cursor - CURSOR_OVERLAP_SECONDS}'
+    print(f"[{mailbox.name}] Gmail Search Query: {final_query}")
+
     try:
-        # Build search query based on filter category
-        if filter_category == "all":
-            # Search for any support-related emails from all categories
-            all_keywords = []
-            for category_keywords in FILTER_KEYWORDS.values():
-                all_keywords.extend(category_keywords[:2])  # Take first 2 keywords per category
-            query_parts = [f'subject:"{keyword}"' for keyword in all_keywords[:15]]  # Limit query length
-            search_query = ' OR '.join(query_parts)
-        else:
-            # Search for specific category
-            if filter_category in FILTER_KEYWORDS:
-                category_keywords = FILTER_KEYWORDS[filter_category]
-                query_parts = [f'subject:"{keyword}"' for keyword in category_keywords]
-                search_query = ' OR '.join(query_parts)
-            else:
-                return {"fetched": 0, "stored": 0, "reason": f"Invalid filter category: {filter_category}"}
-        
-        # ULTRA FRESH MODE: Get emails from the last few minutes! 🔥
-        # Gmail's after: operator supports different formats, let's try the most recent
-        from datetime import datetime, timedelta
-        
-        # Get FRESH emails naturally - no timestamp restrictions!
-        # Just fetch emails in natural order (newest to oldest)
-        final_query = f'in:inbox ({search_query})'
-        
-        print(f"FETCHING EMAILS: Getting 50 emails naturally ordered newest to oldest")
-        
-        print(f"Gmail Search Query: {final_query}")
-        
-        # Get message IDs (Gmail naturally returns newest first, get 50)
-        results = service.users().messages().list(
-            userId='me',
-            q=final_query,
-            maxResults=50  # Get 50 emails naturally ordered
-        ).execute()
-        
-        messages = results.get('messages', [])
-        
-        if not messages:
-            return {"fetched": 0, "stored": 0, "reason": f"No emails found for filter: {filter_category}"}
-        
-        print(f"Found {len(messages)} emails, processing in natural order (newest first)")
-        
-        fetched = 0
-        stored = 0
-        
-        # Process each message in natural order (Gmail already sorts newest first)
-        for message in messages:
-            try:
-                # Get full message details
-                msg = service.users().messages().get(
-                    userId='me',
-                    id=message['id'],
-                    format='full'
-                ).execute()
-                
-                payload = msg['payload']
-                headers = {h['name']: h['value'] for h in payload.get('headers', [])}
-                
-                subject = headers.get('Subject', '').strip()
-                sender = headers.get('From', '').strip()
-                date_str = headers.get('Date', '')
-                
-                # Double-check filter match (Gmail search might be broad)
-                if filter_category != "all":
-                    category_keywords = FILTER_KEYWORDS.get(filter_category, [])
-                    if not any(keyword.lower() in subject.lower() for keyword in category_keywords):
-                        continue
-                else:
-                    # For "all" filter, check if subject contains any support keywords
-                    all_keywords = []
-                    for cat_keywords in FILTER_KEYWORDS.values():
-                        all_keywords.extend(cat_keywords)
-                    if not any(keyword.lower() in subject.lower() for keyword in all_keywords):
-                        continue
-                
-                # Extract message ID
-                message_id = headers.get('Message-ID') or _hash_message_id(sender + subject)
-                
-                # Extract body
-                body = _extract_email_body(payload)
-                
-                # Parse date
-                received_at = datetime.now(timezone.utc)
-                if date_str:
-                    try:
-                        from email.utils import parsedate_to_datetime
-                        received_at = parsedate_to_datetime(date_str)
-                        if received_at.tzinfo is None:
-                            received_at = received_at.replace(tzinfo=timezone.utc)
-                    except Exception:
-                        pass
-                
-                # Show email info without time restrictions
-                current_time = datetime.now(timezone.utc)
-                time_diff = current_time - received_at
-                print(f"Email found! From {received_at.strftime('%Y-%m-%d %H:%M:%S')} ({time_diff.total_seconds()//3600:.0f} hours ago)")
-                
-                fetched += 1
-                
-                # Determine matched category for this email
-                matched_category = filter_category if filter_category != "all" else "general"
-                if filter_category == "all":
-                    # Find best matching category
-                    for cat, keywords in FILTER_KEYWORDS.items():
-                        if any(keyword.lower() in subject.lower() for keyword in keywords):
-                            matched_category = cat
-                            break
-                
-                # Analyze email using same simple analysis as CSV for consistency
-                from .nlp import simple_sentiment, urgency, extract_info
-                sent = simple_sentiment(body)
-                urg, reason = urgency(body + ' ' + subject)
-                phones, emails, phrases = extract_info(body)
-                priority_score = (5 if urg == 'urgent' else 0) + (2 if sent == 'negative' else 0)
-                
-                # Create email data
-                email_data = {
-                    "message_id": message_id,
-                    "subject": subject,
-                    "sender": sender,
-                    "body": body,
-                    "received_at": received_at,
-                    "sentiment": sent,
-                    "priority": urg,
-                    "priority_score": priority_score,
-                    "matched_category": matched_category,
-                    "extraction": {
-                        "phones": phones,
-                        "emails": emails,
-                        "key_phrases": phrases,
-                        "sentiment": sent,
-                        "urgency_reason": reason
-                    },
-                    "status": "pending"
-                }
-                
-                # Store email directly (Gmail already gives us newest first)
-                if upsert_email(email_data):
-                    stored += 1
-                    print(f"Stored email from {received_at.strftime('%Y-%m-%d %H:%M:%S')}")
-                    
-            except Exception as e:
-                print(f"Error processing message {message.get('id', 'unknown')}: {e}")
-                continue
-        
-        return {
-            "fetched": fetched,
-            "stored": stored,
-            "filter_category": filter_category,
-            "reason": "success"
-        }
-        
+        # Gmail lists newest first; page until the limit or the end of the results
+        messages = []
+        page_token = None
+        while len(messages) < limit:
+            results = _execute(mailbox, 'list', service.users().messages().list(
+                userId=mailbox.user_id, q=final_query, maxResults=min(limit - len(messages), LIST_PAGE_SIZE),
+                pageToken=page_token,
+            ))
+            messages.extend(results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
     except HttpError as e:
         return {"fetched": 0, "stored": 0, "reason": f"Gmail API error: {e}"}
     except Exception as e:
         return {"fetched": 0, "stored": 0, "reason": f"Unexpected error: {e}"}
+
+    if not messages:
+        return {"fetched": 0, "stored": 0, "reason": f"No emails found for filter: {filter_category}"}
+    print(f"[{mailbox.name}] Found {len(messages)} emails")
+
+    def get(message: dict) -> tuple[int, EmailRow | None]:
+        # each thread has its own service (and HTTP connection)
+        thread_service, error = _get_gmail_service(mailbox)
+        if error:
+            raise RuntimeError(error)
+        msg = _execute(mailbox, 'get', thread_service.users().messages().get(
+            userId=mailbox.user_id, id=message['id'], format='full'))
+        internal_date = int(msg.get('internalDate') or 0) // 1000
+        return internal_date, _process_message(msg, filter_category, mailbox.name)
+
+    fetched = stored = deduped = failed = 0
+    newest = 0
+    pool = _message_pool(mailbox)
+    futures = {pool.submit(get, message): message for message in messages}
+    for future in as_completed(futures):
+        try:
+            internal_date, row = future.result()
+        except Exception as e:
+            failed += 1
+            EMAILS_FAILED.inc(stage='gmail_message')
+            print(f"[{mailbox.name}] Error processing message {futures[future].get('id', 'unknown')}: {e}")
+            continue
+        newest = max(newest, internal_date or (row.received_at if row else 0))
+        if row is None:
+            continue
+        with _store_lock:
+            if find_by_message_id(row.message_id):
+                deduped += 1
+                EMAILS_DEDUPED.inc(source='gmail')
+                continue
+            fetched += 1
+            EMAILS_FETCHED.inc(source='gmail')
+            if store_clustered([row]):
+                stored += 1
+                EMAILS_STORED.inc(source='gmail')
+
+    # Move the cursor only when everything up to it was seen: a listing cut short by the limit
+    # (after the first sync) or a failed message would otherwise be skipped for good
+    complete = page_token is None and not failed
+    if newest and (complete or cursor is None):
+        cursors.advance(mailbox.name, newest)
+    print(f"[{mailbox.name}] Stored {stored} new emails ({deduped} already stored)")
+    return {
+        "fetched": fetched,
+        "stored": stored,
+        "deduped": deduped,
+        "failed": failed,
+        "complete": complete,
+        "reason": "success",
+    }
+
+
+def fetch_from_gmail_inbox(limit: int | None = None, filter_category: str = "all",
+                           mailbox: str | None = None) -> dict:
+    """Fetch support emails from every registered mailbox (or just ``mailbox``) concurrently.
+
+    Each mailbox runs in its own worker with its own quota bucket, so total
+    throughput grows with the number of mailboxes while each stays under
+    Gmail's per-user limit.
+    """
+    if _search_query(filter_category) is None:
+        return {"fetched": 0, "stored": 0, "reason": f"Invalid filter category: {filter_category}"}
+    try:
+        mailboxes = load_mailboxes()
+    except Exception as e:
+        return {"fetched": 0, "stored": 0, "reason": f"Invalid mailbox registry: {e}"}
+    if mailbox is not None:
+        mailboxes = [m for m in mailboxes if m.name == mailbox]
+        if not mailboxes:
+            return {"fetched": 0, "stored": 0, "reason": f"Unknown mailbox: {mailbox}"}
+    limit = limit or DEFAULT_FETCH_LIMIT
+
+    pool = _mailbox_pool()
+    futures = {m.name: pool.submit(fetch_mailbox, m, limit, filter_category) for m in mailboxes}
+    results = {name: future.result() for name, future in futures.items()}
+
+    succeeded = [r for r in results.values() if r['reason'] == 'success']
+    return {
+        "fetched": sum(r['fetched'] for r in results.values()),
+        "stored": sum(r['stored'] for r in results.values()),
+        "deduped": sum(r.get('deduped', 0) for r in results.values()),
+        "filter_category": filter_category,
+        # one mailbox keeps the old single-account reasons; with several, success if any synced
+        "reason": "success" if succeeded else next(iter(results.values()))['reason'],
+        "mailboxes": results,
+    }
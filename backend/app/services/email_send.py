@@ -1,101 +1,382 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from concurrent.futures import ThreadPoolExecutor
 from ..config import get_settings
-from .store import get_email, mark_status
+from .store import (get_email, latest_open_draft, thread_members, latest_per_thread, transition_status,
+                    cluster_members, SENDABLE_STATUSES)
+from .records import EmailRow, Status
+from .outbox import get_outbox, idempotency_key
+from .llm import greeting_name, ticket_reference
+from .metrics import timed, SMTP_SECONDS, EMAILS_FAILED
 from datetime import datetime
+import os
+import re
+import socket
+import threading
+import time
+
+# Replies go through the durable outbox (services/outbox.py): enqueue, claim, send,
+# then mark sent. The email itself moves SENDABLE -> SENDING on enqueue and
+# SENDING -> RESPONDED once the outbox item is sent.
+
+# A cluster reply is drafted for its first email and sent to every member, so it
+# is first made sender-neutral: the first email's greeting name, address and
+# ticket reference become these placeholders, which are filled in per member.
+# Agents can also write the placeholders into a reviewed cluster draft themselves.
+NAME_FIELD = '{customer_name}'
+ADDRESS_FIELD = '{customer_email}'
+REFERENCE_FIELD = '{ticket_reference}'
+GREETING_WORDS = r"(?:dear|hi|hello|hey)"
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def neutral_draft(draft_content: str, source: EmailRow) -> str:
+    """The draft written for source, with what identifies its sender replaced by placeholders"""
+    name = re.escape(greeting_name(source))
+    draft_content = re.sub(rf"^({GREETING_WORDS}[ \t]+){name}(?!\w)", lambda m: m.group(1) + NAME_FIELD,
+                           draft_content, flags=re.IGNORECASE | re.MULTILINE)
+    if source.sender:
+        draft_content = draft_content.replace(source.sender, ADDRESS_FIELD)
+    return draft_content.replace(ticket_reference(source), REFERENCE_FIELD)
+
+
+def personalize(template: str, email_doc: EmailRow) -> str:
+    """A sender-neutral draft filled in for one recipient"""
+    return (template.replace(NAME_FIELD, greeting_name(email_doc))
+            .replace(ADDRESS_FIELD, email_doc.sender or '')
+            .replace(REFERENCE_FIELD, ticket_reference(email_doc)))
+
+
+def cluster_template(cluster_id: str, draft_content: str | None = None) -> str | None:
+    """Sender-neutral reply for a cluster: the given draft, or else the open draft of its first email"""
+    if draft_content is None:
+        response = latest_open_draft(cluster_id)
+        draft_content = response['draft'] if response else None
+    if not draft_content:
+        return None
+    source = get_email(cluster_id)
+    return neutral_draft(draft_content, source) if source else draft_content
+
+
+def _render(email_doc: EmailRow, draft_content: str, key: str) -> str:
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
+    settings = get_settings()
+    original_subject = email_doc.subject
+    msg = MIMEMultipart('alternative')
+    msg['From'] = settings.smtp_user
+    msg['To'] = email_doc.sender
+    msg['Subject'] = original_subject if original_subject.lower().startswith('re:') else f"Re: {original_subject}"
+    # Stable per (email, draft): if a crash forces a resend, receivers see the same message
+    domain = settings.smtp_user.split('@')[-1] if '@' in (settings.smtp_user or '') else 'localhost'
+    msg['Message-ID'] = f"<{key}@{domain}>"
+    # Thread the reply onto the customer's conversation
+    original_message_id = email_doc.message_id or ''
+    if original_message_id.startswith('<'):
+        msg['In-Reply-To'] = original_message_id
+        msg['References'] = ' '.join(list(email_doc.references or ()) + [original_message_id])
+    msg.attach(MIMEText(draft_content, 'plain', 'utf-8'))
+    return msg.as_string()
+
+
+class _SmtpSession:
+    """One authenticated connection, reused for every message a sending thread delivers"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.server = None
+
+    def _connect(self):
+        import smtplib
+        server = smtplib.SMTP(self.settings.smtp_host, self.settings.smtp_port)
+        if self.settings.smtp_starttls:
+            server.starttls()
+        server.login(self.settings.smtp_user, self.settings.smtp_password)
+        self.server = server
+
+    def send(self, recipient: str, message: str):
+        import smtplib
+        if self.server is None:
+            self._connect()
+            self.server.sendmail(self.settings.smtp_user, [recipient], message)
+            return
+        try:
+            self.server.sendmail(self.settings.smtp_user, [recipient], message)
+        except smtplib.SMTPServerDisconnected:
+            # the server closed an idle connection; nothing was sent, so reconnect once
+            self._connect()
+            self.server.sendmail(self.settings.smtp_user, [recipient], message)
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+def _permanent(error: Exception) -> bool:
+    """5xx replies (bad recipient, rejected content) will not succeed on retry"""
+    import smtplib
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+def _mark_responded(email_id: str):
+    # The reply answers every message in the conversation so far
+    responded_at = int(time.time())
+    transition_status(email_id, (Status.SENDING,) + SENDABLE_STATUSES, Status.RESPONDED,
+                      responded_at=responded_at, response_sent=True)
+    for member in thread_members(email_id):
+        if member.id != email_id:
+            transition_status(member.id, SENDABLE_STATUSES, Status.RESPONDED,
+                              responded_at=responded_at, response_sent=False)
+
+
+def _deliver(item: dict, session: _SmtpSession, worker: str) -> dict:
+    """Send a claimed outbox item and record the outcome"""
+    settings = get_settings()
+    outbox = get_outbox()
+    try:
+        with timed(SMTP_SECONDS):
+            session.send(item['recipient'], item['message'])
+    except Exception as e:
+        session.close()
+        EMAILS_FAILED.inc(stage='smtp')
+        final = _permanent(e) or item['attempts'] >= item['max_attempts']
+        retry_in = None if final else settings.outbox_retry_base_seconds * 2 ** (item['attempts'] - 1)
+        outbox.mark_failed(item['id'], worker, str(e), retry_in)
+        if final:
+            transition_status(item['email_id'], [Status.SENDING], item['previous_status'] or Status.PENDING)
+        return {
+            "success": False,
+            "error": f"Failed to send email: {str(e)}",
+            "outbox_id": item['id'],
+            "status": 'failed' if final else 'queued',
+            "attempts": item['attempts'],
+        }
+
+    outbox.mark_sent(item['id'], worker)
+    _mark_responded(item['email_id'])
+    return {
+        "success": True,
+        "message": f"Reply sent successfully to {item['recipient']}",
+        "sent_at": datetime.utcnow().isoformat(),
+        "outbox_id": item['id'],
+        "status": 'sent',
+    }
+
+
+def enqueue_reply(email_doc: EmailRow, draft_content: str) -> tuple[dict | None, bool]:
+    """Queue a reply; enqueueing the same (email, draft) again returns the existing item"""
+    key = idempotency_key(email_doc.id, draft_content)
+    item, created = get_outbox().enqueue(
+        key, email_doc.id, email_doc.sender, _render(email_doc, draft_content, key),
+        email_doc.status.value, get_settings().outbox_max_attempts,
+    )
+    if created:
+        transition_status(email_doc.id, SENDABLE_STATUSES, Status.SENDING)
+    return item, created
+
 
 def send_email_reply(email_id: str, draft_content: str) -> dict:
-    """Send email reply using SMTP and update email status"""
+    """Queue the reply in the outbox and try to deliver it right away"""
     settings = get_settings()
-    
+
     if not all([settings.smtp_host, settings.smtp_user, settings.smtp_password]):
         return {"success": False, "error": "SMTP credentials not configured"}
-    
+
     # Get original email details
     email_doc = get_email(email_id)
     if not email_doc:
         return {"success": False, "error": "Email not found"}
-    
-    sender_email = email_doc.get('sender', '')
-    original_subject = email_doc.get('subject', '')
-    
+    # SENDING belongs to the send that claimed it; queueing another would record 'sending' as the status to restore
+    if email_doc.status not in SENDABLE_STATUSES:
+        return {"success": False, "error": "Reply already sent or being sent"}
+
+    item, created = enqueue_reply(email_doc, draft_content)
+    if item is None:
+        return {"success": False, "error": "Reply already sent or being sent"}
+    if not created:
+        error = "Reply already sent" if item['status'] == 'sent' else "Reply already queued"
+        return {"success": False, "error": error, "outbox_id": item['id'], "status": item['status']}
+
+    worker = _worker_id()
+    claimed = get_outbox().claim(item['id'], worker)
+    if claimed is None:
+        # a background sender got to it first
+        return {"success": True, "message": "Reply queued for sending", "outbox_id": item['id'], "status": "queued"}
+    session = _SmtpSession()
     try:
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['From'] = settings.smtp_user
-        msg['To'] = sender_email
-        msg['Subject'] = f"Re: {original_subject}"
-        
-        # Add reply content
-        text_part = MIMEText(draft_content, 'plain', 'utf-8')
-        msg.attach(text_part)
-        
-        # Send via SMTP
-        server = smtplib.SMTP(settings.smtp_host, settings.smtp_port)
-        server.starttls()
-        server.login(settings.smtp_user, settings.smtp_password)
-        
-        server.send_message(msg)
-        server.quit()
-        
-        # Update email status to 'responded'
-        mark_status(email_id, 'responded')
-        
-        # Update with response timestamp
-        from .store import EMAILS
-        if email_id in EMAILS:
-            EMAILS[email_id]['responded_at'] = datetime.utcnow().isoformat()
-            EMAILS[email_id]['response_sent'] = True
-        
-        return {
-            "success": True, 
-            "message": f"Reply sent successfully to {sender_email}",
-            "sent_at": datetime.utcnow().isoformat()
-        }
-        
-    except Exception as e:
-        return {"success": False, "error": f"Failed to send email: {str(e)}"}
+        return _deliver(claimed, session, worker)
+    finally:
+        session.close()
+
+
+def drain_outbox(concurrency: int | None = None) -> dict:
+    """Send every due outbox item; each thread claims items one at a time over its own SMTP connection"""
+    settings = get_settings()
+    concurrency = concurrency or settings.outbox_concurrency
+    totals = {"sent": 0, "failed": 0, "errors": []}
+    lock = threading.Lock()
+
+    def drain():
+        worker = _worker_id()
+        session = _SmtpSession()
+        try:
+            while True:
+                item = get_outbox().claim_next(worker)
+                if item is None:
+                    return
+                result = _deliver(item, session, worker)
+                with lock:
+                    if result['success']:
+                        totals['sent'] += 1
+                    else:
+                        totals['failed'] += 1
+                        totals['errors'].append(f"{item['email_id']}: {result['error']}")
+        finally:
+            session.close()
+
+    if not all([settings.smtp_host, settings.smtp_user, settings.smtp_password]):
+        return {**totals, "reason": "SMTP credentials not configured"}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(drain) for _ in range(concurrency)]:
+            future.result()
+    return totals
 
 
 def send_bulk_replies(priority_filter: str = None) -> dict:
-    """Send replies to multiple emails based on priority"""
-    from .store import EMAILS
-    
-    sent_count = 0
-    failed_count = 0
-    errors = []
-    
-    for email_id, email_doc in EMAILS.items():
+    """Queue one reply per conversation (to its newest message) based on priority, then drain the outbox.
+
+    A near-duplicate without a draft of its own is sent its cluster's draft,
+    personalized for it, since only the first email of a cluster is pre-drafted.
+    """
+    settings = get_settings()
+    if not all([settings.smtp_host, settings.smtp_user, settings.smtp_password]):
+        return {"sent": 0, "failed": 0, "queued": 0, "errors": ["SMTP credentials not configured"]}
+
+    queued = 0
+    # cluster id -> sender-neutral draft, looked up once per cluster
+    templates: dict = {}
+    for email_doc in latest_per_thread():
+        email_id = email_doc.id
         # Skip if already responded
-        if email_doc.get('status') == 'responded':
+        if email_doc.status not in SENDABLE_STATUSES:
             continue
-            
+
         # Filter by priority if specified
-        if priority_filter and email_doc.get('priority') != priority_filter:
+        if priority_filter and email_doc.priority.value != priority_filter:
             continue
-            
+
         # Check if draft exists
-        from .store import RESPONSES
-        draft = None
-        for response in RESPONSES.values():
-            if response['email_id'] == email_id and not response.get('final', False):
-                draft = response['draft']
-                break
-                
+        response = latest_open_draft(email_id)
+        draft = response['draft'] if response else None
+        if not draft and email_doc.cluster_id and email_doc.cluster_id != email_id:
+            if email_doc.cluster_id not in templates:
+                templates[email_doc.cluster_id] = cluster_template(email_doc.cluster_id)
+            template = templates[email_doc.cluster_id]
+            draft = personalize(template, email_doc) if template else None
+
         if not draft:
             continue
-            
-        # Send reply
-        result = send_email_reply(email_id, draft)
-        if result['success']:
-            sent_count += 1
+
+        item, created = enqueue_reply(email_doc, draft)
+        if created:
+            queued += 1
+
+    result = drain_outbox()
+    return {
+        "sent": result['sent'],
+        "failed": result['failed'],
+        "queued": queued,
+        "errors": result['errors']
+    }
+
+
+def send_cluster_reply(cluster_id: str, draft_content: str | None = None) -> dict:
+    """Queue one reply per near-duplicate in the cluster, then drain the outbox.
+
+    The draft defaults to the open draft of the cluster's first email, so a
+    reviewed draft answers every member. Each member gets its own message,
+    threaded onto its own conversation and addressed by its own name and
+    ticket reference (see neutral_draft).
+    """
+    settings = get_settings()
+    if not all([settings.smtp_host, settings.smtp_user, settings.smtp_password]):
+        return {"sent": 0, "failed": 0, "queued": 0, "skipped": 0, "errors": ["SMTP credentials not configured"]}
+    members = cluster_members(cluster_id)
+    if not members:
+        return {"sent": 0, "failed": 0, "queued": 0, "skipped": 0, "errors": ["Cluster not found"]}
+    template = cluster_template(cluster_id, draft_content)
+    if not template:
+        return {"sent": 0, "failed": 0, "queued": 0, "skipped": 0, "errors": ["No draft for this cluster"]}
+
+    queued = skipped = 0
+    for email_doc in members:
+        if email_doc.status not in SENDABLE_STATUSES:
+            skipped += 1
+            continue
+        item, created = enqueue_reply(email_doc, personalize(template, email_doc))
+        if created:
+            queued += 1
         else:
-            failed_count += 1
-            errors.append(f"{email_id}: {result['error']}")
-    
+            skipped += 1
+
+    result = drain_outbox()
     return {
-        "sent": sent_count,
-        "failed": failed_count,
-        "errors": errors
+        "sent": result['sent'],
+        "failed": result['failed'],
+        "queued": queued,
+        "skipped": skipped,
+        "errors": result['errors']
     }
+
+
+class OutboxWorker:
+    """Background sender: requeues expired claims and drains due items every poll interval"""
+
+    def __init__(self, poll_seconds: float, lease_seconds: float):
+        self.poll = poll_seconds
+        self.lease = lease_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _run(self):
+        while not self._stop.wait(self.poll):
+            try:
+                recovered = get_outbox().recover_stale(self.lease)
+                if recovered:
+                    print(f"Outbox: requeued {recovered} sends whose worker stopped mid-send")
+                drain_outbox()
+            except Exception as e:
+                print(f"Outbox drain failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+_worker: OutboxWorker | None = None
+
+
+def start_outbox_worker(poll_seconds: float, lease_seconds: float):
+    global _worker
+    _worker = OutboxWorker(poll_seconds, lease_seconds)
+    _worker.start()
+
+
+def stop_outbox_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
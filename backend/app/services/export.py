@@ -0,0 +1,283 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import zlib
+from ..config import get_settings
+from . import store
+from .records import EmailRow, Status, Priority, Sentiment, Category, to_epoch, to_iso
+
+# Bulk export of emails, their extractions and drafts, shared by GET /emails/export
+# and the CLI at the bottom (python -m app.services.export).
+#
+# Everything is a generator: the store hands over EXPORT_BATCH_SIZE emails at a
+# time (keyset pages on SQLite; bodies of restored emails are read without being
+# kept), each batch is encoded and compressed, and the bytes are yielded before
+# the next batch is read. Memory stays at one batch whatever the export size.
+# Parquet writes one row group per batch.
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+COMPRESSIONS = {'gzip': ('application/gzip', 'gz'), 'zstd': ('application/zstd', 'zst')}
+
+Draft = Dict[str, Any] | None
+
+
+def _field(name: str) -> Callable[[EmailRow, Draft], Any]:
+    return lambda row, draft: getattr(row, name)
+
+
+def _enum(name: str) -> Callable[[EmailRow, Draft], Any]:
+    def get(row: EmailRow, draft: Draft):
+        value = getattr(row, name)
+        return value.value if value is not None else None
+    return get
+
+
+def _extraction(name: str) -> Callable[[EmailRow, Draft], Any]:
+    def get(row: EmailRow, draft: Draft):
+        value = getattr(row.extraction, name) if row.extraction else None
+        return list(value) if isinstance(value, tuple) else value
+    return get
+
+
+def _draft(key: str) -> Callable[[EmailRow, Draft], Any]:
+    return lambda row, draft: draft.get(key) if draft else None
+
+
+# column -> (type, getter); types are str, float, bool, time (epoch seconds) and list (of strings)
+COLUMNS: Dict[str, Tuple[str, Callable[[EmailRow, Draft], Any]]] = {
+    'id': ('str', _field('id')),
+    'message_id': ('str', _field('message_id')),
+    'sender': ('str', _field('sender')),
+    'subject': ('str', _field('subject')),
+    'received_at': ('time', _field('received_at')),
+    'body': ('str', _field('body')),
+    'clean_body': ('str', _field('clean_body')),
+    'sentiment': ('str', _enum('sentiment')),
+    'priority': ('str', _enum('priority')),
+    'priority_score': ('float', _field('priority_score')),
+    'matched_category': ('str', _enum('matched_category')),
+    'status': ('str', _enum('status')),
+    'thread_key': ('str', _field('thread_key')),
+    'thread_id': ('str', _field('thread_id')),
+    'in_reply_to': ('str', _field('in_reply_to')),
+    'references': ('list', lambda row, draft: list(row.references or ())),
+    'responded_at': ('time', _field('responded_at')),
+    'response_sent': ('bool', _field('response_sent')),
+    'mailbox': ('str', _field('mailbox')),
+    'cluster_id': ('str', _field('cluster_id')),
+    'phones': ('list', _extraction('phones')),
+    'emails': ('list', _extraction('emails')),
+    'key_phrases': ('list', _extraction('key_phrases')),
+    'urgency_reason': ('str', _extraction('urgency_reason')),
+    'draft': ('str', _draft('draft')),
+    'draft_model': ('str', _draft('model')),
+    'draft_created_at': ('str', _draft('created_at')),
+}
+DRAFT_COLUMNS = {'draft', 'draft_model', 'draft_created_at'}
+# EmailRow fields that can be filtered on, with their value types
+FILTERS = {'status': Status, 'priority': Priority, 'sentiment': Sentiment, 'matched_category': Category,
+           'mailbox': str}
+
+
+def parse_request(fmt: str, columns: str | None, compression: str | None, since: str | None = None,
+                  until: str | None = None, **filters: str | None) -> Dict[str, Any]:
+    """Validate export options (as strings, from the query or the command line); {"error": ...} if invalid"""
+    fmt = (fmt or 'csv').lower()
+    if fmt not in FORMATS:
+        return {"error": f"format must be one of: {', '.join(FORMATS)}"}
+    compression = (compression or '').lower() or None
+    if compression is not None and compression not in COMPRESSIONS:
+        return {"error": f"compression must be one of: {', '.join(COMPRESSIONS)}"}
+    if fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        return {"error": "Parquet export needs pyarrow (pip install pyarrow)"}
+    if compression == 'zstd' and fmt != 'parquet' and importlib.util.find_spec('zstandard') is None:
+        return {"error": "zstd compression needs zstandard (pip install zstandard)"}
+    names = [c.strip() for c in columns.split(',') if c.strip()] if columns else list(COLUMNS)
+    unknown = [name for name in names if name not in COLUMNS]
+    if unknown:
+        return {"error": f"unknown columns: {', '.join(unknown)}"}
+    where: Dict[str, Any] = {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        kind = FILTERS.get(name)
+        if kind is None:
+            return {"error": f"cannot filter on {name}"}
+        if kind is not str and value not in kind._value2member_map_:
+            return {"error": f"{name} must be one of: {', '.join(kind._value2member_map_)}"}
+        where[name] = kind(value)
+    bounds = {'since': since, 'until': until}
+    for name, value in bounds.items():
+        if value is not None:
+            bounds[name] = to_epoch(value)
+            if bounds[name] is None:
+                return {"error": "'from' and 'to' must be ISO-8601 timestamps"}
+    media_type, extension = FORMATS[fmt]
+    if compression and fmt != 'parquet':
+        # Parquet compresses its pages itself; the other formats are wrapped whole
+        media_type = COMPRESSIONS[compression][0]
+        extension += '.' + COMPRESSIONS[compression][1]
+    return {'format': fmt, 'columns': names, 'compression': compression, 'filters': where, **bounds,
+            'media_type': media_type, 'filename': f"emails.{extension}"}
+
+
+def _batches(plan: Dict[str, Any]) -> Iterator[Tuple[List[EmailRow], Dict[str, Dict[str, Any]]]]:
+    with_drafts = not DRAFT_COLUMNS.isdisjoint(plan['columns'])
+    for rows in store.iter_emails(plan['filters'], plan['since'], plan['until'], get_settings().export_batch_size):
+        drafts = store.latest_open_drafts([row.id for row in rows]) if with_drafts else {}
+        yield rows, drafts
+
+
+def _columns(plan: Dict[str, Any], rows: List[EmailRow], drafts: Dict[str, Dict[str, Any]]) -> Dict[str, list]:
+    """Column name -> values for one batch"""
+    return {
+        name: [COLUMNS[name][1](row, drafts.get(row.id)) for row in rows]
+        for name in plan['columns']
+    }
+
+
+def _text_value(kind: str, value: Any, for_csv: bool) -> Any:
+    if value is None:
+        return None
+    if kind == 'time':
+        return to_iso(value)
+    if kind == 'list' and for_csv:
+        return json.dumps(value)
+    return value
+
+
+def _csv_chunks(plan: Dict[str, Any]) -> Iterator[bytes]:
+    kinds = [COLUMNS[name][0] for name in plan['columns']]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(plan['columns'])
+    yield buffer.getvalue().encode('utf-8')
+    for rows, drafts in _batches(plan):
+        buffer.seek(0)
+        buffer.truncate()
+        columns = _columns(plan, rows, drafts)
+        for values in zip(*columns.values()):
+            writer.writerow([_text_value(kind, value, True) for kind, value in zip(kinds, values)])
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(plan: Dict[str, Any]) -> Iterator[bytes]:
+    names = plan['columns']
+    kinds = [COLUMNS[name][0] for name in names]
+    for rows, drafts in _batches(plan):
+        columns = _columns(plan, rows, drafts)
+        lines = [
+            json.dumps({name: _text_value(kind, value, False) for name, kind, value in zip(names, kinds, values)})
+            for values in zip(*columns.values())
+        ]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _Chunks:
+    """Write-only file that hands what was written back to the generator, so Parquet streams too"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _parquet_chunks(plan: Dict[str, Any]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {'str': pa.string(), 'float': pa.float64(), 'bool': pa.bool_(),
+             'time': pa.timestamp('s', tz='UTC'), 'list': pa.list_(pa.string())}
+    schema = pa.schema([(name, types[COLUMNS[name][0]]) for name in plan['columns']])
+    sink = _Chunks()
+    writer = pq.ParquetWriter(sink, schema, compression=plan['compression'] or 'snappy')
+    try:
+        for rows, drafts in _batches(plan):
+            writer.write_table(pa.Table.from_pydict(_columns(plan, rows, drafts), schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def _compress(chunks: Iterable[bytes], compression: str | None) -> Iterator[bytes]:
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif compression == 'zstd':
+        import zstandard
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        yield from chunks
+        return
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(plan: Dict[str, Any]) -> Iterator[bytes]:
+    """The export file as a stream of byte chunks, for a plan returned by parse_request"""
+    if plan['format'] == 'parquet':
+        return _parquet_chunks(plan)
+    chunks = _csv_chunks(plan) if plan['format'] == 'csv' else _ndjson_chunks(plan)
+    return _compress(chunks, plan['compression'])
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Export emails, extractions and drafts from the configured store")
+    parser.add_argument('--format', default='csv', choices=list(FORMATS))
+    parser.add_argument('--output', required=True, help="file to write")
+    parser.add_argument('--columns', help=f"comma-separated subset of: {', '.join(COLUMNS)}")
+    parser.add_argument('--compression', choices=list(COMPRESSIONS))
+    parser.add_argument('--from', dest='since', help="received at or after (ISO-8601)")
+    parser.add_argument('--to', dest='until', help="received before (ISO-8601)")
+    for name in FILTERS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+    args = parser.parse_args(argv)
+    plan = parse_request(args.format, args.columns, args.compression, args.since, args.until,
+                         **{name: getattr(args, name) for name in FILTERS})
+    if 'error' in plan:
+        parser.error(plan['error'])
+    settings = get_settings()
+    if settings.store_backend == 'memory':
+        # a private copy of the API's in-memory store, read from its snapshot; nothing is written back
+        from .snapshot import SnapshotManager
+        SnapshotManager(settings.snapshot_dir, settings.snapshot_interval_seconds).restore()
+    written = 0
+    with open(args.output, 'wb') as f:
+        for chunk in export_chunks(plan):
+            f.write(chunk)
+            written += len(chunk)
+    print(f"Wrote {written} bytes to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
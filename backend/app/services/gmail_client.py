@@ -0,0 +1,218 @@
+from __future__ import annotations
+from typing import Any, Dict, Tuple
+from datetime import datetime, timedelta
+from pathlib import Path
+import json
+import threading
+from .mailboxes import Mailbox, load_mailboxes
+from .metrics import timed, GMAIL_SECONDS
+
+# Long-lived Gmail API client. Credentials are loaded once, the service is built
+# from the discovery document bundled with google-api-python-client (parsed once,
+# never fetched), and each thread keeps its own AuthorizedHttp so its TLS
+# connection is reused across polls (httplib2 connections are not thread-safe).
+# A background thread refreshes the OAuth token before it expires, so requests
+# never wait on the token endpoint. There is one client per registered mailbox
+# (services/mailboxes.py), each with its own token file.
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+# refresh this long before the access token expires
+REFRESH_MARGIN = timedelta(minutes=5)
+# how often the refresher wakes up when the expiry is unknown or far away
+REFRESH_CHECK_SECONDS = 60.0
+HTTP_TIMEOUT_SECONDS = 30
+
+
+def _load_credentials(token_path: str, credentials_path: str) -> Tuple[Any, str | None]:
+    """Token file first, then the interactive OAuth flow from credentials.json"""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    creds = None
+    if Path(token_path).exists():
+        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+    if creds and creds.valid:
+        return creds, None
+
+    if creds and creds.expired and creds.refresh_token:
+        creds.refresh(Request())
+    else:
+        if not Path(credentials_path).exists():
+            return None, "Gmail credentials.json file not found. Please download it from Google Cloud Console."
+
+        # Check if it's the correct type of credentials
+        try:
+            with open(credentials_path, 'r') as f:
+                cred_data = json.load(f)
+
+            # Check if it's a service account (wrong type)
+            if cred_data.get('type') == 'service_account':
+                return None, "Invalid credentials: Service Account detected. Gmail API requires Desktop Application credentials for personal email access."
+
+            # Check if it has the correct structure for installed app
+            if 'installed' not in cred_data and 'web' not in cred_data:
+                return None, "Invalid credentials: Must be OAuth2 Desktop Application credentials, not Service Account."
+
+        except Exception as e:
+            return None, f"Error reading credentials file: {e}"
+
+        try:
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
+            creds = flow.run_local_server(port=0)
+        except Exception as e:
+            return None, f"OAuth2 flow failed: {e}"
+
+    error = _save_token(creds, token_path)
+    return (None, error) if error else (creds, None)
+
+
+def _save_token(creds, token_path: str) -> str | None:
+    try:
+        with open(token_path, 'w') as token:
+            token.write(creds.to_json())
+    except Exception as e:
+        return f"Failed to save token: {e}"
+    return None
+
+
+class GmailClient:
+    """Thread-safe holder for one mailbox's Gmail credentials and per-thread services"""
+
+    def __init__(self, mailbox: Mailbox):
+        self.mailbox = mailbox
+        self.token_path = mailbox.token_path or "token.json"
+        self.credentials_path = mailbox.credentials_path or "credentials.json"
+        self.creds = None
+        self._document: dict | None = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _ensure_credentials(self) -> str | None:
+        if self.creds is not None:
+            return None
+        with self._lock:
+            if self.creds is not None:
+                return None
+            creds, error = _load_credentials(self.token_path, self.credentials_path)
+            if error:
+                return error
+            from googleapiclient.discovery_cache import get_static_doc
+            self._document = json.loads(get_static_doc('gmail', 'v1'))
+            self.creds = creds
+        self.start()
+        return None
+
+    def service(self) -> Tuple[Any, str | None]:
+        """(service, None) or (None, error); builds nothing after the first call on a thread"""
+        try:
+            error = self._ensure_credentials()
+        except Exception as e:
+            return None, f"Failed to load Gmail credentials: {e}"
+        if error:
+            return None, error
+        if not self.creds.valid:
+            # the background refresher is not running or fell behind
+            try:
+                self.refresh()
+            except Exception as e:
+                return None, f"Gmail token refresh failed: {e}"
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            try:
+                service = self._local.service = self._build()
+            except Exception as e:
+                return None, f"Failed to build Gmail service: {str(e)}"
+        return service, None
+
+    def _build(self):
+        import google_auth_httplib2
+        import httplib2
+        from googleapiclient.discovery import build_from_document
+
+        http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+        return build_from_document(self._document, http=http)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Refresh the access token if it is expired or about to be; returns True if refreshed"""
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            creds = self.creds
+            if creds is None or not creds.refresh_token:
+                return False
+            if not force and creds.valid and creds.expiry and creds.expiry - datetime.utcnow() > REFRESH_MARGIN:
+                return False
+            with timed(GMAIL_SECONDS, call='refresh'):
+                creds.refresh(Request())
+            error = _save_token(creds, self.token_path)
+            if error:
+                print(f"{self.mailbox.name}: {error}")
+            return True
+
+    def _seconds_until_refresh(self) -> float:
+        expiry = self.creds.expiry if self.creds else None
+        if expiry is None:
+            return REFRESH_CHECK_SECONDS
+        due = (expiry - REFRESH_MARGIN - datetime.utcnow()).total_seconds()
+        return max(1.0, min(REFRESH_CHECK_SECONDS, due))
+
+    def _run(self):
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Gmail token refresh failed for {self.mailbox.name}: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=f'gmail-token-refresh-{self.mailbox.name}',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+_clients: Dict[str, GmailClient] = {}
+_client_lock = threading.Lock()
+
+
+def get_gmail_client(mailbox: Mailbox | None = None) -> GmailClient:
+    """The long-lived client for ``mailbox`` (the first registered one when omitted)"""
+    if mailbox is None:
+        mailbox = load_mailboxes()[0]
+    client = _clients.get(mailbox.name)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(mailbox.name)
+            if client is None:
+                client = _clients[mailbox.name] = GmailClient(mailbox)
+    return client
+
+
+def start_gmail_client() -> str | None:
+    """Load credentials (which starts the token refreshers); called from the lifespan when Gmail is configured"""
+    errors = []
+    for mailbox in load_mailboxes():
+        if not Path(mailbox.token_path or "token.json").exists():
+            # first authorisation is interactive; leave it to the first fetch
+            errors.append(f"{mailbox.name}: no Gmail token yet")
+            continue
+        _, error = get_gmail_client(mailbox).service()
+        if error:
+            errors.append(f"{mailbox.name}: {error}")
+    return '; '.join(errors) or None
+
+
+def stop_gmail_client():
+    with _client_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.stop()
@@ -0,0 +1,338 @@
+from __future__ import annotations
+from typing import Iterator, TYPE_CHECKING
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+import asyncio
+import json
+import queue
+import re
+import threading
+import time
+from ..config import get_settings
+
+if TYPE_CHECKING:
+    from .records import EmailRow
+
+
+class DraftModelError(Exception):
+    """Raised when a draft model cannot produce a draft (timeout, HTTP error, open circuit)"""
+
+
+class DraftModel(ABC):
+    """Interface for anything that turns a prompt into a reply draft"""
+    name = 'base'
+
+    @abstractmethod
+    def generate(self, prompt: str, email: 'EmailRow') -> str:
+        ...
+
+    def stream(self, prompt: str, email: 'EmailRow') -> Iterator[str]:
+        """Yield the draft in pieces; models without native streaming yield word by word"""
+        yield from re.findall(r"\S+\s*", self.generate(prompt, email))
+
+
+def greeting_name(email: 'EmailRow') -> str:
+    """The name a draft greets the sender by"""
+    return (email.sender or 'valued customer').split('@')[0]
+
+
+def ticket_reference(email: 'EmailRow') -> str:
+    return f"#SP-{email.id[:8].upper()}"
+
+
+class StubDraftModel(DraftModel):
+    """Deterministic rule-based drafts for tests and offline use (no network, same input -> same text)"""
+    name = 'empathetic-ai'
+
+    def generate(self, prompt: str, email: 'EmailRow') -> str:
+        # Enhanced empathetic response generation
+        customer = greeting_name(email)
+        subject = email.subject
+        sentiment = email.sentiment.value
+        priority = email.priority.value
+        key_phrases = list(email.extraction.key_phrases) if email.extraction else []
+
+        # Opening based on sentiment and urgency
+        if sentiment == 'negative' or priority == 'urgent':
+            if 'cannot' in subject.lower() or 'unable' in subject.lower() or 'down' in subject.lower():
+                opening = f"Dear {customer},\n\nI sincerely apologize for the inconvenience you're experiencing. I understand how frustrating it must be when you're unable to access our services, and I want to assure you that resolving this issue is my top priority."
+            elif 'billing' in subject.lower() or 'charged' in subject.lower():
+                opening = f"Dear {customer},\n\nThank you for bringing this billing concern to our attention. I understand how concerning unexpected charges can be, and I want to personally ensure we resolve this matter quickly and to your satisfaction."
+            else:
+                opening = f"Dear {customer},\n\nI understand your concern and truly appreciate you taking the time to reach out to us. Your experience matters greatly to us, and I'm here to help resolve this issue promptly."
+        else:
+            opening = f"Dear {customer},\n\nThank you for contacting our support team. I'm delighted to assist you with your inquiry today."
+
+        # Main content based on key phrases and subject
+        main_content = ""
+        if any(phrase in ['login', 'access', 'password', 'account'] for phrase in key_phrases):
+            main_content = "I've reviewed your account access issue and will prioritize getting you back into your account immediately. Our technical team has identified several effective solutions for login-related concerns.\n\nTo expedite the resolution process, I'll be sending you a secure password reset link within the next few minutes. Please check both your inbox and spam folder. If you continue to experience difficulties, I'm also available for a brief phone call to walk you through the process step-by-step."
+        elif any(phrase in ['billing', 'charged', 'payment', 'refund'] for phrase in key_phrases):
+            main_content = "I've immediately escalated your billing inquiry to our specialized billing department for review. We take billing accuracy very seriously and will conduct a thorough investigation of your account charges.\n\nYou can expect a detailed breakdown of all charges along with any necessary corrections within 24 hours. If a refund is warranted, we'll process it immediately and provide you with a reference number for tracking."
+        elif any(phrase in ['integration', 'api', 'third-party'] for phrase in key_phrases):
+            main_content = "I'm excited to help you explore our integration capabilities! Our platform supports extensive third-party integrations, including comprehensive CRM connectivity.\n\nI'll be sending you our detailed integration guide along with API documentation within the next hour. Our technical team can also schedule a personalized demo to show you exactly how our integrations can streamline your workflow and enhance your business operations."
+        elif any(phrase in ['pricing', 'subscription', 'plan'] for phrase in key_phrases):
+            main_content = "I'd be happy to provide you with comprehensive pricing information tailored to your specific needs. Our flexible subscription plans are designed to grow with your business.\n\nI'll prepare a customized pricing breakdown that includes all available features and any current promotional offers. Additionally, I can arrange a consultation with our solutions specialist to ensure you select the perfect plan for your requirements."
+        else:
+            main_content = f"I've carefully reviewed your inquiry regarding {', '.join(key_phrases[:3]) if key_phrases else 'your request'} and want to provide you with the most comprehensive assistance possible.\n\nOur team is committed to delivering exceptional service, and I'll personally ensure your needs are met. I'll be following up with detailed information and next steps within the next few hours."
+
+        # Closing based on urgency
+        if priority == 'urgent':
+            closing = "Given the urgent nature of your request, I'm treating this with the highest priority. You can expect an update from me within the next 2 hours, and I'll remain available throughout the resolution process.\n\nIf you need immediate assistance, please don't hesitate to call our priority support line, and mention ticket reference " + ticket_reference(email) + ".\n\nWarm regards,\nCustomer Success Team\nAI Communication Assistant"
+        else:
+            closing = "I'm committed to ensuring your complete satisfaction with our resolution. You can expect a follow-up from me within 24 hours with either a complete solution or a detailed progress update.\n\nPlease don't hesitate to reach out if you have any additional questions or concerns in the meantime.\n\nBest regards,\nCustomer Success Team\nAI Communication Assistant\n\nP.S. Your feedback helps us improve our service. We'd love to hear about your experience once we've resolved your inquiry."
+
+        draft = f"{opening}\n\n{main_content}\n\n{closing}"
+        return draft
+
+
+class CircuitBreaker:
+    """Stop calling a failing backend for ``reset_seconds`` after ``failure_threshold`` consecutive errors"""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'half_open':
+                # let one trial call through; it re-opens the circuit if it fails
+                self.opened_at = time.monotonic()
+                return True
+            return state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class _LoopThread:
+    """Private asyncio loop on a daemon thread so sync callers can share one pooled async client"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='draft-model-loop', daemon=True)
+        self._thread.start()
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+class _MicroBatcher:
+    """Collect prompts that arrive within ``window`` seconds and dispatch them together.
+
+    Identical prompts in a batch share one upstream call, and at most
+    ``max_concurrency`` calls are in flight over the pooled connection.
+    """
+
+    def __init__(self, send_one, window: float, max_batch: int, max_concurrency: int):
+        self._send_one = send_one
+        self._window = window
+        self._max_batch = max_batch
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, prompt: str) -> str:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((prompt, fut))
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        grouped: dict[str, list[asyncio.Future]] = {}
+        for prompt, fut in batch:
+            grouped.setdefault(prompt, []).append(fut)
+        for prompt, futs in grouped.items():
+            task = asyncio.ensure_future(self._dispatch(prompt, futs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, prompt: str, futs: list[asyncio.Future]):
+        try:
+            async with self._semaphore:
+                text = await self._send_one(prompt)
+        except Exception as e:
+            for fut in futs:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for fut in futs:
+            if not fut.done():
+                fut.set_result(text)
+
+
+class GeminiDraftModel(DraftModel):
+    """Gemini REST backend: pooled async HTTP, micro-batching, per-call timeout and a circuit breaker"""
+
+    BASE_URL = 'https://generativelanguage.googleapis.com/v1beta/models'
+
+    def __init__(self, api_key: str, model: str, temperature: float, timeout: float,
+                 max_concurrency: int, batch_window_ms: int, max_batch: int,
+                 breaker: CircuitBreaker):
+        self.name = f'gemini:{model}'
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker
+        self._runner = _LoopThread()
+        self._client = None
+        # the batcher owns loop-bound primitives, so build it on the loop thread
+        self._batcher = self._runner.submit(self._make_batcher(batch_window_ms / 1000.0, max_batch)).result()
+
+    async def _make_batcher(self, window: float, max_batch: int) -> _MicroBatcher:
+        return _MicroBatcher(self._call, window, max_batch, self.max_concurrency)
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+        return self._client
+
+    def _payload(self, prompt: str) -> dict:
+        return {
+            'contents': [{'parts': [{'text': prompt}]}],
+            'generationConfig': {'temperature': self.temperature},
+        }
+
+    @staticmethod
+    def _text_of(data: dict) -> str:
+        candidates = data.get('candidates') or []
+        if not candidates:
+            return ''
+        parts = candidates[0].get('content', {}).get('parts', [])
+        return ''.join(p.get('text', '') for p in parts)
+
+    async def _call(self, prompt: str) -> str:
+        resp = await self._http().post(
+            f"{self.BASE_URL}/{self.model}:generateContent",
+            headers={'x-goog-api-key': self.api_key},
+            json=self._payload(prompt),
+        )
+        resp.raise_for_status()
+        text = self._text_of(resp.json())
+        if not text:
+            raise DraftModelError('empty response from Gemini')
+        return text
+
+    async def _generate(self, prompt: str) -> str:
+        if not self.breaker.allow():
+            raise DraftModelError('Gemini circuit open')
+        try:
+            text = await asyncio.wait_for(self._batcher.submit(prompt), self.timeout)
+        except Exception as e:
+            self.breaker.record_failure()
+            raise DraftModelError(f'Gemini request failed: {e}') from e
+        self.breaker.record_success()
+        return text
+
+    def generate(self, prompt: str, email: 'EmailRow') -> str:
+        return self._runner.submit(self._generate(prompt)).result()
+
+    async def _stream_into(self, prompt: str, out: queue.Queue):
+        if not self.breaker.allow():
+            out.put(DraftModelError('Gemini circuit open'))
+            return
+        try:
+            async with self._http().stream(
+                'POST',
+                f"{self.BASE_URL}/{self.model}:streamGenerateContent",
+                params={'alt': 'sse'},
+                headers={'x-goog-api-key': self.api_key},
+                json=self._payload(prompt),
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if line.startswith('data:'):
+                        chunk = self._text_of(json.loads(line[5:]))
+                        if chunk:
+                            out.put(chunk)
+        except Exception as e:
+            self.breaker.record_failure()
+            out.put(DraftModelError(f'Gemini stream failed: {e}'))
+            return
+        self.breaker.record_success()
+        out.put(None)
+
+    def stream(self, prompt: str, email: 'EmailRow') -> Iterator[str]:
+        out: queue.Queue = queue.Queue()
+        self._runner.submit(self._stream_into(prompt, out))
+        while True:
+            try:
+                item = out.get(timeout=self.timeout)
+            except queue.Empty:
+                raise DraftModelError('Gemini stream timed out')
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+_model: DraftModel | None = None
+_model_lock = threading.Lock()
+_stub = StubDraftModel()
+
+
+def get_fallback_model() -> DraftModel:
+    return _stub
+
+
+def get_draft_model() -> DraftModel:
+    """Model selected by ``DRAFT_MODEL``: 'stub', 'gemini', or 'auto' (Gemini when a key is set)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                settings = get_settings()
+                choice = settings.draft_model
+                if choice == 'auto':
+                    choice = 'gemini' if settings.gemini_api_key else 'stub'
+                if choice == 'gemini' and settings.gemini_api_key:
+                    _model = GeminiDraftModel(
+                        api_key=settings.gemini_api_key,
+                        model=settings.gemini_model,
+                        temperature=settings.response_temperature,
+                        timeout=settings.llm_timeout_seconds,
+                        max_concurrency=settings.llm_max_concurrency,
+                        batch_window_ms=settings.llm_batch_window_ms,
+                        max_batch=settings.llm_max_batch,
+                        breaker=CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset_seconds),
+                    )
+                else:
+                    _model = _stub
+    return _model
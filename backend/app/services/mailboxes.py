@@ -0,0 +1,166 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+import json
+import os
+import threading
+import time
+from ..config import get_settings
+
+# Mailbox registry. Each mailbox has its own OAuth token, sync cursor and Gmail
+# quota budget. The registry is a JSON list at MAILBOXES_PATH, for example
+#   [{"name": "support", "token_path": "tokens/support.json"},
+#    {"name": "billing", "token_path": "tokens/billing.json", "quota_units_per_second": 100}]
+# Without it there is one "default" mailbox built from GMAIL_TOKEN_PATH and
+# GMAIL_CREDENTIALS_PATH, which is how the single-account setup keeps working.
+#
+# Gmail meters every user (mailbox) separately, in quota units per second
+# (messages.list and messages.get cost 5 units each), and the whole project per
+# minute. Calls take units from the mailbox's token bucket and then from one
+# project-wide bucket; both hand out units in arrival order, so no mailbox can
+# starve the others when the project budget is the limit.
+
+DEFAULT_MAILBOX = 'default'
+# quota units per Gmail API call (https://developers.google.com/gmail/api/reference/quota)
+QUOTA_UNITS = {'list': 5, 'get': 5}
+# a new sync lists from a little before the cursor: Gmail's after: is coarse, dedupe drops repeats
+CURSOR_OVERLAP_SECONDS = 60
+
+
+@dataclass(slots=True)
+class Mailbox:
+    name: str
+    user_id: str = 'me'
+    token_path: str | None = None
+    credentials_path: str | None = None
+    quota_units_per_second: float | None = None
+    burst_units: float | None = None
+
+
+class TokenBucket:
+    """Units refill at ``rate`` per second up to ``capacity``; acquire() blocks until its units are available.
+
+    Callers reserve units in the order they arrive (the level may go negative
+    and the caller sleeps off its debt), which makes waiting first-come
+    first-served. penalize() empties the bucket for a while after a 429.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, units: float) -> float:
+        """Take ``units``; returns the seconds spent waiting"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._level -= units
+            wait = -self._level / self.rate if self._level < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self, seconds: float):
+        """Hold every caller back for ``seconds``, on top of what is already reserved"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self._level, 0.0) - seconds * self.rate
+
+
+def load_mailboxes() -> List[Mailbox]:
+    settings = get_settings()
+    path = settings.mailboxes_path
+    if not path or not Path(path).exists():
+        return [Mailbox(DEFAULT_MAILBOX, token_path=settings.gmail_token_path,
+                        credentials_path=settings.gmail_credentials_path)]
+    entries = json.loads(Path(path).read_text(encoding='utf-8'))
+    mailboxes = [Mailbox(**entry) for entry in entries]
+    names = [m.name for m in mailboxes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"duplicate mailbox names in {path}")
+    return mailboxes
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_project_bucket: TokenBucket | None = None
+_buckets_lock = threading.Lock()
+
+
+def mailbox_bucket(mailbox: Mailbox) -> TokenBucket:
+    """The mailbox's bucket, kept across fetches since the quota is per second, not per fetch"""
+    with _buckets_lock:
+        bucket = _buckets.get(mailbox.name)
+        if bucket is None:
+            settings = get_settings()
+            quota = mailbox.quota_units_per_second or settings.gmail_quota_units_per_second
+            burst = min(mailbox.burst_units or settings.gmail_burst_units, quota / 2)
+            # refill at quota - burst, so no one-second window can spend more than the quota
+            bucket = _buckets[mailbox.name] = TokenBucket(quota - burst, burst)
+        return bucket
+
+
+def project_bucket() -> TokenBucket:
+    global _project_bucket
+    with _buckets_lock:
+        if _project_bucket is None:
+            quota = get_settings().gmail_project_quota_units_per_second
+            _project_bucket = TokenBucket(quota, quota)
+        return _project_bucket
+
+
+def acquire_quota(mailbox: Mailbox, call: str) -> float:
+    """Block until ``call`` fits the mailbox's and the project's budgets; returns seconds waited"""
+    units = QUOTA_UNITS[call]
+    return mailbox_bucket(mailbox).acquire(units) + project_bucket().acquire(units)
+
+
+class CursorStore:
+    """Newest Gmail internal date (epoch seconds) synced per mailbox, persisted as JSON"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            self._cursors: Dict[str, int] = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self._cursors = {}
+
+    def get(self, name: str) -> int | None:
+        return self._cursors.get(name)
+
+    def all(self) -> Dict[str, int]:
+        return dict(self._cursors)
+
+    def advance(self, name: str, epoch: int):
+        with self._lock:
+            if epoch <= self._cursors.get(name, 0):
+                return
+            self._cursors[name] = epoch
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self._cursors), encoding='utf-8')
+            os.replace(tmp, self.path)
+
+    def reset(self):
+        with self._lock:
+            self._cursors = {}
+            self.path.unlink(missing_ok=True)
+
+
+_cursors: CursorStore | None = None
+
+
+def get_cursors() -> CursorStore:
+    global _cursors
+    with _buckets_lock:
+        if _cursors is None:
+            _cursors = CursorStore(get_settings().mailbox_state_path)
+        return _cursors
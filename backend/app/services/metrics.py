@@ -0,0 +1,216 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Tuple
+from functools import wraps
+import bisect
+import threading
+import time
+
+# Prometheus text exposition without the client library: counters, gauges
+# read at scrape time, and histograms with fixed buckets. Set ENABLED to
+# False (METRICS_ENABLED=false) and every observe/inc/timed call returns
+# after a single flag check.
+ENABLED = True
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+_REGISTRY: List['_Metric'] = []
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not ENABLED or not amount:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value computed when /metrics is scraped, so the hot path pays nothing"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(self.labelnames, labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s[0]), s[1]) for k, s in self._series.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class timed:
+    """Record elapsed seconds into a histogram, as a context manager or a decorator.
+
+        with timed(SMTP_SECONDS):
+            ...
+
+        @timed(NLP_SECONDS)
+        def analyze(...): ...
+    """
+    __slots__ = ('histogram', 'labels', '_started')
+
+    def __init__(self, histogram: Histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self._started = 0.0
+
+    def __enter__(self):
+        if ENABLED:
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if ENABLED and self._started:
+            self.histogram.observe(time.perf_counter() - self._started, **self.labels)
+        return False
+
+    def __call__(self, fn):
+        histogram, labels = self.histogram, self.labels
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text format"""
+    return '\n'.join(metric.render() for metric in _REGISTRY) + '\n'
+
+
+def _store_size() -> int:
+    from .store import count_emails
+    return count_emails()
+
+
+def _pending_depth() -> int:
+    from .store import count_pending_without_draft
+    return count_pending_without_draft()
+
+
+def _outbox_depth() -> int:
+    from .outbox import get_outbox
+    return get_outbox().counts()['queued']
+
+
+GMAIL_SECONDS = Histogram('gmail_request_seconds', 'Gmail API call latency', ('call',))
+NLP_SECONDS = Histogram('nlp_analysis_seconds', 'Sentiment, urgency and extraction time per email',
+                        buckets=FAST_BUCKETS)
+DRAFT_SECONDS = Histogram('draft_generation_seconds', 'Time to produce a reply draft', ('model', 'cached'))
+SMTP_SECONDS = Histogram('smtp_send_seconds', 'SMTP connect, login and send time')
+GMAIL_QUOTA_WAIT_SECONDS = Histogram('gmail_quota_wait_seconds', 'Time a Gmail call waited for quota units',
+                                     ('mailbox',))
+
+EMAILS_FETCHED = Counter('emails_fetched_total', 'Messages fetched from a source that passed the filters', ('source',))
+EMAILS_STORED = Counter('emails_stored_total', 'Emails written to the store', ('source',))
+EMAILS_DEDUPED = Counter('emails_deduped_total', 'Messages skipped because they were already stored', ('source',))
+EMAILS_CLUSTERED = Counter('emails_clustered_total', 'Emails that joined a near-duplicate cluster at ingest')
+EMAILS_FAILED = Counter('emails_failed_total', 'Items that failed to process', ('stage',))
+GMAIL_RETRIES = Counter('gmail_retries_total', 'Gmail calls retried after a rate limit or server error',
+                        ('mailbox', 'reason'))
+
+STORE_SIZE = Gauge('email_store_size', 'Emails held in the store', _store_size)
+PENDING_DEPTH = Gauge('pending_queue_depth', 'Unanswered conversations without an open draft', _pending_depth)
+OUTBOX_DEPTH = Gauge('outbox_queued', 'Replies queued in the outbox and not yet sent', _outbox_depth)
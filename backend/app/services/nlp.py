@@ -1,5 +1,6 @@
 import re
 from .store import EMAILS
+from .scoring import base_score
 
 URGENT_KEYWORDS = ["immediately", "urgent", "cannot access", "critical", "asap", "down", "failure"]
 SENTIMENT_POS = {"great", "thanks", "thank you", "appreciate", "good", "love"}
@@ -46,12 +47,7 @@ def analyze_email(subject: str, body: str, sender: str) -> dict:
     urgency_label, reason = urgency(body)
     phones, emails, key_phrases = extract_info(body)
     
-    priority_score = 0.0
-    if urgency_label == 'urgent':
-        priority_score += 5
-    if sent == 'negative':
-        priority_score += 2
-    priority_score += max(0, 1 - (len(body) / 5000))  # slight boost for shorter emails
+    priority_score = base_score(urgency_label, sent, body)
 
     # Determine categories based on content
     categories = []
@@ -0,0 +1,111 @@
+from __future__ import annotations
+from html.parser import HTMLParser
+import html
+import re
+
+QUOTE_START_REGEX = re.compile(
+    r"^\s*(>|On .{1,200} wrote:\s*$|-+\s*Original Message\s*-+|From: .+ Sent: )", re.IGNORECASE
+)
+SIGNATURE_DELIMITER_REGEX = re.compile(r"^\s*--\s*$")
+MOBILE_FOOTER_REGEX = re.compile(r"^\s*(Sent from my |Get Outlook for )", re.IGNORECASE)
+# the whole line, alone: "Thanks," or "Kind regards" but not "Thanks for the quick reply"
+SIGN_OFF_REGEX = re.compile(
+    r"[ \t]*((best|kind|warm|many)[ \t]+)?(regards|thanks|thank you|cheers|sincerely|best)[ \t]*[,.!]?[ \t]*",
+    re.IGNORECASE,
+)
+# A sign-off only counts as the start of a signature this close to the end, and when
+# every line after it looks like a signature (a name, title or phone, not a sentence)
+SIGN_OFF_MAX_TAIL_LINES = 6
+SIGNATURE_LINE_MAX_CHARS = 60
+# a start tag, end tag, comment or doctype; "a < b", "<3" and "<ann@example.com>" are not markup
+HTML_TAG_REGEX = re.compile(r"<(/?[a-z][a-z0-9]*(\s[^<>]*)?/?|!--.*?--|!doctype[^<>]*)>", re.IGNORECASE | re.DOTALL)
+
+BLOCK_TAGS = {'p', 'div', 'br', 'tr', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'table'}
+SKIP_TAGS = {'script', 'style', 'head', 'title'}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip = 0
+        self._quote = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag == 'blockquote':
+            # quoted history in HTML mail lives in blockquotes; it is dropped like '>' lines
+            self._quote += 1
+        if tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag == 'blockquote' and self._quote:
+            self._quote -= 1
+        if tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip and not self._quote:
+            self.parts.append(data)
+
+
+def looks_like_html(text: str) -> bool:
+    return HTML_TAG_REGEX.search(text) is not None
+
+
+def _signature_line(line: str) -> bool:
+    line = line.strip()
+    return len(line) <= SIGNATURE_LINE_MAX_CHARS and not line.endswith(('.', '?', '!', ':'))
+
+
+def html_to_text(markup: str) -> str:
+    parser = _TextExtractor()
+    try:
+        parser.feed(markup)
+        parser.close()
+    except Exception:
+        # malformed markup: fall back to stripping tags
+        return html.unescape(re.sub(r"<[^>]+>", " ", markup))
+    return ''.join(parser.parts)
+
+
+def strip_quoted(text: str) -> str:
+    """Drop the quoted history of a reply chain (``>`` lines and everything after an "On ... wrote:" line)"""
+    kept = []
+    for line in text.splitlines():
+        if QUOTE_START_REGEX.match(line):
+            if not line.lstrip().startswith('>'):
+                break
+            continue
+        kept.append(line)
+    return '\n'.join(kept)
+
+
+def strip_signature(text: str) -> str:
+    """Cut a trailing signature: a ``--`` delimiter, mobile footers, or a sign-off near the end"""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if SIGNATURE_DELIMITER_REGEX.match(line) or MOBILE_FOOTER_REGEX.match(line):
+            lines = lines[:i]
+            break
+    while lines and not lines[-1].strip():
+        lines.pop()
+    for i in range(max(0, len(lines) - SIGN_OFF_MAX_TAIL_LINES), len(lines)):
+        if i > 0 and SIGN_OFF_REGEX.fullmatch(lines[i]) and all(map(_signature_line, lines[i + 1:])):
+            lines = lines[:i]
+            break
+    return '\n'.join(lines)
+
+
+def normalize_body(raw: str, is_html: bool = False, max_chars: int = 5000) -> str:
+    """Text that analysis and drafting should see: no markup, quoted thread or signature, size capped"""
+    text = html_to_text(raw) if is_html else raw
+    text = text.replace('\r\n', '\n').replace('\xa0', ' ')
+    text = strip_signature(strip_quoted(text))
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text).strip()
+    return text[:max_chars]
@@ -0,0 +1,191 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+from pathlib import Path
+import hashlib
+import sqlite3
+import threading
+import time
+from ..config import get_settings
+from .sqlite_store import _transaction
+
+# Durable send queue: one SQLite (WAL) file shared by every worker process, used
+# with either store backend. An item is the fully rendered message, keyed by an
+# idempotency key per (email, draft); enqueueing the same pair twice returns the
+# existing item. Items move queued -> sending -> sent | failed. Claims are single
+# UPDATE statements, so two workers never hold the same item, and a claim that
+# outlives its lease (the worker died mid-send) goes back to queued.
+STATUSES = ('queued', 'sending', 'sent', 'failed')
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS outbox (
+        id TEXT PRIMARY KEY,
+        email_id TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        message TEXT NOT NULL,
+        status TEXT NOT NULL,
+        previous_status TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        next_attempt_at REAL NOT NULL,
+        claimed_by TEXT,
+        claimed_at REAL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        sent_at REAL
+    )""",
+    # one reply per email: a second draft cannot be queued while one is pending or sent
+    "CREATE UNIQUE INDEX IF NOT EXISTS outbox_one_per_email ON outbox (email_id)"
+    " WHERE status IN ('queued', 'sending', 'sent')",
+    "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)",
+]
+
+ITEM_FIELDS = ['id', 'email_id', 'recipient', 'message', 'status', 'previous_status', 'attempts',
+               'max_attempts', 'last_error']
+ITEM_COLUMNS = ', '.join(ITEM_FIELDS)
+INSERT_ITEM = """
+    INSERT INTO outbox (id, email_id, recipient, message, status, previous_status, max_attempts,
+                        next_attempt_at, created_at)
+    VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)
+"""
+REQUEUE_FAILED = """
+    UPDATE outbox SET status = 'queued', attempts = 0, last_error = NULL, next_attempt_at = ?
+    WHERE id = ? AND status = 'failed'
+"""
+CLAIM_NEXT = f"""
+    UPDATE outbox SET status = 'sending', attempts = attempts + 1, claimed_by = ?, claimed_at = ?
+    WHERE id = (
+        SELECT id FROM outbox WHERE status = 'queued' AND next_attempt_at <= ?
+        ORDER BY next_attempt_at LIMIT 1
+    )
+    RETURNING {ITEM_COLUMNS}
+"""
+CLAIM_ONE = f"""
+    UPDATE outbox SET status = 'sending', attempts = attempts + 1, claimed_by = ?, claimed_at = ?
+    WHERE id = ? AND status = 'queued'
+    RETURNING {ITEM_COLUMNS}
+"""
+# completions are fenced on claimed_by: a worker whose lease expired cannot overwrite the new owner
+MARK_SENT = """
+    UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL
+    WHERE id = ? AND status = 'sending' AND claimed_by = ?
+"""
+MARK_RETRY = """
+    UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ?, claimed_by = NULL
+    WHERE id = ? AND status = 'sending' AND claimed_by = ?
+"""
+RECOVER_STALE = """
+    UPDATE outbox SET status = 'queued', claimed_by = NULL
+    WHERE status = 'sending' AND claimed_at < ?
+"""
+
+
+def idempotency_key(email_id: str, draft: str) -> str:
+    return hashlib.sha256(f"{email_id}\0{draft}".encode('utf-8')).hexdigest()[:32]
+
+
+def _item(values: tuple) -> Dict[str, Any]:
+    return dict(zip(ITEM_FIELDS, values))
+
+
+class Outbox:
+    def __init__(self, path: str, busy_timeout_seconds: float = 30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout_seconds
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        with _transaction(conn):
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # a lost "sent" mark means a resend after a crash, so sync every commit
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, key: str, email_id: str, recipient: str, message: str, previous_status: str,
+                max_attempts: int) -> tuple[Dict[str, Any] | None, bool]:
+        """Returns (item, created). item is None when another draft for this email is already queued or sent."""
+        conn = self._conn()
+        now = time.time()
+        with _transaction(conn):
+            existing = conn.execute(f"SELECT {ITEM_COLUMNS} FROM outbox WHERE id = ?", (key,)).fetchone()
+            if existing is not None:
+                item = _item(existing)
+                if item['status'] != 'failed':
+                    return item, False
+                # the same reply was given up on earlier; queue it again from scratch
+                try:
+                    conn.execute(REQUEUE_FAILED, (now, key))
+                except sqlite3.IntegrityError:
+                    return None, False
+                return {**item, 'status': 'queued', 'attempts': 0, 'last_error': None}, True
+            try:
+                conn.execute(INSERT_ITEM, (key, email_id, recipient, message, previous_status,
+                                           max_attempts, now, now))
+            except sqlite3.IntegrityError:
+                return None, False
+        return self.get(key), True
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        found = self._conn().execute(f"SELECT {ITEM_COLUMNS} FROM outbox WHERE id = ?", (key,)).fetchone()
+        return _item(found) if found else None
+
+    def claim_next(self, worker: str) -> Dict[str, Any] | None:
+        now = time.time()
+        found = self._conn().execute(CLAIM_NEXT, (worker, now, now)).fetchall()
+        return _item(found[0]) if found else None
+
+    def claim(self, key: str, worker: str) -> Dict[str, Any] | None:
+        found = self._conn().execute(CLAIM_ONE, (worker, time.time(), key)).fetchall()
+        return _item(found[0]) if found else None
+
+    def mark_sent(self, key: str, worker: str) -> bool:
+        return self._conn().execute(MARK_SENT, (time.time(), key, worker)).rowcount == 1
+
+    def mark_failed(self, key: str, worker: str, error: str, retry_in: float | None) -> bool:
+        """Back to queued after ``retry_in`` seconds, or failed for good when it is None"""
+        status = 'failed' if retry_in is None else 'queued'
+        next_attempt = time.time() + (retry_in or 0)
+        return self._conn().execute(MARK_RETRY, (status, next_attempt, error[:500], key, worker)).rowcount == 1
+
+    def recover_stale(self, lease_seconds: float) -> int:
+        return self._conn().execute(RECOVER_STALE, (time.time() - lease_seconds,)).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        counts = {status: 0 for status in STATUSES}
+        for status, count in self._conn().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def list_items(self, status: str | None = None, limit: int = 100) -> List[Dict[str, Any]]:
+        sql = ("SELECT id, email_id, recipient, status, attempts, max_attempts, last_error, created_at, sent_at"
+               " FROM outbox")
+        params: list = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        names = ['id', 'email_id', 'recipient', 'status', 'attempts', 'max_attempts', 'last_error',
+                 'created_at', 'sent_at']
+        return [dict(zip(names, row)) for row in self._conn().execute(sql, params)]
+
+
+_outbox: Outbox | None = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox(get_settings().outbox_path)
+    return _outbox
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from ..config import get_settings
+from .store import list_pending_without_draft
+from .response import generate_draft
+from .metrics import EMAILS_FAILED
+
+# Only one pre-drafting pass at a time; later triggers are dropped while one runs
+_RUN_LOCK = threading.Lock()
+
+
+def predraft_pending(limit: int | None = None, batch_size: int | None = None,
+                     concurrency: int | None = None) -> dict:
+    """Generate drafts for pending emails in priority order so they are ready before an agent asks"""
+    settings = get_settings()
+    limit = limit if limit is not None else settings.predraft_limit
+    batch_size = batch_size or settings.predraft_batch_size
+    concurrency = concurrency or settings.predraft_concurrency
+
+    if not _RUN_LOCK.acquire(blocking=False):
+        return {"drafted": 0, "failed": 0, "reason": "pre-drafting already running"}
+    try:
+        queue = [e.id for e in list_pending_without_draft(limit=limit)]
+        drafted = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for start in range(0, len(queue), batch_size):
+                for draft in pool.map(_safe_draft, queue[start:start + batch_size]):
+                    if draft:
+                        drafted += 1
+                    else:
+                        failed += 1
+        return {"drafted": drafted, "failed": failed, "reason": "success"}
+    finally:
+        _RUN_LOCK.release()
+
+
+def _safe_draft(email_id: str):
+    try:
+        return generate_draft(email_id)
+    except Exception as e:
+        EMAILS_FAILED.inc(stage='predraft')
+        print(f"Pre-draft failed for {email_id}: {e}")
+        return None
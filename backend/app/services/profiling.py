@@ -0,0 +1,192 @@
+from __future__ import annotations
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List
+from pathlib import Path
+import cProfile
+import itertools
+import marshal
+import random
+import sys
+import threading
+import time
+from ..config import get_settings
+
+PROFILE_HEADER = 'x-profile'
+_APP_DIR = str(Path(__file__).resolve().parents[1])
+
+
+@dataclass
+class RequestProfile:
+    id: int
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    started_at: float
+    mode: str
+    forced: bool
+    # marshalled cProfile stats (the pstats file format) or collapsed stack lines
+    data: bytes = field(repr=False, default=b'')
+
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'duration_ms': round(self.duration_ms, 1),
+            'started_at': self.started_at,
+            'mode': self.mode,
+            'forced': self.forced,
+            'format': 'pstats' if self.mode == 'cprofile' else 'collapsed',
+        }
+
+
+class ProfileRing:
+    """The last N captured profiles; older ones fall off the end"""
+
+    def __init__(self, size: int):
+        self._profiles: Deque[RequestProfile] = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[RequestProfile]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: int) -> RequestProfile | None:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+
+class StackSampler:
+    """Samples every thread's stack at a fixed interval and counts collapsed stacks.
+
+    Only stacks that pass through application code are kept, so idle pool
+    threads and the event loop's select() do not drown the flamegraph. Unlike
+    cProfile this also sees sync endpoints running in the threadpool, but
+    concurrent requests end up in the same profile.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(_APP_DIR)
+                    names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if in_app:
+                    self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> bytes:
+        self._stop.set()
+        self._thread.join()
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode('utf-8')
+
+
+_ring: ProfileRing | None = None
+# cProfile hooks the whole thread, so only one request is profiled at a time in that mode
+_CPROFILE_LOCK = threading.Lock()
+
+
+def get_ring() -> ProfileRing:
+    global _ring
+    if _ring is None:
+        _ring = ProfileRing(get_settings().profiling_max_profiles)
+    return _ring
+
+
+def _should_profile(headers: Dict[str, str]) -> tuple[bool, bool]:
+    """(profile this request, forced by header); never either unless PROFILING_ENABLED is on"""
+    settings = get_settings()
+    if not settings.profiling_enabled:
+        return False, False
+    if settings.profiling_allow_header and headers.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes'):
+        return True, True
+    if random.random() < settings.profiling_sample_rate:
+        return True, False
+    return False, False
+
+
+async def profile_request(request, call_next):
+    """HTTP middleware body: profile sampled requests and keep the slow ones.
+
+    Requests forced with ``X-Profile: 1`` are kept whatever their latency.
+    ``cprofile`` mode profiles the event loop thread, so it sees async
+    endpoints but not plain ``def`` ones such as load_inbox and send_bulk,
+    which FastAPI runs in its threadpool; ``sample`` mode samples stacks
+    across all threads and sees both.
+    """
+    wanted, forced = _should_profile(request.headers)
+    if not wanted:
+        return await call_next(request)
+    settings = get_settings()
+    mode = settings.profiling_mode
+    profiler = None
+    sampler = None
+    if mode == 'cprofile':
+        if not _CPROFILE_LOCK.acquire(blocking=False):
+            return await call_next(request)
+        profiler = cProfile.Profile()
+    else:
+        sampler = StackSampler(settings.profiling_sample_interval_ms / 1000)
+
+    started_at = time.time()
+    started = time.perf_counter()
+    status = 500
+    try:
+        if profiler:
+            profiler.enable()
+        else:
+            sampler.start()
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        if profiler:
+            profiler.disable()
+            _CPROFILE_LOCK.release()
+            data = b''
+        else:
+            data = sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        if forced or duration_ms >= settings.profiling_threshold_ms:
+            if profiler:
+                profiler.create_stats()
+                data = marshal.dumps(profiler.stats)
+            ring = get_ring()
+            ring.add(RequestProfile(
+                id=ring.next_id(),
+                method=request.method,
+                path=request.url.path,
+                status=status,
+                duration_ms=duration_ms,
+                started_at=started_at,
+                mode=mode,
+                forced=forced,
+                data=data,
+            ))
+            print(f"Profiled {request.method} {request.url.path}: {duration_ms:.0f} ms ({mode})")
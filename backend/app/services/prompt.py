@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+import math
+import re
+from .normalize import strip_quoted
+from .records import EmailRow, Extraction
+
+# Rough BPE approximation: one token per ~4 characters of a word, one per punctuation mark
+TOKEN_REGEX = re.compile(r"\w+|[^\w\s]")
+
+MAX_LIST_ITEMS = 5
+MIN_PARTIAL_CHUNK_TOKENS = 32
+NO_CONTEXT = "(no knowledge base context)"
+
+
+def _token_cost(piece: str) -> int:
+    return max(1, math.ceil(len(piece) / 4)) if piece[0].isalnum() or piece[0] == '_' else 1
+
+
+def count_tokens(text: str) -> int:
+    """Fast local token estimate, close enough to budget LLM calls without a real tokenizer"""
+    return sum(_token_cost(m.group()) for m in TOKEN_REGEX.finditer(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of ``text`` that fits in ``max_tokens``"""
+    if max_tokens <= 0:
+        return ''
+    used = 0
+    for m in TOKEN_REGEX.finditer(text):
+        used += _token_cost(m.group())
+        if used > max_tokens:
+            return text[:m.start()].rstrip()
+    return text
+
+
+def _tail_tokens(text: str, max_tokens: int) -> str:
+    """Longest suffix of ``text`` that fits in ``max_tokens``"""
+    if max_tokens <= 0:
+        return ''
+    matches = list(TOKEN_REGEX.finditer(text))
+    used = 0
+    for m in reversed(matches):
+        used += _token_cost(m.group())
+        if used > max_tokens:
+            return text[m.end():].lstrip()
+    return text
+
+
+def fit_body(body: str, max_tokens: int) -> tuple[str, bool]:
+    """Fit the email body into the budget: drop quoted thread first, then keep head and tail"""
+    if count_tokens(body) <= max_tokens:
+        return body, False
+    body = strip_quoted(body).strip()
+    total = count_tokens(body)
+    if total <= max_tokens:
+        return body, True
+    marker = f"\n[... {total - max_tokens} tokens omitted ...]\n"
+    room = max(0, max_tokens - count_tokens(marker))
+    head_budget = room * 2 // 3
+    return truncate_tokens(body, head_budget) + marker + _tail_tokens(body, room - head_budget), True
+
+
+def fit_context(chunks: List[Dict[str, Any]], max_tokens: int) -> tuple[str, int]:
+    """Pack the best-scoring chunks into the budget; returns the text and how many chunks were used"""
+    parts = []
+    remaining = max_tokens
+    for chunk in sorted(chunks, key=lambda c: c.get('score', 0), reverse=True):
+        text = chunk.get('text', '').strip()
+        if not text:
+            continue
+        cost = count_tokens(text)
+        if cost <= remaining:
+            parts.append(text)
+            remaining -= cost
+        elif remaining >= MIN_PARTIAL_CHUNK_TOKENS:
+            parts.append(truncate_tokens(text, remaining - count_tokens(' ...')) + ' ...')
+            remaining = 0
+        if remaining < MIN_PARTIAL_CHUNK_TOKENS:
+            break
+    return ('\n---\n'.join(parts) if parts else NO_CONTEXT), len(parts)
+
+
+def build_prompt(template: str, email: EmailRow, chunks: List[Dict[str, Any]],
+                 budget: int, body_share: float = 0.6) -> Dict[str, Any]:
+    """Fill ``template`` so the whole prompt stays within ``budget`` tokens.
+
+    Instructions and metadata are always kept; the body gets up to
+    ``body_share`` of what is left and retrieved context gets the rest,
+    including anything the body did not use.
+    """
+    extraction = email.extraction or Extraction()
+    fields = {
+        'subject': email.subject,
+        'sentiment': email.sentiment.value,
+        'priority': email.priority.value,
+        'phones': list(extraction.phones[:MAX_LIST_ITEMS]),
+        'emails': list(extraction.emails[:MAX_LIST_ITEMS]),
+        'phrases': list(extraction.key_phrases[:MAX_LIST_ITEMS]),
+    }
+    instructions_tokens = count_tokens(template.format(**{k: '' for k in fields}, body='', context=''))
+    metadata_tokens = sum(count_tokens(str(v)) for v in fields.values())
+    available = max(0, budget - instructions_tokens - metadata_tokens)
+
+    raw_body = email.clean_body or email.body or ''
+    body, body_truncated = fit_body(raw_body, int(available * body_share))
+    body_tokens = count_tokens(body)
+    context, chunks_used = fit_context(chunks, available - body_tokens)
+    context_tokens = count_tokens(context)
+
+    return {
+        'prompt': template.format(**fields, body=body, context=context),
+        'tokens': {
+            'instructions': instructions_tokens,
+            'metadata': metadata_tokens,
+            'body': body_tokens,
+            'context': context_tokens,
+            'total': instructions_tokens + metadata_tokens + body_tokens + context_tokens,
+        },
+        'budget': budget,
+        'body_truncated': body_truncated,
+        'context_chunks': {'used': chunks_used, 'available': len(chunks)},
+    }
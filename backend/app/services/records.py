@@ -0,0 +1,198 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Dict, Tuple
+
+
+class Status(str, Enum):
+    NEW = 'new'
+    PENDING = 'pending'
+    PROCESSED = 'processed'
+    SENDING = 'sending'
+    RESPONDED = 'responded'
+
+
+class Priority(str, Enum):
+    URGENT = 'urgent'
+    NOT_URGENT = 'not_urgent'
+
+
+class Sentiment(str, Enum):
+    POSITIVE = 'positive'
+    NEUTRAL = 'neutral'
+    NEGATIVE = 'negative'
+
+
+class Category(str, Enum):
+    SUPPORT = 'support'
+    QUERY = 'query'
+    REQUEST = 'request'
+    URGENT = 'urgent'
+    HELP = 'help'
+    BILLING = 'billing'
+    TECHNICAL = 'technical'
+    ACCOUNT = 'account'
+    GENERAL = 'general'
+
+    @classmethod
+    def _missing_(cls, value):
+        return cls.GENERAL
+
+
+def to_epoch(value: Any) -> int | None:
+    """Epoch seconds from an ISO string, datetime or number; naive values are taken as UTC"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return None
+
+
+def to_iso(ts: int | None) -> str | None:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+@dataclass(slots=True)
+class Extraction:
+    phones: Tuple[str, ...] = ()
+    emails: Tuple[str, ...] = ()
+    key_phrases: Tuple[str, ...] = ()
+    urgency_reason: str | None = None
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any] | None) -> 'Extraction':
+        doc = doc or {}
+        return cls(
+            phones=tuple(doc.get('phones') or ()),
+            emails=tuple(doc.get('emails') or ()),
+            key_phrases=tuple(doc.get('key_phrases') or ()),
+            urgency_reason=doc.get('urgency_reason'),
+        )
+
+    def to_doc(self, sentiment: Sentiment) -> Dict[str, Any]:
+        return {
+            'phones': list(self.phones),
+            'emails': list(self.emails),
+            'key_phrases': list(self.key_phrases),
+            'sentiment': sentiment.value,
+            'urgency_reason': self.urgency_reason,
+        }
+
+
+# Fields that a snapshot keeps on disk until the email is opened
+LAZY_FIELDS = ('body', 'clean_body', 'extraction', 'references', 'response_sent')
+
+
+@dataclass(slots=True)
+class EmailRow:
+    """Internal email record: slotted, enum-typed, epoch timestamps.
+
+    Routes turn it into the JSON shape with ``to_api``. Fields listed in
+    LAZY_FIELDS are None while ``body_row`` points into a snapshot blob.
+    """
+    id: str
+    sender: str
+    subject: str
+    received_at: int
+    body: str | None = ''
+    clean_body: str | None = ''
+    message_id: str | None = None
+    sentiment: Sentiment = Sentiment.NEUTRAL
+    priority: Priority = Priority.NOT_URGENT
+    priority_score: float = 0.0
+    matched_category: Category | None = None
+    status: Status = Status.NEW
+    extraction: Extraction | None = field(default_factory=Extraction)
+    thread_key: str = ''
+    thread_id: str | None = None
+    in_reply_to: str | None = None
+    references: Tuple[str, ...] | None = ()
+    responded_at: int | None = None
+    response_sent: bool | None = False
+    # registered mailbox the email was fetched from (None for CSV imports)
+    mailbox: str | None = None
+    # id of the first email of its near-duplicate cluster (services/clustering.py); None without duplicates
+    cluster_id: str | None = None
+    body_row: int | None = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.body_row is None
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> 'EmailRow':
+        """Build a row from a plain dict (journal entries, API payloads, ISO or epoch times)"""
+        category = doc.get('matched_category')
+        return cls(
+            id=doc.get('id') or doc.get('_id') or '',
+            sender=doc.get('sender') or '',
+            subject=doc.get('subject') or '',
+            received_at=to_epoch(doc.get('received_at')) or 0,
+            body=doc.get('body') or '',
+            clean_body=doc.get('clean_body') or '',
+            message_id=doc.get('message_id'),
+            sentiment=Sentiment(doc.get('sentiment') or 'neutral'),
+            priority=Priority(doc.get('priority') or 'not_urgent'),
+            priority_score=float(doc.get('priority_score') or 0.0),
+            matched_category=Category(category) if category else None,
+            status=Status(doc.get('status') or 'new'),
+            extraction=Extraction.from_doc(doc.get('extraction')),
+            thread_key=doc.get('thread_key') or '',
+            thread_id=doc.get('thread_id'),
+            in_reply_to=doc.get('in_reply_to'),
+            references=tuple(doc.get('references') or ()),
+            responded_at=to_epoch(doc.get('responded_at')),
+            response_sent=bool(doc.get('response_sent', False)),
+            mailbox=doc.get('mailbox'),
+            cluster_id=doc.get('cluster_id'),
+        )
+
+    def to_doc(self) -> Dict[str, Any]:
+        """Plain dict with enum values and epoch times, for journals and snapshots"""
+        return {
+            'id': self.id,
+            'sender': self.sender,
+            'subject': self.subject,
+            'received_at': self.received_at,
+            'body': self.body,
+            'clean_body': self.clean_body,
+            'message_id': self.message_id,
+            'sentiment': self.sentiment.value,
+            'priority': self.priority.value,
+            'priority_score': self.priority_score,
+            'matched_category': self.matched_category.value if self.matched_category else None,
+            'status': self.status.value,
+            'extraction': self.extraction.to_doc(self.sentiment) if self.extraction else None,
+            'thread_key': self.thread_key,
+            'thread_id': self.thread_id,
+            'in_reply_to': self.in_reply_to,
+            'references': list(self.references or ()),
+            'responded_at': self.responded_at,
+            'response_sent': self.response_sent,
+            'mailbox': self.mailbox,
+            'cluster_id': self.cluster_id,
+        }
+
+    def to_api(self, include_body: bool = True) -> Dict[str, Any]:
+        """JSON shape served by the API: string enums and ISO-8601 timestamps"""
+        doc = self.to_doc()
+        doc['received_at'] = to_iso(self.received_at)
+        doc['responded_at'] = to_iso(self.responded_at)
+        if doc['matched_category'] is None:
+            del doc['matched_category']
+        if not include_body:
+            del doc['body']
+            del doc['clean_body']
+        return doc
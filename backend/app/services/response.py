@@ -1,6 +1,13 @@
 from ..config import get_settings
-from .store import get_email, add_response
+from .store import get_email, add_response, latest_open_draft
+from .draft_cache import DraftCache, draft_key, single_flight
+from .llm import DraftModelError, get_draft_model, get_fallback_model
+from .prompt import build_prompt
+from .records import EmailRow
+from .metrics import DRAFT_SECONDS, EMAILS_FAILED
 from datetime import datetime
+import hashlib
+import time
 
 PROMPT_TEMPLATE = (
     "You are a professional, empathetic customer support assistant.\n"
@@ -19,63 +26,139 @@ PROMPT_TEMPLATE = (
     "Reply Draft (professional, empathetic):\n"
 )
 
-# In real implementation replace with Gemini API call
+# Any edit to the template invalidates previously cached drafts
+TEMPLATE_VERSION = hashlib.sha256(PROMPT_TEMPLATE.encode('utf-8')).hexdigest()[:12]
+# Ends a stream the model broke off after partial output; the dashboard checks for it
+STREAM_ERROR_MARKER = '[draft generation failed]'
+
+_draft_cache: DraftCache | None = None
+
+
+def get_draft_cache() -> DraftCache:
+    global _draft_cache
+    if _draft_cache is None:
+        settings = get_settings()
+        _draft_cache = DraftCache(
+            settings.draft_cache_path,
+            max_entries=settings.draft_cache_max_entries,
+            ttl_seconds=settings.draft_cache_ttl_seconds,
+        )
+    return _draft_cache
+
+
+def _retrieve_context(email: EmailRow) -> list[dict]:
+    """Knowledge base chunks as ``{'text', 'score'}`` dicts; empty until RAG is implemented"""
+    return []
+
+
+def _prompt_version() -> str:
+    # the budget changes what the model sees, so it is part of the cache key too
+    settings = get_settings()
+    return f"{TEMPLATE_VERSION}:{settings.prompt_token_budget}:{settings.prompt_body_share}"
+
+
+def _build_prompt(email: EmailRow, context: list[dict]) -> dict:
+    settings = get_settings()
+    return build_prompt(PROMPT_TEMPLATE, email, context,
+                        budget=settings.prompt_token_budget,
+                        body_share=settings.prompt_body_share)
+
+
+def preview_prompt(email_id: str) -> dict | None:
+    """The prompt a draft request would send, with token counts per section"""
+    email = get_email(email_id)
+    if not email:
+        return None
+    return _build_prompt(email, _retrieve_context(email))
+
 
 def generate_draft(email_id: str):
-    email_doc = get_email(email_id)
-    if not email_doc:
+    """Return a draft for the email, reusing a cached one when nothing relevant changed.
+
+    Concurrent calls for the same content share a single generation, and the
+    draft is recorded in RESPONSES once unless it is already the open draft.
+    If the configured model fails, the stub model answers and nothing is cached,
+    so the next request tries the real model again.
+    """
+    email = get_email(email_id)
+    if not email:
+        return None
+    model = get_draft_model()
+    context = _retrieve_context(email)
+    key = draft_key(email, context, model.name, _prompt_version())
+
+    def produce():
+        started = time.perf_counter()
+        cache = get_draft_cache()
+        draft = cache.get(key)
+        model_name = model.name
+        prompt_tokens = None
+        cached = draft is not None
+        if not cached:
+            built = _build_prompt(email, context)
+            prompt, prompt_tokens = built['prompt'], built['tokens']
+            try:
+                draft = model.generate(prompt, email)
+                cache.put(key, draft)
+            except DraftModelError as e:
+                print(f"Draft model {model.name} failed, using fallback: {e}")
+                EMAILS_FAILED.inc(stage='draft_model')
+                fallback = get_fallback_model()
+                draft = fallback.generate(prompt, email)
+                model_name = fallback.name
+        _record_draft(email_id, draft, model_name, prompt_tokens)
+        DRAFT_SECONDS.observe(time.perf_counter() - started, model=model_name, cached=str(cached).lower())
+        return draft
+
+    return single_flight(key, produce)
+
+
+def stream_draft(email_id: str):
+    """Yield draft text as the model produces it; returns None if the email does not exist.
+
+    Cached drafts are replayed immediately. The complete draft is cached and
+    recorded once the stream finishes. If the model fails before any output the
+    fallback draft is streamed instead; after partial output the stream ends with
+    STREAM_ERROR_MARKER and nothing is cached or recorded.
+    """
+    email = get_email(email_id)
+    if not email:
         return None
-    extraction = email_doc.get('extraction') or {}
-    context = "(RAG not yet implemented)"
-    prompt = PROMPT_TEMPLATE.format(
-        subject=email_doc.get('subject',''),
-        sentiment=email_doc.get('sentiment','neutral'),
-        priority=email_doc.get('priority','not_urgent'),
-        phones=extraction.get('phones', []),
-        emails=extraction.get('emails', []),
-        phrases=extraction.get('key_phrases', []),
-        body=email_doc.get('body','')[:4000],
-        context=context
-    )
-    
-    # Enhanced empathetic response generation
-    sender = email_doc.get('sender', 'valued customer')
-    subject = email_doc.get('subject', '')
-    sentiment = email_doc.get('sentiment', 'neutral')
-    priority = email_doc.get('priority', 'not_urgent')
-    key_phrases = extraction.get('key_phrases', [])
-    
-    # Opening based on sentiment and urgency
-    if sentiment == 'negative' or priority == 'urgent':
-        if 'cannot' in subject.lower() or 'unable' in subject.lower() or 'down' in subject.lower():
-            opening = f"Dear {sender.split('@')[0]},\n\nI sincerely apologize for the inconvenience you're experiencing. I understand how frustrating it must be when you're unable to access our services, and I want to assure you that resolving this issue is my top priority."
-        elif 'billing' in subject.lower() or 'charged' in subject.lower():
-            opening = f"Dear {sender.split('@')[0]},\n\nThank you for bringing this billing concern to our attention. I understand how concerning unexpected charges can be, and I want to personally ensure we resolve this matter quickly and to your satisfaction."
-        else:
-            opening = f"Dear {sender.split('@')[0]},\n\nI understand your concern and truly appreciate you taking the time to reach out to us. Your experience matters greatly to us, and I'm here to help resolve this issue promptly."
-    else:
-        opening = f"Dear {sender.split('@')[0]},\n\nThank you for contacting our support team. I'm delighted to assist you with your inquiry today."
-    
-    # Main content based on key phrases and subject
-    main_content = ""
-    if any(phrase in ['login', 'access', 'password', 'account'] for phrase in key_phrases):
-        main_content = "I've reviewed your account access issue and will prioritize getting you back into your account immediately. Our technical team has identified several effective solutions for login-related concerns.\n\nTo expedite the resolution process, I'll be sending you a secure password reset link within the next few minutes. Please check both your inbox and spam folder. If you continue to experience difficulties, I'm also available for a brief phone call to walk you through the process step-by-step."
-    elif any(phrase in ['billing', 'charged', 'payment', 'refund'] for phrase in key_phrases):
-        main_content = "I've immediately escalated your billing inquiry to our specialized billing department for review. We take billing accuracy very seriously and will conduct a thorough investigation of your account charges.\n\nYou can expect a detailed breakdown of all charges along with any necessary corrections within 24 hours. If a refund is warranted, we'll process it immediately and provide you with a reference number for tracking."
-    elif any(phrase in ['integration', 'api', 'third-party'] for phrase in key_phrases):
-        main_content = "I'm excited to help you explore our integration capabilities! Our platform supports extensive third-party integrations, including comprehensive CRM connectivity.\n\nI'll be sending you our detailed integration guide along with API documentation within the next hour. Our technical team can also schedule a personalized demo to show you exactly how our integrations can streamline your workflow and enhance your business operations."
-    elif any(phrase in ['pricing', 'subscription', 'plan'] for phrase in key_phrases):
-        main_content = "I'd be happy to provide you with comprehensive pricing information tailored to your specific needs. Our flexible subscription plans are designed to grow with your business.\n\nI'll prepare a customized pricing breakdown that includes all available features and any current promotional offers. Additionally, I can arrange a consultation with our solutions specialist to ensure you select the perfect plan for your requirements."
-    else:
-        main_content = f"I've carefully reviewed your inquiry regarding {', '.join(key_phrases[:3]) if key_phrases else 'your request'} and want to provide you with the most comprehensive assistance possible.\n\nOur team is committed to delivering exceptional service, and I'll personally ensure your needs are met. I'll be following up with detailed information and next steps within the next few hours."
-    
-    # Closing based on urgency
-    if priority == 'urgent':
-        closing = "Given the urgent nature of your request, I'm treating this with the highest priority. You can expect an update from me within the next 2 hours, and I'll remain available throughout the resolution process.\n\nIf you need immediate assistance, please don't hesitate to call our priority support line, and mention ticket reference #SP-" + email_id[:8].upper() + ".\n\nWarm regards,\nCustomer Success Team\nAI Communication Assistant"
-    else:
-        closing = "I'm committed to ensuring your complete satisfaction with our resolution. You can expect a follow-up from me within 24 hours with either a complete solution or a detailed progress update.\n\nPlease don't hesitate to reach out if you have any additional questions or concerns in the meantime.\n\nBest regards,\nCustomer Success Team\nAI Communication Assistant\n\nP.S. Your feedback helps us improve our service. We'd love to hear about your experience once we've resolved your inquiry."
-    
-    draft = f"{opening}\n\n{main_content}\n\n{closing}"
-    
-    add_response(email_doc['id'], draft, model='empathetic-ai')
-    return draft
+    model = get_draft_model()
+    context = _retrieve_context(email)
+    key = draft_key(email, context, model.name, _prompt_version())
+    cache = get_draft_cache()
+
+    def tokens():
+        draft = cache.get(key)
+        if draft is not None:
+            _record_draft(email_id, draft, model.name)
+            yield draft
+            return
+        built = _build_prompt(email, context)
+        prompt, prompt_tokens = built['prompt'], built['tokens']
+        pieces = []
+        try:
+            for piece in model.stream(prompt, email):
+                pieces.append(piece)
+                yield piece
+        except DraftModelError as e:
+            print(f"Draft model {model.name} stream failed: {e}")
+            if pieces:
+                yield f"\n\n{STREAM_ERROR_MARKER} {e}"
+                return
+            draft = get_fallback_model().generate(prompt, email)
+            _record_draft(email_id, draft, get_fallback_model().name, prompt_tokens)
+            yield draft
+            return
+        draft = ''.join(pieces)
+        cache.put(key, draft)
+        _record_draft(email_id, draft, model.name, prompt_tokens)
+
+    return tokens()
+
+
+def _record_draft(email_id: str, draft: str, model_name: str, prompt_tokens: dict | None = None):
+    current = latest_open_draft(email_id)
+    if not current or current['draft'] != draft:
+        add_response(email_id, draft, model=model_name, prompt_tokens=prompt_tokens)
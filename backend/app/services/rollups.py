@@ -0,0 +1,172 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+import math
+from .records import EmailRow, Status, to_iso
+
+# Pre-aggregated counts for the analytics charts, kept by the store as emails are
+# written, so a time-series query merges a few buckets and never reads emails.
+#
+# Every email adds to one bucket per resolution (the hour and the UTC day of its
+# received_at): the total, its category, sentiment and priority, and once it is
+# answered its response time. A bucket is {(field, key): amount}. Changing an email
+# subtracts what it added before and adds it again, so the buckets stay exact.
+#
+# Response times go into a DDSketch: bin i counts the times in (GAMMA^(i-1), GAMMA^i]
+# seconds, so any quantile read back is within RELATIVE_ACCURACY of the true one,
+# and two sketches merge (or an email is taken out) by adding bin counts. The bin
+# formula is repeated in SQL by the SQLite triggers; both must agree.
+
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = (HOUR, DAY)
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LN_GAMMA = math.log(GAMMA)
+# granularity -> bucket width in seconds; months are calendar months built from days
+GRANULARITIES = {'hour': HOUR, 'day': DAY, 'week': 7 * DAY, 'month': None}
+# 1970-01-01 was a Thursday; weeks start on Monday
+WEEK_OFFSET = 4 * DAY
+MAX_POINTS = 5000
+UNCATEGORIZED = 'uncategorized'
+QUANTILES = (0.5, 0.9, 0.99)
+# EmailRow fields that contributions() reads
+ROLLUP_FIELDS = frozenset({'received_at', 'matched_category', 'sentiment', 'priority', 'status', 'responded_at'})
+
+Bucket = Dict[Tuple[str, str], int]
+
+
+def sketch_bin(seconds: float) -> int:
+    """DDSketch bin of a response time; anything under a second shares bin 0"""
+    return math.ceil(math.log(max(seconds, 1)) / LN_GAMMA)
+
+
+def bin_value(index: int) -> float:
+    """Representative value of a bin, within RELATIVE_ACCURACY of everything in it"""
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+def contributions(row: EmailRow) -> List[Tuple[str, str, int]]:
+    """(field, key, amount) that an email adds to the buckets of its received_at"""
+    parts = [
+        ('total', '', 1),
+        ('category', row.matched_category.value if row.matched_category else UNCATEGORIZED, 1),
+        ('sentiment', row.sentiment.value, 1),
+        ('priority', row.priority.value, 1),
+    ]
+    if row.status is Status.RESPONDED and row.responded_at is not None:
+        seconds = max(row.responded_at - row.received_at, 0)
+        parts.append(('response', str(sketch_bin(seconds)), 1))
+        parts.append(('response_seconds', '', seconds))
+    return parts
+
+
+def bucket_start(ts: int, resolution: int) -> int:
+    return ts - ts % resolution
+
+
+def _period_start(ts: int, granularity: str) -> int:
+    if granularity == 'month':
+        day = datetime.fromtimestamp(ts, timezone.utc)
+        return int(datetime(day.year, day.month, 1, tzinfo=timezone.utc).timestamp())
+    if granularity == 'week':
+        return ts - (ts - WEEK_OFFSET) % GRANULARITIES['week']
+    return bucket_start(ts, GRANULARITIES[granularity])
+
+
+def _next_period(start: int, granularity: str) -> int:
+    if granularity == 'month':
+        day = datetime.fromtimestamp(start, timezone.utc)
+        year, month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+        return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+    return start + GRANULARITIES[granularity]
+
+
+def period_count(start: int, end: int, granularity: str) -> int:
+    """Upper bound on len(periods(...)), without building them"""
+    return (end - start) // (GRANULARITIES[granularity] or 28 * DAY) + 2
+
+
+def periods(start: int, end: int, granularity: str) -> List[Tuple[int, int]]:
+    """[start, end) widened to whole periods, as (period start, period end) pairs"""
+    result = []
+    period = _period_start(start, granularity)
+    while period < end:
+        following = _next_period(period, granularity)
+        result.append((period, following))
+        period = following
+    return result
+
+
+def resolution_for(granularity: str) -> int:
+    return HOUR if granularity == 'hour' else DAY
+
+
+def merge(buckets: Iterable[Bucket]) -> Bucket:
+    merged: Bucket = {}
+    for bucket in buckets:
+        for key, amount in bucket.items():
+            merged[key] = merged.get(key, 0) + amount
+    return merged
+
+
+def quantiles(bins: Dict[int, int], qs: Iterable[float] = QUANTILES) -> Dict[str, float | None]:
+    """Quantiles of a merged sketch, in minutes; one pass over the bins for all of them"""
+    total = sum(count for count in bins.values() if count > 0)
+    result: Dict[str, float | None] = {f"p{round(q * 100):g}": None for q in qs}
+    if not total:
+        return result
+    targets = sorted((q * (total - 1), name) for q, name in zip(qs, result))
+    seen = 0
+    for index in sorted(bins):
+        seen += max(bins[index], 0)
+        while targets and seen > targets[0][0]:
+            result[targets.pop(0)[1]] = round(bin_value(index) / 60, 2)
+        if not targets:
+            break
+    return result
+
+
+def summarize(bucket: Bucket) -> Dict[str, object]:
+    """The chart point for a merged bucket"""
+    counts: Dict[str, Dict[str, int]] = {'category': {}, 'sentiment': {}, 'priority': {}}
+    bins: Dict[int, int] = {}
+    total = response_seconds = 0
+    for (field, key), amount in bucket.items():
+        if not amount:
+            continue
+        if field == 'total':
+            total = amount
+        elif field == 'response':
+            bins[int(key)] = amount
+        elif field == 'response_seconds':
+            response_seconds = amount
+        elif field in counts:
+            counts[field][key] = amount
+    responded = sum(bins.values())
+    return {
+        'total': total,
+        'category_counts': counts['category'],
+        'sentiment_counts': counts['sentiment'],
+        'priority_counts': counts['priority'],
+        'responded': responded,
+        'avg_response_time_minutes': round(response_seconds / responded / 60, 2) if responded else None,
+        'response_time_minutes': quantiles(bins),
+    }
+
+
+def timeseries(buckets: Dict[int, Bucket], windows: List[Tuple[int, int]], granularity: str) -> Dict[str, object]:
+    """One point per period from the buckets of ``resolution_for(granularity)``, plus the whole range"""
+    step = resolution_for(granularity)
+    points = []
+    for period, following in windows:
+        # weeks and months are whole days (and days whole hours), so no bucket straddles two periods
+        merged = merge(buckets[s] for s in range(period, following, step) if s in buckets)
+        points.append({'start': to_iso(period), **summarize(merged)})
+    return {
+        'from': to_iso(windows[0][0]) if windows else None,
+        'to': to_iso(windows[-1][1]) if windows else None,
+        'granularity': granularity,
+        'points': points,
+        'summary': summarize(merge(buckets.values())),
+    }
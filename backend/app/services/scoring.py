@@ -0,0 +1,143 @@
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+import heapq
+import itertools
+import threading
+import time
+from ..config import get_settings
+from .records import EmailRow, Priority, Sentiment, Status
+
+# One scoring engine for every ingest path. An email's score is a static base
+# (urgency, sentiment, body length; weights in config) stored as priority_score,
+# plus an aging term that grows with the time since received_at until the email
+# is answered:
+#     score(now) = priority_score + aging_per_hour * (now - received_at) / 3600
+# The aging rate is the same for every open email, so the order of open emails
+# never changes as time passes. It is the order of the static key
+#     priority_score - aging_per_hour * received_at / 3600
+# and queues index that key once, then add aging_per_hour * now / 3600 when read.
+# Nothing is rescored on a timer. Answered emails stop aging and rank by their base.
+
+SECONDS_PER_HOUR = 3600.0
+
+
+def base_score(priority: Priority | str, sentiment: Sentiment | str, body: str = '') -> float:
+    settings = get_settings()
+    score = 0.0
+    if Priority(priority) is Priority.URGENT:
+        score += settings.score_urgent_weight
+    if Sentiment(sentiment) is Sentiment.NEGATIVE:
+        score += settings.score_negative_weight
+    if settings.score_short_body_weight:
+        # short emails are quicker to answer
+        score += settings.score_short_body_weight * max(0.0, 1 - len(body) / 5000)
+    return score
+
+
+def aging_rate() -> float:
+    """Score points per second of waiting"""
+    return get_settings().score_aging_per_hour / SECONDS_PER_HOUR
+
+
+def is_open(row: EmailRow) -> bool:
+    return row.status is not Status.RESPONDED
+
+
+def sla_key(row: EmailRow, rate: float | None = None) -> float:
+    """Time-independent sort key: open emails compare on it directly, add ``rate * now`` for the score"""
+    if not is_open(row):
+        return row.priority_score
+    return row.priority_score - (aging_rate() if rate is None else rate) * row.received_at
+
+
+def effective_score(row: EmailRow, now: float | None = None) -> float:
+    if not is_open(row):
+        return row.priority_score
+    rate = aging_rate()
+    return sla_key(row, rate) + rate * (time.time() if now is None else now)
+
+
+def _walk(heap: List[Tuple[float, str]]) -> Iterator[Tuple[float, str]]:
+    """Entries of a binary heap in order without popping it: best-first over the array, O(k log k) for k entries"""
+    if not heap:
+        return
+    frontier = [(heap[0], 0)]
+    while frontier:
+        entry, i = heapq.heappop(frontier)
+        yield entry
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+
+class SlaQueue:
+    """Conversation heads in SLA order, for the memory store.
+
+    Two max-heaps keyed by sla_key: open heads, and answered heads that no
+    longer age. A change pushes a new entry and leaves the old one behind.
+    Readers skip entries that no longer match ``_keys`` (lazy deletion), and the
+    heaps are rebuilt once stale entries outnumber live ones. top() walks the
+    heaps without modifying them and merges them on the score at read time.
+    """
+
+    def __init__(self, get_head: Callable[[str], EmailRow | None]):
+        self._get_head = get_head
+        # email id -> (open, key) of its live entry
+        self._keys: Dict[str, Tuple[bool, float]] = {}
+        self._heaps: Dict[bool, List[Tuple[float, str]]] = {True: [], False: []}
+        self._lock = threading.Lock()
+
+    def push(self, row: EmailRow):
+        entry = (is_open(row), sla_key(row))
+        with self._lock:
+            if self._keys.get(row.id) == entry:
+                return
+            self._keys[row.id] = entry
+            heapq.heappush(self._heaps[entry[0]], (-entry[1], row.id))
+            if len(self._heaps[True]) + len(self._heaps[False]) > 2 * len(self._keys) + 1024:
+                self._compact()
+
+    def discard(self, eid: str):
+        with self._lock:
+            self._keys.pop(eid, None)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._heaps = {True: [], False: []}
+
+    def rebuild(self, rows: Iterable[EmailRow]):
+        """Replace the contents with ``rows`` and heapify once, instead of pushing one by one"""
+        with self._lock:
+            self._keys = {row.id: (is_open(row), sla_key(row)) for row in rows}
+            self._compact()
+
+    def _compact(self):
+        heaps = {True: [], False: []}
+        for eid, (open_, key) in self._keys.items():
+            heaps[open_].append((-key, eid))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        self._heaps = heaps
+
+    def _live(self, open_: bool, offset: float) -> Iterator[Tuple[float, EmailRow]]:
+        seen = set()
+        for neg_key, eid in _walk(self._heaps[open_]):
+            if eid in seen or self._keys.get(eid) != (open_, -neg_key):
+                continue
+            row = self._get_head(eid)
+            if row is None:
+                continue
+            seen.add(eid)
+            yield -neg_key + offset, row
+
+    def top(self, limit: int | None = None, open_only: bool = False, now: float | None = None,
+            skip: Callable[[EmailRow], bool] | None = None) -> List[EmailRow]:
+        """Heads by current score, highest first; O(k log n) for the first k"""
+        offset = aging_rate() * (time.time() if now is None else now)
+        with self._lock:
+            ranked = self._live(True, offset)
+            if not open_only:
+                ranked = heapq.merge(ranked, self._live(False, 0.0), key=lambda item: item[0], reverse=True)
+            rows = (row for _, row in ranked if skip is None or not skip(row))
+            return list(itertools.islice(rows, limit))
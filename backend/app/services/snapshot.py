@@ -0,0 +1,367 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+from dataclasses import asdict, fields
+from itertools import repeat
+from datetime import datetime
+from pathlib import Path
+import gc
+import json
+import mmap
+import shutil
+import threading
+import time
+import numpy as np
+from . import store
+from .records import EmailRow, Extraction, Status, Priority, Sentiment, Category, LAZY_FIELDS
+
+# Snapshot layout (one directory per checkpoint, CURRENT names the live one):
+#   meta.json              count, enum vocabularies, format version
+#   <col>.str              NUL-separated UTF-8 strings, one per email
+#   <col>.npy              typed arrays: enum codes, float scores, epoch seconds (-1 = missing)
+#   bodies.bin             body, clean_body and a JSON object of the other lazy fields, per email,
+#                          back to back; memory-mapped and decoded only when an email is opened
+#   body_offsets.npy       3n+1 int64 offsets into bodies.bin
+#   responses.json         drafts
+#   clusters.json          near-duplicate clusters still inside the window, with their LSH bucket keys
+# Changes made after a checkpoint go to changes.log (NDJSON) and are replayed on restore.
+SNAPSHOT_VERSION = 2
+SEP = '\x00'
+STRING_COLUMNS = ['id', 'message_id', 'sender', 'subject', 'thread_key', 'thread_id', 'in_reply_to', 'mailbox',
+                  'cluster_id']
+OPTIONAL_STRINGS = {'message_id', 'thread_id', 'in_reply_to', 'mailbox', 'cluster_id'}
+ENUM_COLUMNS = {'status': Status, 'sentiment': Sentiment, 'priority': Priority, 'matched_category': Category}
+FLOAT_COLUMNS = ['priority_score']
+TIME_COLUMNS = ['received_at', 'responded_at']
+BODY_COLUMNS = ['body', 'clean_body']
+EXTRA_COLUMNS = [f for f in LAZY_FIELDS if f not in BODY_COLUMNS]
+# segments per email in bodies.bin: the two body columns plus the extras JSON
+SEGMENTS = len(BODY_COLUMNS) + 1
+NO_TIME = -1
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Extraction):
+        return asdict(value)
+    return str(value)
+
+
+def _write_strings(path: Path, values: List[str]):
+    path.write_bytes(SEP.join(v.replace(SEP, '') for v in values).encode('utf-8'))
+
+
+def _read_strings(path: Path, count: int) -> List[str]:
+    return path.read_bytes().decode('utf-8').split(SEP) if count else []
+
+
+class BodyBlob:
+    """Random access to bodies and extra fields in a snapshot without loading them into memory"""
+
+    def __init__(self, directory: Path):
+        self.offsets = np.load(directory / 'body_offsets.npy', mmap_mode='r')
+        self._file = open(directory / 'bodies.bin', 'rb')
+        size = (directory / 'bodies.bin').stat().st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def read_raw(self, row: int) -> List[bytes]:
+        bounds = [int(x) for x in self.offsets[SEGMENTS * row:SEGMENTS * row + SEGMENTS + 1]]
+        return [self._mm[bounds[j]:bounds[j + 1]] for j in range(SEGMENTS)]
+
+    def read(self, row: int) -> Dict[str, Any]:
+        *bodies, extras = self.read_raw(row)
+        fields = json.loads(extras) if extras else {}
+        for col, data in zip(BODY_COLUMNS, bodies):
+            fields[col] = data.decode('utf-8')
+        return fields
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+        self.offsets = None
+
+
+def _extras(row: EmailRow) -> bytes:
+    return json.dumps({
+        'extraction': asdict(row.extraction) if row.extraction else None,
+        'references': list(row.references or ()),
+        'response_sent': bool(row.response_sent),
+    }).encode('utf-8')
+
+
+def write_snapshot(directory: Path, emails: List[EmailRow], responses: List[Dict[str, Any]],
+                   clusters: List[Dict[str, Any]] = ()):
+    directory.mkdir(parents=True)
+    n = len(emails)
+    meta = {'version': SNAPSHOT_VERSION, 'count': n, 'created_at': time.time(), 'enums': {}}
+
+    for col in STRING_COLUMNS:
+        _write_strings(directory / f'{col}.str', [getattr(r, col) or '' for r in emails])
+    for col in ENUM_COLUMNS:
+        vocab = [None]
+        codes_by_value = {None: 0}
+        codes = []
+        for r in emails:
+            value = getattr(r, col)
+            if value not in codes_by_value:
+                codes_by_value[value] = len(vocab)
+                vocab.append(value)
+            codes.append(codes_by_value[value])
+        np.save(directory / f'{col}.npy', np.array(codes, dtype=np.uint8))
+        meta['enums'][col] = [v.value if v is not None else None for v in vocab]
+    for col in FLOAT_COLUMNS:
+        np.save(directory / f'{col}.npy', np.array([getattr(r, col) for r in emails], dtype=np.float64))
+    for col in TIME_COLUMNS:
+        values = [getattr(r, col) for r in emails]
+        np.save(directory / f'{col}.npy', np.array([NO_TIME if v is None else v for v in values], dtype=np.int64))
+
+    offsets = np.zeros(SEGMENTS * n + 1, dtype=np.int64)
+    pos = 0
+    source = store.BODY_SOURCE
+    with open(directory / 'bodies.bin', 'wb') as f:
+        for i, r in enumerate(emails):
+            if r.body_row is not None and source is not None:
+                parts = source.read_raw(r.body_row)
+            else:
+                parts = [(getattr(r, col) or '').encode('utf-8') for col in BODY_COLUMNS]
+                parts.append(_extras(r))
+            for j, data in enumerate(parts):
+                f.write(data)
+                pos += len(data)
+                offsets[SEGMENTS * i + j + 1] = pos
+    np.save(directory / 'body_offsets.npy', offsets)
+
+    (directory / 'responses.json').write_text(json.dumps(responses, default=_json_default), encoding='utf-8')
+    (directory / 'clusters.json').write_text(json.dumps(list(clusters)), encoding='utf-8')
+    (directory / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+
+def load_snapshot(directory: Path) -> tuple[List[EmailRow], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Read the columns back into rows; bodies and extras stay on disk, referenced by ``body_row``"""
+    meta = json.loads((directory / 'meta.json').read_text(encoding='utf-8'))
+    if meta.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {meta.get('version')}")
+    n = meta['count']
+    columns: Dict[str, List[Any]] = {}
+    for col in STRING_COLUMNS:
+        if col in OPTIONAL_STRINGS and not (directory / f'{col}.str').exists():
+            # column added after the snapshot was written
+            columns[col] = [None] * n
+            continue
+        values = _read_strings(directory / f'{col}.str', n)
+        columns[col] = [v or None for v in values] if col in OPTIONAL_STRINGS else values
+    for col, enum in ENUM_COLUMNS.items():
+        vocab = [enum(v) if v is not None else None for v in meta['enums'][col]]
+        columns[col] = [vocab[c] for c in np.load(directory / f'{col}.npy').tolist()]
+    for col in FLOAT_COLUMNS:
+        columns[col] = np.load(directory / f'{col}.npy').tolist()
+    for col in TIME_COLUMNS:
+        columns[col] = [None if t == NO_TIME else t for t in np.load(directory / f'{col}.npy').tolist()]
+    columns['body_row'] = range(n)
+
+    # positional, column by column: lazy fields stay None until BodyBlob reads them
+    rows = list(map(EmailRow, *(columns.get(f.name, repeat(None)) for f in fields(EmailRow))))
+    responses = json.loads((directory / 'responses.json').read_text(encoding='utf-8'))
+    clusters_path = directory / 'clusters.json'
+    clusters = json.loads(clusters_path.read_text(encoding='utf-8')) if clusters_path.exists() else []
+    return rows, responses, clusters
+
+
+class ChangeLog:
+    """Append-only NDJSON journal of store mutations since the last checkpoint"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def append(self, op: str, payload: Dict[str, Any]):
+        data = {k: v for k, v in payload.items() if not k.startswith('_')}
+        line = json.dumps({'op': op, 'data': data}, default=_json_default)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def rotate(self) -> Path:
+        """Move the current journal aside so a checkpoint can cover it; new changes start a fresh file"""
+        rotated = self.path.with_suffix('.log.old')
+        with self._lock:
+            self._file.close()
+            if rotated.exists():
+                # a previous checkpoint failed: keep its journal and add to it
+                with open(rotated, 'a', encoding='utf-8') as dst, open(self.path, 'r', encoding='utf-8') as src:
+                    shutil.copyfileobj(src, dst)
+                self.path.unlink()
+            else:
+                self.path.replace(rotated)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return rotated
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _apply(op: str, data: Dict[str, Any]):
+    if op == 'upsert':
+        store.upsert_email(data)
+    elif op == 'update':
+        eid = data.pop('id')
+        store.update_email(eid, **data)
+    elif op == 'response':
+        store.restore_response(data)
+    elif op == 'clusters':
+        store.add_clusters(data['clusters'])
+    elif op == 'clear':
+        store.clear_all_data()
+
+
+class SnapshotManager:
+    """Warm start from the newest snapshot and keep checkpointing in the background"""
+
+    def __init__(self, directory: str, interval_seconds: float):
+        self.directory = Path(directory)
+        self.interval = interval_seconds
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.log: ChangeLog | None = None
+        self._dirty = False
+        self._replaying = False
+        self._checkpoint_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _current(self) -> Path | None:
+        pointer = self.directory / 'CURRENT'
+        if not pointer.exists():
+            return None
+        path = self.directory / pointer.read_text(encoding='utf-8').strip()
+        return path if path.exists() else None
+
+    def _on_change(self, op: str, payload: Any):
+        if self._replaying:
+            return
+        self._dirty = True
+        self.log.append(op, payload.to_doc() if isinstance(payload, EmailRow) else payload)
+
+    def restore(self) -> dict:
+        started = time.perf_counter()
+        restored = 0
+        replayed = 0
+        self._replaying = True
+        try:
+            current = self._current()
+            if current:
+                # millions of new objects and none of them garbage: collections would only rescan them
+                collecting = gc.isenabled()
+                gc.disable()
+                try:
+                    rows, responses, clusters = load_snapshot(current)
+                    store.BODY_SOURCE = BodyBlob(current)
+                    store.restore_emails(rows)
+                finally:
+                    if collecting:
+                        gc.enable()
+                for response in responses:
+                    store.restore_response(response)
+                store.add_clusters(clusters)
+                restored = len(rows)
+            for journal in (self.directory / 'changes.log.old', self.directory / 'changes.log'):
+                if not journal.exists():
+                    continue
+                with open(journal, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # torn final line after a crash
+                        _apply(entry['op'], entry['data'])
+                        replayed += 1
+        finally:
+            self._replaying = False
+        self._dirty = replayed > 0
+        self.log = ChangeLog(self.directory / 'changes.log')
+        store.CHANGE_LISTENERS.append(self._on_change)
+        elapsed = time.perf_counter() - started
+        print(f"Restored {restored} emails and replayed {replayed} changes in {elapsed:.2f}s")
+        return {"restored": restored, "replayed": replayed, "seconds": round(elapsed, 3)}
+
+    def checkpoint(self, force: bool = False) -> dict:
+        with self._checkpoint_lock:
+            if not (self._dirty or force):
+                return {"written": False}
+            started = time.perf_counter()
+            self._dirty = False
+            # rotate and copy under one lock, so no write lands in the new log and in the copy as well
+            with store.STORE_LOCK:
+                rotated = self.log.rotate()
+                emails = list(store.EMAILS.values())
+                responses = list(store.RESPONSES.values())
+                clusters = list(store.CLUSTERS.values())
+            name = f"snap-{int(time.time() * 1000)}"
+            tmp = self.directory / f"{name}.tmp"
+            write_snapshot(tmp, emails, responses, clusters)
+            tmp.replace(self.directory / name)
+            pointer_tmp = self.directory / 'CURRENT.tmp'
+            pointer_tmp.write_text(name, encoding='utf-8')
+            pointer_tmp.replace(self.directory / 'CURRENT')
+
+            # point bodies that are still on disk at the new snapshot, then drop the old one
+            old_source = store.BODY_SOURCE
+            with store.BODY_LOCK:
+                for i, row in enumerate(emails):
+                    if row.body_row is not None:
+                        row.body_row = i
+                store.BODY_SOURCE = BodyBlob(self.directory / name)
+            if old_source is not None:
+                old_source.close()
+            rotated.unlink(missing_ok=True)
+            for path in self.directory.glob('snap-*'):
+                if path.name != name:
+                    shutil.rmtree(path, ignore_errors=True)
+            elapsed = time.perf_counter() - started
+            return {"written": True, "emails": len(emails), "seconds": round(elapsed, 3)}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.checkpoint()
+            except Exception as e:
+                print(f"Snapshot checkpoint failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='snapshot-checkpoint', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        try:
+            self.checkpoint()
+        finally:
+            if self._on_change in store.CHANGE_LISTENERS:
+                store.CHANGE_LISTENERS.remove(self._on_change)
+            self.log.close()
+
+
+_manager: SnapshotManager | None = None
+
+
+def get_manager() -> SnapshotManager | None:
+    return _manager
+
+
+def start_persistence(directory: str, interval_seconds: float) -> dict:
+    global _manager
+    _manager = SnapshotManager(directory, interval_seconds)
+    result = _manager.restore()
+    _manager.start()
+    return result
+
+
+def stop_persistence():
+    global _manager
+    if _manager is not None:
+        _manager.stop()
+        _manager = None
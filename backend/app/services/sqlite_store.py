@@ -0,0 +1,544 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+import heapq
+import itertools
+import json
+import math
+import sqlite3
+import threading
+import time
+from .records import EmailRow, Extraction, Status, Priority, Sentiment, Category
+from .store import StoreBackend, _thread_key
+from .scoring import aging_rate, effective_score
+from . import rollups
+
+# Shared-state backend: one SQLite database in WAL mode that every uvicorn worker
+# opens. Readers never block the writer; writers take the database lock with
+# BEGIN IMMEDIATE, and status transitions are compare-and-swap UPDATEs, so two
+# workers can never both win the same transition.
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS emails (
+        id TEXT PRIMARY KEY,
+        message_id TEXT,
+        sender TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        received_at INTEGER NOT NULL,
+        body TEXT,
+        clean_body TEXT,
+        sentiment TEXT NOT NULL,
+        priority TEXT NOT NULL,
+        priority_score REAL NOT NULL,
+        matched_category TEXT,
+        status TEXT NOT NULL,
+        extraction TEXT,
+        thread_key TEXT NOT NULL,
+        thread_id TEXT,
+        in_reply_to TEXT,
+        refs TEXT,
+        responded_at INTEGER,
+        response_sent INTEGER NOT NULL DEFAULT 0,
+        mailbox TEXT,
+        cluster_id TEXT,
+        latest INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS responses (
+        id TEXT PRIMARY KEY,
+        email_id TEXT NOT NULL,
+        draft TEXT NOT NULL,
+        model TEXT,
+        prompt_tokens TEXT,
+        created_at TEXT NOT NULL,
+        final INTEGER NOT NULL DEFAULT 0
+    )""",
+    # near-duplicate clusters still inside the window, and the LSH bucket each one holds
+    """CREATE TABLE IF NOT EXISTS clusters (
+        id TEXT PRIMARY KEY,
+        signature TEXT NOT NULL,
+        received_at INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS lsh_buckets (
+        key INTEGER PRIMARY KEY,
+        cluster_id TEXT NOT NULL,
+        received_at INTEGER NOT NULL
+    )""",
+    # analytics rollups (services/rollups.py), kept by the triggers below
+    """CREATE TABLE IF NOT EXISTS rollups (
+        resolution INTEGER NOT NULL,
+        start INTEGER NOT NULL,
+        field TEXT NOT NULL,
+        key TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        PRIMARY KEY (resolution, start, field, key)
+    ) WITHOUT ROWID""",
+]
+# Rows carry the bodies, so every hot query is answered from a narrow index instead
+# of the table: stats group over (status, priority_score, ...) and count over
+# received_at, and the inbox list walks the partial index of conversation heads
+# (latest = 1) in SLA order and stops after `limit` rows. Open heads are indexed on
+# the time-independent SLA key (services/scoring.py); answered ones, which no longer
+# age, are read from emails_status_priority in base score order.
+INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS emails_message_id_unique ON emails (message_id)",
+    "CREATE INDEX IF NOT EXISTS emails_status_priority ON emails (status, priority_score, priority, sentiment)",
+    "CREATE INDEX IF NOT EXISTS emails_received ON emails (received_at)",
+    "CREATE INDEX IF NOT EXISTS emails_thread ON emails (thread_key, received_at)",
+    "CREATE INDEX IF NOT EXISTS responses_open ON responses (email_id, final, created_at)",
+    "CREATE INDEX IF NOT EXISTS emails_cluster ON emails (cluster_id) WHERE cluster_id IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS emails_mailbox ON emails (mailbox) WHERE mailbox IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS clusters_received ON clusters (received_at)",
+    "CREATE INDEX IF NOT EXISTS lsh_buckets_received ON lsh_buckets (received_at)",
+]
+# Rows written per executemany() call during batched upserts
+BATCH_SIZE = 500
+
+# Rollups are maintained by triggers, so every writer (any worker, any code path)
+# keeps them exact: an insert adds the email's contributions, a delete takes them
+# away, and an update (an upsert of a stored id included) that changes one of the
+# fields involved does both. These are rollups.contributions() in SQL.
+_ANSWERED = "{row}.status = 'responded' AND {row}.responded_at IS NOT NULL"
+ROLLUP_PARTS = [
+    ("'total'", "''", "1", None),
+    ("'category'", f"coalesce({{row}}.matched_category, '{rollups.UNCATEGORIZED}')", "1", None),
+    ("'sentiment'", "{row}.sentiment", "1", None),
+    ("'priority'", "{row}.priority", "1", None),
+    ("'response'", f"CAST(ceil(ln(max({{row}}.responded_at - {{row}}.received_at, 1)) / {rollups.LN_GAMMA!r}) AS INTEGER)",
+     "1", _ANSWERED),
+    ("'response_seconds'", "''", "max({row}.responded_at - {row}.received_at, 0)", _ANSWERED),
+]
+ROLLUP_RESOLUTIONS = ' UNION ALL '.join(f"SELECT {resolution} AS resolution" for resolution in rollups.RESOLUTIONS)
+
+
+def _rollup_select(row: str, sign: int) -> str:
+    selects = []
+    for field, key, amount, where in ROLLUP_PARTS:
+        sql = (f"SELECT r.resolution, {{row}}.received_at - {{row}}.received_at % r.resolution AS start, "
+               f"{field} AS field, {key} AS key, {sign} * {amount} AS amount FROM ({ROLLUP_RESOLUTIONS}) r")
+        selects.append((sql + (f" WHERE {where}" if where else '')).format(row=row))
+    return ' UNION ALL '.join(selects)
+
+
+def _rollup_add(row: str, sign: int) -> str:
+    return f"""
+        INSERT INTO rollups (resolution, start, field, key, amount)
+        SELECT * FROM ({_rollup_select(row, sign)}) WHERE true
+        ON CONFLICT (resolution, start, field, key) DO UPDATE SET amount = amount + excluded.amount;"""
+
+
+ROLLUP_FIELDS = ('received_at', 'matched_category', 'sentiment', 'priority', 'status', 'responded_at')
+TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS emails_rollup_insert AFTER INSERT ON emails BEGIN {_rollup_add('NEW', 1)} END",
+    f"CREATE TRIGGER IF NOT EXISTS emails_rollup_delete AFTER DELETE ON emails BEGIN {_rollup_add('OLD', -1)} END",
+    f"""CREATE TRIGGER IF NOT EXISTS emails_rollup_update AFTER UPDATE OF {', '.join(ROLLUP_FIELDS)} ON emails
+    WHEN {' OR '.join(f'OLD.{name} IS NOT NEW.{name}' for name in ROLLUP_FIELDS if name != 'status')}
+        OR (OLD.status = 'responded') IS NOT (NEW.status = 'responded')
+    BEGIN {_rollup_add('OLD', -1)} {_rollup_add('NEW', 1)} END""",
+]
+ROLLUP_RANGE = """
+    SELECT start, field, key, amount FROM rollups
+    WHERE resolution = ? AND start >= ? AND start < ? AND amount != 0
+"""
+
+COLUMNS = [
+    'id', 'message_id', 'sender', 'subject', 'received_at', 'body', 'clean_body', 'sentiment',
+    'priority', 'priority_score', 'matched_category', 'status', 'extraction', 'thread_key',
+    'thread_id', 'in_reply_to', 'refs', 'responded_at', 'response_sent', 'mailbox', 'cluster_id', 'latest',
+]
+# `latest` is bookkeeping (conversation head), not an EmailRow field
+SELECT_EMAIL = f"SELECT {', '.join('e.' + c for c in COLUMNS[:-1])} FROM emails e"
+# EmailRow field -> column, where they differ ("references" is an SQL keyword)
+FIELD_COLUMNS = {'references': 'refs'}
+
+# Statements are module constants so each connection's statement cache
+# (cached_statements) compiles them once and reuses the prepared form.
+# A stored id is updated in place (never deleted and re-inserted, so update triggers
+# fire and `latest` is left to MARK_LATEST); a second copy of a stored message_id is
+# dropped, so the row already holding it keeps its status.
+INSERT_EMAIL = f"""
+    INSERT INTO emails ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})
+    ON CONFLICT (id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:-1])}
+    ON CONFLICT (message_id) DO NOTHING
+"""
+PARENT_THREAD = "SELECT thread_key FROM emails WHERE message_id = ?"
+# newest member of each touched conversation becomes its head; ties go to the last write
+MARK_LATEST = """
+    UPDATE emails SET latest = (id = (
+        SELECT x.id FROM emails x WHERE x.thread_key = emails.thread_key
+        ORDER BY x.received_at DESC, x.rowid DESC LIMIT 1
+    ))
+    WHERE thread_key IN (SELECT value FROM json_each(?))
+"""
+LATEST_PER_THREAD = f"{SELECT_EMAIL} WHERE e.latest = 1"
+# The aging rate is a literal in the index expression; SLA_INDEX is recreated when it changes.
+# The query must spell the expression exactly as the index does for SQLite to use it.
+SLA_KEY = "(priority_score - {rate!r} * received_at)"
+SLA_INDEX = "CREATE INDEX emails_open_sla ON emails {sla_key} WHERE latest = 1 AND status != 'responded'"
+LIST_OPEN = f"{LATEST_PER_THREAD} AND e.status != 'responded' ORDER BY {{sla_key}} DESC LIMIT ?"
+LIST_ANSWERED = f"{LATEST_PER_THREAD} AND e.status = 'responded' ORDER BY e.priority_score DESC LIMIT ?"
+PENDING = """
+    AND e.status != 'responded'
+    AND NOT EXISTS (SELECT 1 FROM responses r WHERE r.email_id = e.id AND r.final = 0)
+    AND (e.cluster_id IS NULL OR e.cluster_id = e.id)
+"""
+LIST_PENDING = f"{LATEST_PER_THREAD} {PENDING} ORDER BY {{sla_key}} DESC LIMIT ?"
+# walks the partial SLA index, which holds only open conversation heads
+COUNT_PENDING = f"SELECT COUNT(*) FROM emails e WHERE e.latest = 1 {PENDING}"
+GET_EMAIL = f"{SELECT_EMAIL} WHERE e.id = ?"
+FIND_BY_MESSAGE_ID = f"{SELECT_EMAIL} WHERE e.message_id = ?"
+THREAD_MEMBERS = f"""{SELECT_EMAIL}
+    WHERE e.thread_key = (SELECT thread_key FROM emails WHERE id = ?) ORDER BY e.received_at
+"""
+THREAD_SIZES = """
+    SELECT thread_key, COUNT(*) FROM emails WHERE thread_key IN (SELECT value FROM json_each(?)) GROUP BY thread_key
+"""
+LATEST_OPEN_DRAFT = """
+    SELECT id, email_id, draft, model, prompt_tokens, created_at, final FROM responses
+    WHERE email_id = ? AND final = 0 ORDER BY created_at DESC, rowid DESC LIMIT 1
+"""
+STATS_SINCE = "SELECT COUNT(*) FROM emails WHERE received_at >= ?"
+STATS_GROUPS = "SELECT status, priority, sentiment, COUNT(*) FROM emails GROUP BY status, priority, sentiment"
+STATS_RESPONSE_TIME = """
+    SELECT AVG((responded_at - received_at) / 60.0) FROM emails
+    WHERE status = 'responded' AND responded_at IS NOT NULL AND received_at
+"""
+LSH_LOOKUP = """
+    SELECT b.key, c.id, c.signature, c.received_at FROM lsh_buckets b JOIN clusters c ON c.id = b.cluster_id
+    WHERE b.key IN (SELECT value FROM json_each(?))
+"""
+INSERT_CLUSTER = "INSERT OR REPLACE INTO clusters (id, signature, received_at) VALUES (?, ?, ?)"
+# the newest cluster takes the bucket; its received_at is copied so pruning walks an append-mostly index
+CLAIM_BUCKET = "INSERT OR REPLACE INTO lsh_buckets (key, cluster_id, received_at) VALUES (?, ?, ?)"
+PRUNE_BUCKETS = "DELETE FROM lsh_buckets WHERE received_at < ?"
+PRUNE_CLUSTERS = "DELETE FROM clusters WHERE received_at < ?"
+CLUSTER_MEMBERS = f"{SELECT_EMAIL} WHERE e.cluster_id = ? ORDER BY e.received_at"
+LIST_CLUSTERS = """
+    SELECT cluster_id, COUNT(*) AS size FROM emails WHERE cluster_id IS NOT NULL
+    GROUP BY cluster_id HAVING size >= ? ORDER BY size DESC, cluster_id DESC LIMIT ?
+"""
+# keyset pages in rowid order, so an export never holds more than one page
+EXPORT_PAGE = f"SELECT {', '.join('e.' + c for c in COLUMNS[:-1])}, e.rowid FROM emails e WHERE e.rowid > ?{{where}} ORDER BY e.rowid LIMIT ?"
+LATEST_OPEN_DRAFTS = """
+    SELECT id, email_id, draft, model, prompt_tokens, created_at, final FROM responses
+    WHERE final = 0 AND email_id IN (SELECT value FROM json_each(?)) ORDER BY created_at, rowid
+"""
+INSERT_RESPONSE = """
+    INSERT OR REPLACE INTO responses (id, email_id, draft, model, prompt_tokens, created_at, final)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _db_value(name: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if name == 'extraction':
+        return json.dumps(asdict(value))
+    if name == 'references':
+        return json.dumps(list(value))
+    if name == 'response_sent':
+        return int(bool(value))
+    if isinstance(value, (Status, Priority, Sentiment, Category)):
+        return value.value
+    return value
+
+
+def _params(row: EmailRow) -> tuple:
+    return (
+        row.id, row.message_id, row.sender, row.subject, row.received_at, row.body, row.clean_body,
+        row.sentiment.value, row.priority.value, row.priority_score,
+        row.matched_category.value if row.matched_category else None, row.status.value,
+        _db_value('extraction', row.extraction), row.thread_key, row.thread_id, row.in_reply_to,
+        _db_value('references', row.references or ()), row.responded_at, int(bool(row.response_sent)),
+        row.mailbox, row.cluster_id, 0,
+    )
+
+
+def _row(values: tuple) -> EmailRow:
+    (eid, message_id, sender, subject, received_at, body, clean_body, sentiment, priority,
+     priority_score, category, status, extraction, thread_key, thread_id, in_reply_to, refs,
+     responded_at, response_sent, mailbox, cluster_id) = values
+    return EmailRow(
+        id=eid,
+        sender=sender,
+        subject=subject,
+        received_at=received_at,
+        body=body,
+        clean_body=clean_body,
+        message_id=message_id,
+        sentiment=Sentiment(sentiment),
+        priority=Priority(priority),
+        priority_score=priority_score,
+        matched_category=Category(category) if category else None,
+        status=Status(status),
+        extraction=Extraction.from_doc(json.loads(extraction)) if extraction else None,
+        thread_key=thread_key,
+        thread_id=thread_id,
+        in_reply_to=in_reply_to,
+        references=tuple(json.loads(refs)) if refs else (),
+        responded_at=responded_at,
+        response_sent=bool(response_sent),
+        mailbox=mailbox,
+        cluster_id=cluster_id,
+    )
+
+
+def _response(values: tuple) -> Dict[str, Any]:
+    rid, email_id, draft, model, prompt_tokens, created_at, final = values
+    return {
+        'id': rid,
+        'email_id': email_id,
+        'draft': draft,
+        'model': model,
+        'prompt_tokens': json.loads(prompt_tokens) if prompt_tokens else None,
+        'created_at': created_at,
+        'final': bool(final),
+    }
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    """BEGIN IMMEDIATE takes the write lock up front, so a transaction never has to upgrade and deadlock"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class SqliteStore(StoreBackend):
+    name = 'sqlite'
+
+    def __init__(self, path: str, busy_timeout_seconds: float = 30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout_seconds
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        with _transaction(conn):
+            for statement in TABLES:
+                conn.execute(statement)
+            for statement in INDEXES + TRIGGERS:
+                conn.execute(statement)
+            sla_key = SLA_KEY.format(rate=aging_rate())
+            sla_index = SLA_INDEX.format(sla_key=sla_key)
+            # the expression embeds SCORE_AGING_PER_HOUR, so a changed setting rebuilds the index
+            current = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'emails_open_sla'").fetchone()
+            if current is None or current[0] != sla_index:
+                conn.execute("DROP INDEX IF EXISTS emails_open_sla")
+                conn.execute(sla_index)
+        self._list_open = LIST_OPEN.format(sla_key=sla_key)
+        self._list_pending = LIST_PENDING.format(sla_key=sla_key)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; autocommit mode, transactions are explicit"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            try:
+                conn.execute("SELECT ln(1), ceil(1)")
+            except sqlite3.OperationalError:
+                # SQLite built without math functions: the rollup triggers get Python's
+                conn.create_function('ln', 1, math.log, deterministic=True)
+                conn.create_function('ceil', 1, math.ceil, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _rows(self, sql: str, params: Iterable[Any] = ()) -> List[EmailRow]:
+        return [_row(values) for values in self._conn().execute(sql, tuple(params))]
+
+    def clear(self):
+        conn = self._conn()
+        with _transaction(conn):
+            conn.execute("DELETE FROM emails")
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM clusters")
+            conn.execute("DELETE FROM lsh_buckets")
+            conn.execute("DELETE FROM rollups")
+
+    def _write_batch(self, conn: sqlite3.Connection, rows: List[EmailRow]):
+        # replies can point at messages earlier in the same batch, which are not inserted yet
+        batch_threads: Dict[str, str] = {}
+
+        def parent_thread(ref: str) -> str | None:
+            if ref in batch_threads:
+                return batch_threads[ref]
+            found = conn.execute(PARENT_THREAD, (ref,)).fetchone()
+            return found[0] if found else None
+
+        for row in rows:
+            if not row.thread_key:
+                row.thread_key = _thread_key(row, parent_thread)
+            if row.message_id:
+                batch_threads[row.message_id] = row.thread_key
+        conn.executemany(INSERT_EMAIL, [_params(row) for row in rows])
+        conn.execute(MARK_LATEST, (json.dumps(list({row.thread_key for row in rows})),))
+
+    def upsert_email(self, row: EmailRow) -> str:
+        self.upsert_many([row])
+        return row.id
+
+    def upsert_many(self, rows: List[EmailRow]) -> int:
+        """All rows in one transaction, inserted BATCH_SIZE at a time with executemany"""
+        conn = self._conn()
+        with _transaction(conn):
+            for start in range(0, len(rows), BATCH_SIZE):
+                self._write_batch(conn, rows[start:start + BATCH_SIZE])
+        return len(rows)
+
+    def restore_emails(self, rows: List[EmailRow]):
+        self.upsert_many(rows)
+
+    def get_email(self, eid: str) -> EmailRow | None:
+        rows = self._rows(GET_EMAIL, (eid,))
+        return rows[0] if rows else None
+
+    def find_by_message_id(self, message_id: str) -> EmailRow | None:
+        rows = self._rows(FIND_BY_MESSAGE_ID, (message_id,))
+        return rows[0] if rows else None
+
+    def thread_members(self, eid: str) -> List[EmailRow]:
+        return self._rows(THREAD_MEMBERS, (eid,))
+
+    def thread_sizes(self, thread_keys: List[str]) -> Dict[str, int]:
+        return dict(self._conn().execute(THREAD_SIZES, (json.dumps(list(set(thread_keys))),)))
+
+    def latest_per_thread(self) -> List[EmailRow]:
+        return self._rows(LATEST_PER_THREAD)
+
+    def list_emails_sorted(self, limit: int) -> List[EmailRow]:
+        # the top `limit` of each index, merged on the score at this moment
+        now = time.time()
+        ranked = heapq.merge(self._rows(self._list_open, (limit,)), self._rows(LIST_ANSWERED, (limit,)),
+                             key=lambda row: effective_score(row, now), reverse=True)
+        return list(itertools.islice(ranked, limit))
+
+    def list_pending_without_draft(self, limit: int | None) -> List[EmailRow]:
+        return self._rows(self._list_pending, (limit or -1,))
+
+    def load_full(self, rows: List[EmailRow]) -> List[EmailRow]:
+        return rows
+
+    def update_email(self, eid: str, fields: Dict[str, Any]):
+        if not fields:
+            return
+        assignments = ', '.join(f"{FIELD_COLUMNS.get(name, name)} = ?" for name in fields)
+        params = [_db_value(name, value) for name, value in fields.items()] + [eid]
+        self._conn().execute(f"UPDATE emails SET {assignments} WHERE id = ?", params)
+
+    def transition_status(self, eid: str, expected: Iterable[Status], new: Status,
+                          fields: Dict[str, Any]) -> bool:
+        expected = [s.value for s in expected]
+        fields = {'status': new, **fields}
+        assignments = ', '.join(f"{FIELD_COLUMNS.get(name, name)} = ?" for name in fields)
+        params = [_db_value(name, value) for name, value in fields.items()] + [eid] + expected
+        cursor = self._conn().execute(
+            f"UPDATE emails SET {assignments} WHERE id = ? AND status IN ({', '.join('?' * len(expected))})",
+            params,
+        )
+        return cursor.rowcount == 1
+
+    def add_response(self, response: Dict[str, Any]):
+        self._conn().execute(INSERT_RESPONSE, (
+            response['id'], response['email_id'], response['draft'], response['model'],
+            json.dumps(response['prompt_tokens']) if response.get('prompt_tokens') else None,
+            response['created_at'], int(response.get('final', False)),
+        ))
+
+    def restore_response(self, response: Dict[str, Any]):
+        self.add_response(response)
+
+    def latest_open_draft(self, email_id: str) -> Dict[str, Any] | None:
+        found = self._conn().execute(LATEST_OPEN_DRAFT, (email_id,)).fetchone()
+        return _response(found) if found else None
+
+    def count_emails(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+
+    def count_pending_without_draft(self) -> int:
+        return self._conn().execute(COUNT_PENDING).fetchone()[0]
+
+    def has_mailbox_emails(self, mailbox: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM emails WHERE mailbox = ? LIMIT 1", (mailbox,)).fetchone() is not None
+
+    def compute_stats(self) -> Dict[str, Any]:
+        """Same result as store._stats, from aggregate queries over the narrow indexes"""
+        conn = self._conn()
+        last24 = int(time.time()) - 24 * 3600
+        total_24 = conn.execute(STATS_SINCE, (last24,)).fetchone()[0]
+        total = urgent = responded = 0
+        sentiment_counts: Dict[str, int] = {}
+        for status, priority, sentiment, count in conn.execute(STATS_GROUPS):
+            total += count
+            if priority == Priority.URGENT.value:
+                urgent += count
+            if status == Status.RESPONDED.value:
+                responded += count
+            sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + count
+        avg_response_time = conn.execute(STATS_RESPONSE_TIME).fetchone()[0]
+        return {
+            'total_last_24h': total_24,
+            'urgent': urgent,
+            'responded': responded,
+            'pending': total - responded,
+            'sentiment_counts': sentiment_counts,
+            'avg_response_time_minutes': round(avg_response_time, 2) if avg_response_time else None,
+            'total_emails': total,
+        }
+
+    def lsh_lookup(self, keys: List[int]) -> Dict[int, Dict[str, Any]]:
+        return {
+            key: {'id': cid, 'signature': signature, 'received_at': received_at}
+            for key, cid, signature, received_at in self._conn().execute(LSH_LOOKUP, (json.dumps(keys),))
+        }
+
+    def add_clusters(self, clusters: List[Dict[str, Any]], window: int):
+        """One transaction: the clusters, their bucket claims (in order), then clusters past the window"""
+        conn = self._conn()
+        with _transaction(conn):
+            conn.executemany(INSERT_CLUSTER, [(c['id'], c['signature'], c['received_at']) for c in clusters])
+            conn.executemany(CLAIM_BUCKET, [(key, c['id'], c['received_at']) for c in clusters for key in c['keys']])
+            cutoff = max(c['received_at'] for c in clusters) - window
+            conn.execute(PRUNE_BUCKETS, (cutoff,))
+            conn.execute(PRUNE_CLUSTERS, (cutoff,))
+
+    def iter_emails(self, filters: Dict[str, Any], since: int | None, until: int | None,
+                    batch_size: int) -> Iterator[List[EmailRow]]:
+        where = ''.join(f" AND e.{FIELD_COLUMNS.get(name, name)} = ?" for name in filters)
+        params = [_db_value(name, value) for name, value in filters.items()]
+        if since is not None:
+            where += " AND e.received_at >= ?"
+            params.append(since)
+        if until is not None:
+            where += " AND e.received_at < ?"
+            params.append(until)
+        sql = EXPORT_PAGE.format(where=where)
+        last = 0
+        while True:
+            page = self._conn().execute(sql, (last, *params, batch_size)).fetchall()
+            if not page:
+                return
+            last = page[-1][-1]
+            yield [_row(values[:-1]) for values in page]
+
+    def latest_open_drafts(self, email_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        # oldest first, so the newest draft of each email is the one kept
+        return {values[1]: _response(values)
+                for values in self._conn().execute(LATEST_OPEN_DRAFTS, (json.dumps(email_ids),))}
+
+    def rollups(self, resolution: int, start: int, end: int) -> Dict[int, rollups.Bucket]:
+        buckets: Dict[int, rollups.Bucket] = {}
+        for bucket_start, field, key, amount in self._conn().execute(ROLLUP_RANGE, (resolution, start, end)):
+            buckets.setdefault(bucket_start, {})[field, key] = amount
+        return buckets
+
+    def cluster_members(self, cluster_id: str) -> List[EmailRow]:
+        return self._rows(CLUSTER_MEMBERS, (cluster_id,))
+
+    def list_clusters(self, min_size: int, limit: int) -> List[Dict[str, Any]]:
+        return [{'id': cid, 'size': size} for cid, size in self._conn().execute(LIST_CLUSTERS, (min_size, limit))]
@@ -1,93 +1,138 @@
 from __future__ import annotations
-from typing import Dict, Any, List
-from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Callable
+from dataclasses import replace
+from datetime import datetime
+import heapq
+import re
+from itertools import repeat
+import threading
+import time
 import uuid
+from ..config import get_settings
+from .records import EmailRow, Extraction, Status, Priority, Sentiment, Category, LAZY_FIELDS, to_epoch
+from .scoring import SlaQueue, is_open
+from . import rollups
 
-# In-memory store for demo (optionally persist to JSON later)
-EMAILS: Dict[str, Dict[str, Any]] = {}
+# Store backends: "memory" keeps everything in the module-level dicts below (one
+# copy per process; services/snapshot.py persists it), "sqlite" keeps a WAL
+# database file that every worker process shares (services/sqlite_store.py).
+# The rest of the app only uses the module-level functions at the bottom.
+
+# In-memory store; services/snapshot.py persists it as columnar snapshots plus a change log
+EMAILS: Dict[str, EmailRow] = {}
 RESPONSES: Dict[str, Dict[str, Any]] = {}
+# email_id -> id of its most recent open (non-final) draft
+RESPONSE_INDEX: Dict[str, str] = {}
+# Conversation index: thread key -> member email ids, and the newest member per thread
+THREADS: Dict[str, List[str]] = {}
+THREAD_LATEST: Dict[str, str] = {}
+# message_id header -> email id, for dedupe and In-Reply-To resolution
+MESSAGE_INDEX: Dict[str, str] = {}
+# Near-duplicate clusters (services/clustering.py): cluster id -> {id, signature, received_at, keys}
+# for clusters started inside the window, LSH bucket key -> cluster id, and cluster id -> member ids
+CLUSTERS: Dict[str, Dict[str, Any]] = {}
+LSH_BUCKETS: Dict[int, str] = {}
+CLUSTER_MEMBERS: Dict[str, Dict[str, None]] = {}
+# Analytics rollups (services/rollups.py): resolution -> bucket start -> {(field, key): amount}
+ROLLUPS: Dict[int, Dict[int, rollups.Bucket]] = {resolution: {} for resolution in rollups.RESOLUTIONS}
 
+# Called as listener(op, payload) after every mutation made by this process. 'upsert'
+# passes the EmailRow; 'update', 'response', 'clusters' and 'clear' pass plain dicts.
+CHANGE_LISTENERS: List[Callable[[str, Any], None]] = []
+# Restored emails keep bodies and extra fields on disk until first read (see snapshot.BodyBlob)
+BODY_SOURCE = None
+BODY_LOCK = threading.Lock()
+# Held by MemoryStore around every mutation and multi-structure read, and by the snapshot checkpoint
+# while it copies the dicts; reentrant so transition_status can call update_email
+STORE_LOCK = threading.RLock()
 
-def clear_all_data():
-    """Clear all stored emails and responses - useful for testing"""
-    global EMAILS, RESPONSES
-    EMAILS.clear()
-    RESPONSES.clear()
-    return {"cleared_emails": True, "cleared_responses": True}
+REPLY_PREFIX_REGEX = re.compile(r"^\s*((re|fwd?|aw)\s*:\s*)+", re.IGNORECASE)
 
+# Statuses a reply can still be sent from; SENDING is held by whoever claimed the send
+SENDABLE_STATUSES = (Status.NEW, Status.PENDING, Status.PROCESSED)
 
-def upsert_email(doc: Dict[str, Any]) -> str:
-    eid = doc.get('id') or doc.get('_id') or str(uuid.uuid4())
-    doc['id'] = eid
-    EMAILS[eid] = doc
-    return eid
+# Converters applied by update_email so callers can pass API-style values
+_FIELD_TYPES: Dict[str, Callable[[Any], Any]] = {
+    'status': Status,
+    'priority': Priority,
+    'sentiment': Sentiment,
+    'matched_category': lambda v: Category(v) if v else None,
+    'received_at': to_epoch,
+    'responded_at': to_epoch,
+    'extraction': lambda v: v if isinstance(v, Extraction) else Extraction.from_doc(v),
+    'references': lambda v: tuple(v or ()),
+}
 
 
-def list_emails_sorted(limit: int = 50) -> List[Dict[str, Any]]:
-    return sorted(EMAILS.values(), key=lambda d: d.get('priority_score', 0), reverse=True)[:limit]
+def _emit(op: str, payload: Any):
+    for listener in CHANGE_LISTENERS:
+        try:
+            listener(op, payload)
+        except Exception as e:
+            print(f"Store listener failed on {op}: {e}")
 
 
-def get_email(eid: str) -> Dict[str, Any] | None:
-    return EMAILS.get(eid)
+def _convert(fields: Dict[str, Any]) -> Dict[str, Any]:
+    converted = {}
+    for name, value in fields.items():
+        convert = _FIELD_TYPES.get(name)
+        converted[name] = convert(value) if convert else value
+    return converted
 
 
-def mark_status(eid: str, status: str):
-    if eid in EMAILS:
-        EMAILS[eid]['status'] = status
+def _thread_key(row: EmailRow, parent_thread: Callable[[str], str | None]) -> str:
+    """Gmail threadId, else the thread of the message it replies to, else sender + base subject"""
+    if row.thread_id:
+        return f"gmail:{row.thread_id}"
+    refs = [row.in_reply_to] + list(reversed(row.references or ()))
+    for ref in refs:
+        key = parent_thread(ref) if ref else None
+        if key:
+            return key
+    subject = REPLY_PREFIX_REGEX.sub('', row.subject).strip().lower()
+    return f"subj:{row.sender.lower()}:{subject}"
+
 
+def _is_cluster_member(row: EmailRow) -> bool:
+    """In a cluster but not its first email, so the first email's draft answers it"""
+    return row.cluster_id is not None and row.cluster_id != row.id
 
-def add_response(email_id: str, draft: str, model: str = 'placeholder') -> str:
-    rid = str(uuid.uuid4())
-    RESPONSES[rid] = {
-        'id': rid,
+
+def _new_response(email_id: str, draft: str, model: str, prompt_tokens: Dict[str, int] | None) -> Dict[str, Any]:
+    return {
+        'id': str(uuid.uuid4()),
         'email_id': email_id,
         'draft': draft,
         'model': model,
+        'prompt_tokens': prompt_tokens,
         'created_at': datetime.utcnow().isoformat(),
         'final': False
     }
-    return rid
 
 
-def compute_stats():
-    now = datetime.utcnow()
-    last24 = now - timedelta(hours=24)
-    emails = list(EMAILS.values())
-    
-    total_24 = 0
-    for e in emails:
-        received_str = e.get('received_at')
-        if received_str and isinstance(received_str, str):
-            try:
-                received_dt = datetime.fromisoformat(received_str.replace('Z', '+00:00'))
-                if received_dt >= last24:
-                    total_24 += 1
-            except (ValueError, TypeError):
-                continue
-    
-    urgent = sum(1 for e in emails if e.get('priority') == 'urgent')
-    responded = sum(1 for e in emails if e.get('status') == 'responded')
-    pending = sum(1 for e in emails if e.get('status') != 'responded')
-    
+def _stats(emails: Iterable[EmailRow]) -> Dict[str, Any]:
+    now = int(time.time())
+    last24 = now - 24 * 3600
+    emails = list(emails)
+
+    total_24 = sum(1 for e in emails if e.received_at >= last24)
+    urgent = sum(1 for e in emails if e.priority is Priority.URGENT)
+    responded = sum(1 for e in emails if e.status is Status.RESPONDED)
+    pending = len(emails) - responded
+
     # Calculate response time for responded emails
-    response_times = []
-    for e in emails:
-        if e.get('status') == 'responded' and e.get('responded_at'):
-            try:
-                received_dt = datetime.fromisoformat(e.get('received_at', '').replace('Z', '+00:00'))
-                responded_dt = datetime.fromisoformat(e.get('responded_at', '').replace('Z', '+00:00'))
-                diff_minutes = (responded_dt - received_dt).total_seconds() / 60
-                response_times.append(diff_minutes)
-            except (ValueError, TypeError):
-                continue
-    
+    response_times = [
+        (e.responded_at - e.received_at) / 60
+        for e in emails
+        if e.status is Status.RESPONDED and e.responded_at is not None and e.received_at
+    ]
     avg_response_time = sum(response_times) / len(response_times) if response_times else None
-    
+
     sentiment_counts = {}
     for e in emails:
-        s = e.get('sentiment', 'neutral')
+        s = e.sentiment.value
         sentiment_counts[s] = sentiment_counts.get(s, 0) + 1
-    
+
     return {
         'total_last_24h': total_24,
         'urgent': urgent,
@@ -97,3 +142,611 @@ def compute_stats():
         'avg_response_time_minutes': round(avg_response_time, 2) if avg_response_time else None,
         'total_emails': len(emails)
     }
+
+
+class StoreBackend:
+    """Interface every store backend implements; see MemoryStore and sqlite_store.SqliteStore"""
+    name = 'base'
+
+    def clear(self) -> None: raise NotImplementedError
+    def upsert_email(self, row: EmailRow) -> str: raise NotImplementedError
+    def upsert_many(self, rows: List[EmailRow]) -> int: raise NotImplementedError
+    def restore_emails(self, rows: List[EmailRow]) -> None: raise NotImplementedError
+    def get_email(self, eid: str) -> EmailRow | None: raise NotImplementedError
+    def find_by_message_id(self, message_id: str) -> EmailRow | None: raise NotImplementedError
+    def thread_members(self, eid: str) -> List[EmailRow]: raise NotImplementedError
+    def thread_sizes(self, thread_keys: List[str]) -> Dict[str, int]: raise NotImplementedError
+    def latest_per_thread(self) -> List[EmailRow]: raise NotImplementedError
+    def list_emails_sorted(self, limit: int) -> List[EmailRow]: raise NotImplementedError
+    def list_pending_without_draft(self, limit: int | None) -> List[EmailRow]: raise NotImplementedError
+    def load_full(self, rows: List[EmailRow]) -> List[EmailRow]: raise NotImplementedError
+    def update_email(self, eid: str, fields: Dict[str, Any]) -> None: raise NotImplementedError
+
+    def transition_status(self, eid: str, expected: Iterable[Status], new: Status,
+                          fields: Dict[str, Any]) -> bool:
+        """Set ``new`` (and ``fields``) only if the current status is one of ``expected``; atomic"""
+        raise NotImplementedError
+
+    def add_response(self, response: Dict[str, Any]) -> None: raise NotImplementedError
+    def restore_response(self, response: Dict[str, Any]) -> None: raise NotImplementedError
+    def latest_open_draft(self, email_id: str) -> Dict[str, Any] | None: raise NotImplementedError
+    def count_emails(self) -> int: raise NotImplementedError
+    def count_pending_without_draft(self) -> int: raise NotImplementedError
+    def has_mailbox_emails(self, mailbox: str) -> bool: raise NotImplementedError
+    def compute_stats(self) -> Dict[str, Any]: raise NotImplementedError
+
+    def lsh_lookup(self, keys: List[int]) -> Dict[int, Dict[str, Any]]: raise NotImplementedError
+
+    def add_clusters(self, clusters: List[Dict[str, Any]], window: int) -> None:
+        """Record new clusters, in order; each takes over its LSH buckets, and clusters older than the window go"""
+        raise NotImplementedError
+
+    def cluster_members(self, cluster_id: str) -> List[EmailRow]: raise NotImplementedError
+    def list_clusters(self, min_size: int, limit: int) -> List[Dict[str, Any]]: raise NotImplementedError
+    def rollups(self, resolution: int, start: int, end: int) -> Dict[int, rollups.Bucket]:
+        """Rollup buckets of one resolution starting in [start, end), by bucket start"""
+        raise NotImplementedError
+    def iter_emails(self, filters: Dict[str, Any], since: int | None, until: int | None,
+                    batch_size: int) -> Iterator[List[EmailRow]]:
+        """Every matching email with its body, in storage order, batch_size at a time"""
+        raise NotImplementedError
+    def latest_open_drafts(self, email_ids: List[str]) -> Dict[str, Dict[str, Any]]: raise NotImplementedError
+
+
+class MemoryStore(StoreBackend):
+    """The module-level dicts; fastest, but private to one process.
+
+    Every method that writes, or reads more than one structure, holds
+    STORE_LOCK, so handler threads, pre-drafting, the outbox worker and the
+    snapshot checkpoint never see the indexes out of step with EMAILS.
+    """
+    name = 'memory'
+
+    def __init__(self):
+        # conversation heads in SLA order (services/scoring.py)
+        self.queue = SlaQueue(self._head)
+        # ids list_pending_without_draft would return, kept as rows change so counting them is O(1)
+        self._pending: set = set()
+        # mailbox -> emails stored from it, so a sync can tell whether its cursor still means anything
+        self._mailbox_counts: Dict[str, int] = {}
+        # newest cluster start seen, and the cluster count after the last prune
+        self._cluster_clock = 0
+        self._clusters_pruned_at = 0
+
+    def clear(self):
+        with STORE_LOCK:
+            EMAILS.clear()
+            RESPONSES.clear()
+            RESPONSE_INDEX.clear()
+            THREADS.clear()
+            THREAD_LATEST.clear()
+            MESSAGE_INDEX.clear()
+            CLUSTERS.clear()
+            LSH_BUCKETS.clear()
+            CLUSTER_MEMBERS.clear()
+            for table in ROLLUPS.values():
+                table.clear()
+            self._cluster_clock = 0
+            self._clusters_pruned_at = 0
+            self.queue.clear()
+            self._pending.clear()
+            self._mailbox_counts.clear()
+
+    def _head(self, eid: str) -> EmailRow | None:
+        row = EMAILS.get(eid)
+        return row if row is not None and THREAD_LATEST.get(row.thread_key) == eid else None
+
+    def _count_mailbox(self, mailbox: str | None, change: int):
+        if mailbox is None:
+            return
+        count = self._mailbox_counts.get(mailbox, 0) + change
+        if count:
+            self._mailbox_counts[mailbox] = count
+        else:
+            self._mailbox_counts.pop(mailbox, None)
+
+    def _track_pending(self, eid: str):
+        row = self._head(eid)
+        if row is not None and is_open(row) and eid not in RESPONSE_INDEX and not _is_cluster_member(row):
+            self._pending.add(eid)
+        else:
+            self._pending.discard(eid)
+
+    def _parent_thread(self, ref: str) -> str | None:
+        parent = EMAILS.get(MESSAGE_INDEX.get(ref, ''))
+        return parent.thread_key if parent else None
+
+    def _index_cluster(self, eid: str, old: str | None, new: str | None):
+        if old == new:
+            return
+        if old is not None:
+            members = CLUSTER_MEMBERS.get(old)
+            if members is not None:
+                members.pop(eid, None)
+                if not members:
+                    del CLUSTER_MEMBERS[old]
+        if new is not None:
+            CLUSTER_MEMBERS.setdefault(new, {})[eid] = None
+
+    def _rollup(self, row: EmailRow, sign: int):
+        parts = rollups.contributions(row)
+        for resolution, table in ROLLUPS.items():
+            bucket = table.setdefault(rollups.bucket_start(row.received_at, resolution), {})
+            for field, key, amount in parts:
+                bucket[field, key] = bucket.get((field, key), 0) + sign * amount
+
+    def _rollup_many(self, rows: Iterable[EmailRow]):
+        """_rollup for many rows; rows that add the same contributions to the same buckets are counted once"""
+        finest = min(ROLLUPS)
+        groups: Dict[tuple, list] = {}
+        for row in rows:
+            answered = row.status is Status.RESPONDED and row.responded_at is not None
+            key = (row.received_at - row.received_at % finest, row.matched_category, row.sentiment, row.priority,
+                   row.responded_at - row.received_at if answered else None)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [row, 1]
+            else:
+                group[1] += 1
+        for row, count in groups.values():
+            parts = rollups.contributions(row)
+            for resolution, table in ROLLUPS.items():
+                bucket = table.setdefault(rollups.bucket_start(row.received_at, resolution), {})
+                for field, key, amount in parts:
+                    bucket[field, key] = bucket.get((field, key), 0) + count * amount
+
+    def upsert_email(self, row: EmailRow) -> str:
+        with STORE_LOCK:
+            eid = row.id
+            row.thread_key = row.thread_key or _thread_key(row, self._parent_thread)
+            previous = EMAILS.get(eid)
+            EMAILS[eid] = row
+            self._index_cluster(eid, previous.cluster_id if previous else None, row.cluster_id)
+            if previous is not row:
+                if previous is not None:
+                    self._rollup(previous, -1)
+                    self._count_mailbox(previous.mailbox, -1)
+                self._rollup(row, 1)
+                self._count_mailbox(row.mailbox, 1)
+            if row.message_id:
+                MESSAGE_INDEX[row.message_id] = eid
+            members = THREADS.setdefault(row.thread_key, [])
+            if eid not in members:
+                members.append(eid)
+            latest = EMAILS.get(THREAD_LATEST.get(row.thread_key, ''))
+            if latest is None or latest.id == eid or row.received_at >= latest.received_at:
+                THREAD_LATEST[row.thread_key] = eid
+                if latest is not None and latest.id != eid:
+                    self.queue.discard(latest.id)
+                    self._pending.discard(latest.id)
+                self.queue.push(row)
+            self._track_pending(eid)
+            return eid
+
+    def upsert_many(self, rows: List[EmailRow]) -> int:
+        with STORE_LOCK:
+            for row in rows:
+                self.upsert_email(row)
+            return len(rows)
+
+    def restore_emails(self, rows: List[EmailRow]):
+        """Load rows (a snapshot, oldest write first) into an empty store, building each index in one pass"""
+        with STORE_LOCK:
+            for row in rows:
+                eid = row.id
+                row.thread_key = row.thread_key or _thread_key(row, self._parent_thread)
+                EMAILS[eid] = row
+                if row.message_id:
+                    MESSAGE_INDEX[row.message_id] = eid
+                THREADS.setdefault(row.thread_key, []).append(eid)
+                latest = EMAILS.get(THREAD_LATEST.get(row.thread_key, ''))
+                if latest is None or row.received_at >= latest.received_at:
+                    THREAD_LATEST[row.thread_key] = eid
+                if row.cluster_id is not None:
+                    CLUSTER_MEMBERS.setdefault(row.cluster_id, {})[eid] = None
+                self._count_mailbox(row.mailbox, 1)
+            self._rollup_many(rows)
+            heads = [EMAILS[eid] for eid in THREAD_LATEST.values()]
+            self.queue.rebuild(heads)
+            self._pending.update(row.id for row in heads
+                                 if is_open(row) and row.id not in RESPONSE_INDEX and not _is_cluster_member(row))
+
+    def get_email(self, eid: str) -> EmailRow | None:
+        row = EMAILS.get(eid)
+        if row is not None and row.body_row is not None:
+            _load_body(row)
+        return row
+
+    def find_by_message_id(self, message_id: str) -> EmailRow | None:
+        with STORE_LOCK:
+            return EMAILS.get(MESSAGE_INDEX.get(message_id, ''))
+
+    def thread_members(self, eid: str) -> List[EmailRow]:
+        with STORE_LOCK:
+            row = EMAILS.get(eid)
+            if not row:
+                return []
+            members = [EMAILS[m] for m in THREADS.get(row.thread_key, []) if m in EMAILS]
+            return sorted(members, key=lambda r: r.received_at)
+
+    def thread_sizes(self, thread_keys: List[str]) -> Dict[str, int]:
+        with STORE_LOCK:
+            return {key: sum(1 for m in THREADS.get(key, ()) if m in EMAILS) for key in set(thread_keys)}
+
+    def latest_per_thread(self) -> List[EmailRow]:
+        with STORE_LOCK:
+            return [EMAILS[eid] for eid in THREAD_LATEST.values() if eid in EMAILS]
+
+    def list_emails_sorted(self, limit: int) -> List[EmailRow]:
+        with STORE_LOCK:
+            return self.queue.top(limit)
+
+    def list_pending_without_draft(self, limit: int | None) -> List[EmailRow]:
+        with STORE_LOCK:
+            return self.queue.top(limit or None, open_only=True,
+                                  skip=lambda r: r.id in RESPONSE_INDEX or _is_cluster_member(r))
+
+    def load_full(self, rows: List[EmailRow]) -> List[EmailRow]:
+        for row in rows:
+            if row.body_row is not None:
+                _load_body(row)
+        return rows
+
+    def update_email(self, eid: str, fields: Dict[str, Any]):
+        with STORE_LOCK:
+            row = EMAILS.get(eid)
+            if row is None:
+                return
+            if row.body_row is not None and any(name in LAZY_FIELDS for name in fields):
+                # load the stored copy first so a later checkpoint does not write back stale extras
+                _load_body(row)
+            if 'cluster_id' in fields:
+                self._index_cluster(eid, row.cluster_id, fields['cluster_id'])
+            if 'mailbox' in fields:
+                self._count_mailbox(row.mailbox, -1)
+                self._count_mailbox(fields['mailbox'], 1)
+            rolled = not rollups.ROLLUP_FIELDS.isdisjoint(fields)
+            if rolled:
+                self._rollup(row, -1)
+            for name, value in fields.items():
+                setattr(row, name, value)
+            if rolled:
+                self._rollup(row, 1)
+            if self._head(eid) is not None:
+                self.queue.push(row)
+            self._track_pending(eid)
+
+    def transition_status(self, eid: str, expected: Iterable[Status], new: Status,
+                          fields: Dict[str, Any]) -> bool:
+        with STORE_LOCK:
+            row = EMAILS.get(eid)
+            if row is None or row.status not in tuple(expected):
+                return False
+            self.update_email(eid, {'status': new, **fields})
+            return True
+
+    def add_response(self, response: Dict[str, Any]):
+        with STORE_LOCK:
+            RESPONSES[response['id']] = response
+            RESPONSE_INDEX[response['email_id']] = response['id']
+            self._pending.discard(response['email_id'])
+
+    def restore_response(self, response: Dict[str, Any]):
+        with STORE_LOCK:
+            RESPONSES[response['id']] = response
+            if not response.get('final', False):
+                RESPONSE_INDEX[response['email_id']] = response['id']
+                self._pending.discard(response['email_id'])
+
+    def latest_open_draft(self, email_id: str) -> Dict[str, Any] | None:
+        with STORE_LOCK:
+            rid = RESPONSE_INDEX.get(email_id)
+            response = RESPONSES.get(rid) if rid else None
+            if response and not response.get('final', False):
+                return response
+            return None
+
+    def count_emails(self) -> int:
+        return len(EMAILS)
+
+    def count_pending_without_draft(self) -> int:
+        return len(self._pending)
+
+    def has_mailbox_emails(self, mailbox: str) -> bool:
+        return mailbox in self._mailbox_counts
+
+    def compute_stats(self) -> Dict[str, Any]:
+        with STORE_LOCK:
+            return _stats(EMAILS.values())
+
+    def lsh_lookup(self, keys: List[int]) -> Dict[int, Dict[str, Any]]:
+        with STORE_LOCK:
+            found = {}
+            for key in LSH_BUCKETS.keys() & keys:
+                cluster = CLUSTERS.get(LSH_BUCKETS[key])
+                if cluster is not None:
+                    found[key] = cluster
+            return found
+
+    def add_clusters(self, clusters: List[Dict[str, Any]], window: int):
+        with STORE_LOCK:
+            for cluster in clusters:
+                cid = cluster['id']
+                CLUSTERS[cid] = cluster
+                self._cluster_clock = max(self._cluster_clock, cluster['received_at'])
+                LSH_BUCKETS.update(zip(cluster['keys'], repeat(cid)))
+            # drop clusters that no new email can join once the index has doubled, O(1) amortised
+            if len(CLUSTERS) > 2 * self._clusters_pruned_at + 1024:
+                cutoff = self._cluster_clock - window
+                for cid in [cid for cid, cluster in CLUSTERS.items() if cluster['received_at'] < cutoff]:
+                    del CLUSTERS[cid]
+                for key in [key for key, cid in LSH_BUCKETS.items() if cid not in CLUSTERS]:
+                    del LSH_BUCKETS[key]
+                self._clusters_pruned_at = len(CLUSTERS)
+
+    def iter_emails(self, filters: Dict[str, Any], since: int | None, until: int | None,
+                    batch_size: int) -> Iterator[List[EmailRow]]:
+        # a copy of the ids only, so ingest can go on while the export runs
+        with STORE_LOCK:
+            ids = list(EMAILS)
+        batch = []
+        for eid in ids:
+            row = EMAILS.get(eid)
+            if row is None or (since is not None and row.received_at < since) \
+                    or (until is not None and row.received_at >= until) \
+                    or any(getattr(row, name) != value for name, value in filters.items()):
+                continue
+            batch.append(_with_body(row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def latest_open_drafts(self, email_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        with STORE_LOCK:
+            drafts = {}
+            for eid in email_ids:
+                draft = self.latest_open_draft(eid)
+                if draft is not None:
+                    drafts[eid] = draft
+            return drafts
+
+    def rollups(self, resolution: int, start: int, end: int) -> Dict[int, rollups.Bucket]:
+        with STORE_LOCK:
+            table = ROLLUPS[resolution]
+            return {s: table[s] for s in range(start, end, resolution) if s in table}
+
+    def cluster_members(self, cluster_id: str) -> List[EmailRow]:
+        with STORE_LOCK:
+            members = [EMAILS[m] for m in CLUSTER_MEMBERS.get(cluster_id, ()) if m in EMAILS]
+            return sorted(members, key=lambda r: r.received_at)
+
+    def list_clusters(self, min_size: int, limit: int) -> List[Dict[str, Any]]:
+        with STORE_LOCK:
+            sizes = ((len(members), cid) for cid, members in CLUSTER_MEMBERS.items() if len(members) >= min_size)
+            return [{'id': cid, 'size': size} for size, cid in heapq.nlargest(limit, sizes)]
+
+
+def _load_body(row: EmailRow):
+    with BODY_LOCK:
+        if row.body_row is None or BODY_SOURCE is None:
+            return
+        fields = BODY_SOURCE.read(row.body_row)
+        # fields changed since the snapshot was written win over the stored copy
+        for name, value in fields.items():
+            if getattr(row, name) is None:
+                convert = _FIELD_TYPES.get(name)
+                setattr(row, name, convert(value) if convert else value)
+        row.body_row = None
+
+
+def _with_body(row: EmailRow) -> EmailRow:
+    """The row with its body, leaving a restored row's body on disk (a full export would otherwise load them all)"""
+    with BODY_LOCK:
+        if row.body_row is None or BODY_SOURCE is None:
+            return row
+        fields = {name: value for name, value in BODY_SOURCE.read(row.body_row).items() if getattr(row, name) is None}
+    return replace(row, **_convert(fields), body_row=None)
+
+
+_backend: StoreBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StoreBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                settings = get_settings()
+                if settings.store_backend == 'sqlite':
+                    from .sqlite_store import SqliteStore
+                    _backend = SqliteStore(settings.sqlite_path)
+                else:
+                    _backend = MemoryStore()
+    return _backend
+
+
+def clear_all_data():
+    """Clear all stored emails and responses - useful for testing"""
+    from .mailboxes import get_cursors
+    get_backend().clear()
+    # the next sync must list each mailbox from the start again, or mail already seen is never reloaded
+    get_cursors().reset()
+    _emit('clear', {})
+    return {"cleared_emails": True, "cleared_responses": True}
+
+
+def upsert_email(row: EmailRow | Dict[str, Any]) -> str:
+    if isinstance(row, dict):
+        row = EmailRow.from_doc(row)
+    if not row.id:
+        row.id = str(uuid.uuid4())
+    eid = get_backend().upsert_email(row)
+    _emit('upsert', row)
+    return eid
+
+
+def upsert_many(rows: List[EmailRow]) -> int:
+    """Store a batch of new emails in one go (one transaction on SQLite)"""
+    for row in rows:
+        if not row.id:
+            row.id = str(uuid.uuid4())
+    stored = get_backend().upsert_many(rows)
+    for row in rows:
+        _emit('upsert', row)
+    return stored
+
+
+def restore_emails(rows: List[EmailRow]):
+    """Bulk-load persisted emails into an empty store; nothing is emitted to CHANGE_LISTENERS"""
+    get_backend().restore_emails(rows)
+
+
+def find_by_message_id(message_id: str) -> EmailRow | None:
+    return get_backend().find_by_message_id(message_id)
+
+
+def thread_members(eid: str) -> List[EmailRow]:
+    """All emails in the same conversation, oldest first"""
+    return get_backend().thread_members(eid)
+
+
+def thread_sizes(thread_keys: List[str]) -> Dict[str, int]:
+    """Number of emails in each conversation, in one read"""
+    return get_backend().thread_sizes(thread_keys)
+
+
+def latest_per_thread() -> List[EmailRow]:
+    return get_backend().latest_per_thread()
+
+
+def list_emails_sorted(limit: int = 50) -> List[EmailRow]:
+    """Newest message of each conversation, highest current score (with aging) first"""
+    return get_backend().list_emails_sorted(limit)
+
+
+def list_pending_without_draft(limit: int | None = None) -> List[EmailRow]:
+    """Conversations whose newest message is unanswered and has no open draft yet, highest current score first.
+
+    Near-duplicates of another email are left out: the first email of the
+    cluster is drafted once and the reply fans out to all of them.
+    """
+    return get_backend().list_pending_without_draft(limit)
+
+
+def get_email(eid: str) -> EmailRow | None:
+    return get_backend().get_email(eid)
+
+
+def load_full(rows: List[EmailRow]) -> List[EmailRow]:
+    """Make sure restored emails have their bodies and extra fields loaded"""
+    return get_backend().load_full(rows)
+
+
+def update_email(eid: str, **fields):
+    fields = _convert(fields)
+    get_backend().update_email(eid, fields)
+    _emit('update', {'id': eid, **fields})
+
+
+def transition_status(eid: str, expected: Iterable[Status | str], new: Status | str, **fields) -> bool:
+    """Compare-and-swap on status: only one caller (in any worker) wins a given transition"""
+    fields = _convert(fields)
+    new = Status(new)
+    won = get_backend().transition_status(eid, tuple(Status(s) for s in expected), new, fields)
+    if won:
+        _emit('update', {'id': eid, 'status': new, **fields})
+    return won
+
+
+def mark_status(eid: str, status: str):
+    update_email(eid, status=status)
+
+
+def add_response(email_id: str, draft: str, model: str = 'placeholder',
+                 prompt_tokens: Dict[str, int] | None = None) -> str:
+    response = _new_response(email_id, draft, model, prompt_tokens)
+    get_backend().add_response(response)
+    _emit('response', response)
+    return response['id']
+
+
+def restore_response(response: Dict[str, Any]):
+    """Re-insert a persisted response without generating a new id"""
+    get_backend().restore_response(response)
+
+
+def latest_open_draft(email_id: str) -> Dict[str, Any] | None:
+    """Most recent non-final draft recorded for an email"""
+    return get_backend().latest_open_draft(email_id)
+
+
+def count_emails() -> int:
+    return get_backend().count_emails()
+
+
+def has_mailbox_emails(mailbox: str) -> bool:
+    """Whether anything synced from the mailbox is stored; a sync cursor is only valid while it is"""
+    return get_backend().has_mailbox_emails(mailbox)
+
+
+def count_pending_without_draft() -> int:
+    """len(list_pending_without_draft()) without building the list; for the queue depth gauge"""
+    return get_backend().count_pending_without_draft()
+
+
+def compute_stats():
+    return get_backend().compute_stats()
+
+
+def cluster_window_seconds() -> int:
+    return int(get_settings().cluster_window_hours * 3600)
+
+
+def lsh_lookup(keys: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Bucket key -> the cluster holding that LSH bucket, for the keys that have one"""
+    return get_backend().lsh_lookup(keys)
+
+
+def add_clusters(clusters: List[Dict[str, Any]]):
+    if not clusters:
+        return
+    get_backend().add_clusters(clusters, cluster_window_seconds())
+    _emit('clusters', {'clusters': clusters})
+
+
+def cluster_members(cluster_id: str) -> List[EmailRow]:
+    """Emails of a near-duplicate cluster, oldest (the one it is named after) first"""
+    return get_backend().cluster_members(cluster_id)
+
+
+def list_clusters(min_size: int = 2, limit: int = 50) -> List[Dict[str, Any]]:
+    """Largest clusters first, as {id, size}"""
+    return get_backend().list_clusters(min_size, limit)
+
+
+def iter_emails(filters: Dict[str, Any] | None = None, since: int | None = None, until: int | None = None,
+                batch_size: int = 1000) -> Iterator[List[EmailRow]]:
+    """Emails matching field == value filters and received in [since, until), in batches; for exports"""
+    return get_backend().iter_emails(filters or {}, since, until, batch_size)
+
+
+def latest_open_drafts(email_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """latest_open_draft for many emails at once, keyed by email id (emails without a draft are left out)"""
+    return get_backend().latest_open_drafts(email_ids)
+
+
+def rollup_timeseries(start: int, end: int, granularity: str = 'day') -> Dict[str, Any]:
+    """Chart points for [start, end), merged from the rollup buckets without reading any email"""
+    if granularity not in rollups.GRANULARITIES:
+        return {"error": f"granularity must be one of: {', '.join(rollups.GRANULARITIES)}"}
+    if end <= start:
+        return {"error": "'to' must be after 'from'"}
+    if rollups.period_count(start, end, granularity) > rollups.MAX_POINTS:
+        return {"error": f"more than {rollups.MAX_POINTS} points; use a coarser granularity"}
+    windows = rollups.periods(start, end, granularity)
+    resolution = rollups.resolution_for(granularity)
+    buckets = get_backend().rollups(resolution, windows[0][0], windows[-1][1])
+    return rollups.timeseries(buckets, windows, granularity)
@@ -0,0 +1,41 @@
+import os
+import pytest
+
+# Settings read at import time must not touch the real data directory or start background threads
+os.environ.setdefault('SNAPSHOT_ENABLED', 'false')
+os.environ.setdefault('OUTBOX_WORKER_ENABLED', 'false')
+os.environ.setdefault('PREDRAFT_ENABLED', 'false')
+os.environ.setdefault('DRAFT_MODEL', 'stub')
+
+
+@pytest.fixture
+def use_backend(tmp_path, monkeypatch):
+    """Switch to a fresh store of the named backend, with its own outbox, draft cache and sync cursors"""
+    from app.config import get_settings
+    from app.services import store, outbox, response, mailboxes
+
+    def use(name: str):
+        directory = tmp_path / name
+        directory.mkdir(exist_ok=True)
+        monkeypatch.setenv('STORE_BACKEND', name)
+        monkeypatch.setenv('SQLITE_PATH', str(directory / 'store.db'))
+        monkeypatch.setenv('OUTBOX_PATH', str(directory / 'outbox.db'))
+        monkeypatch.setenv('DRAFT_CACHE_PATH', str(directory / 'draft_cache.jsonl'))
+        monkeypatch.setenv('MAILBOX_STATE_PATH', str(directory / 'mailbox_state.json'))
+        get_settings.cache_clear()
+        monkeypatch.setattr(store, '_backend', None)
+        monkeypatch.setattr(outbox, '_outbox', None)
+        monkeypatch.setattr(response, '_draft_cache', None)
+        monkeypatch.setattr(mailboxes, '_cursors', None)
+        store.clear_all_data()
+
+    yield use
+    store.clear_all_data()
+    get_settings.cache_clear()
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store_backend(request, use_backend):
+    """A fresh store of each backend"""
+    use_backend(request.param)
+    return request.param
@@ -0,0 +1,79 @@
+import email
+
+import pytest
+
+from app.config import get_settings
+from app.services import email_send, store
+from app.services.clustering import assign_clusters
+from app.services.llm import ticket_reference
+from app.services.predraft import predraft_pending
+from app.services.records import EmailRow, Sentiment, Priority, Status
+
+OUTAGE = "I cannot access my account since this morning, the login page keeps saying the service is down, please help"
+
+
+def _row(sender: str, received_at: int, subject: str = "Cannot access account", body: str = OUTAGE) -> EmailRow:
+    return EmailRow(id='', sender=sender, subject=subject, body=body, clean_body=body, received_at=received_at,
+                    sentiment=Sentiment.NEGATIVE, priority=Priority.URGENT, priority_score=1.0,
+                    status=Status.PROCESSED)
+
+
+@pytest.fixture
+def outbox_sends(store_backend, monkeypatch):
+    """SMTP configured, with every delivered message captured as (recipient, body) instead of sent"""
+    monkeypatch.setenv('SMTP_HOST', 'localhost')
+    monkeypatch.setenv('SMTP_USER', 'support@example.com')
+    monkeypatch.setenv('SMTP_PASSWORD', 'secret')
+    get_settings.cache_clear()
+    sent = []
+
+    def send(session, recipient, message):
+        part = email.message_from_string(message).get_payload()[0]
+        sent.append((recipient, part.get_payload(decode=True).decode('utf-8')))
+
+    monkeypatch.setattr(email_send._SmtpSession, 'send', send)
+    return sent
+
+
+def _ingest_cluster():
+    rows = [_row(f"{name}@example.com", 1756000000 + i) for i, name in enumerate(['ann', 'bob', 'cat'])]
+    rows.append(_row('dan@example.com', 1756000100, "Invoice question", "Could you resend last month's invoice"))
+    assign_clusters(rows)
+    store.upsert_many(rows)
+    assert {row.cluster_id for row in rows[:3]} == {rows[0].id}
+    return rows
+
+
+def _check_personal(sent, rows):
+    by_recipient = dict(sent)
+    for row in rows:
+        body = by_recipient[row.sender]
+        assert body.startswith(f"Dear {row.sender.split('@')[0]},")
+        for other in rows:
+            assert (ticket_reference(other) in body) == (other is row)
+
+
+def test_bulk_send_leaves_no_cluster_member_behind(outbox_sends):
+    rows = _ingest_cluster()
+    predraft_pending()
+    # only the first email of the cluster (and the unrelated one) are drafted
+    assert store.latest_open_draft(rows[1].id) is None
+
+    result = email_send.send_bulk_replies()
+
+    assert result['sent'] == len(rows)
+    left = [row.id for row in store.latest_per_thread()
+            if row.cluster_id and row.status in store.SENDABLE_STATUSES]
+    assert left == []
+    _check_personal(outbox_sends, rows[:3])
+
+
+def test_cluster_send_addresses_each_member(outbox_sends):
+    rows = _ingest_cluster()
+    predraft_pending()
+
+    result = email_send.send_cluster_reply(rows[0].id)
+
+    assert result['queued'] == 3 and result['sent'] == 3
+    _check_personal(outbox_sends, rows[:3])
+    assert store.get_email(rows[3].id).status is Status.PROCESSED
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from app.services import clustering, store
+from app.services.records import EmailRow, Priority, Sentiment, Status
+
+OUTAGE = "I cannot access my account since this morning, the login page keeps saying the service is down, please help"
+
+
+def _row(i: int) -> EmailRow:
+    return EmailRow(id='', sender=f"c{i}@example.com", subject="Cannot access account", body=OUTAGE, clean_body=OUTAGE,
+                    received_at=1_756_000_000 + i, sentiment=Sentiment.NEGATIVE, priority=Priority.URGENT,
+                    status=Status.PROCESSED)
+
+
+def test_concurrent_ingests_share_one_cluster(store_backend, monkeypatch):
+    upsert_many = store.upsert_many
+
+    def slow_upsert(rows):
+        # widen the gap between assigning a cluster and storing its first email
+        time.sleep(0.02)
+        return upsert_many(rows)
+
+    monkeypatch.setattr(store, 'upsert_many', slow_upsert)
+    threads = [threading.Thread(target=clustering.store_clustered, args=([_row(i)],)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    clusters = store.list_clusters(min_size=1)
+    assert [c['size'] for c in clusters] == [6]
+    first = store.get_email(clusters[0]['id'])
+    assert first.cluster_id == first.id
+
+
+def test_signatures_do_not_depend_on_the_batch(monkeypatch):
+    texts = [OUTAGE, "Where is my refund for order 1234?", ""]
+    alone = [clustering.signatures([text])[0][0].tolist() for text in texts]
+    assert clustering.signatures(texts)[0].tolist() == alone
+    # a batch longer than the cached power tables builds its own
+    monkeypatch.setattr(clustering, 'POWER_CACHE_SIZE', 64)
+    assert clustering.signatures(texts)[0].tolist() == alone
@@ -0,0 +1,93 @@
+import json
+
+from app.services import draft_cache, response, store
+from app.services.draft_cache import DraftCache
+from app.services.llm import StubDraftModel
+from app.services.records import EmailRow, Status
+
+
+class Clock:
+    def __init__(self, now: float = 1_756_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(tmp_path, monkeypatch, **kwargs) -> tuple[DraftCache, Clock]:
+    clock = Clock()
+    monkeypatch.setattr(draft_cache.time, 'time', clock)
+    return DraftCache(str(tmp_path / 'drafts.jsonl'), **kwargs), clock
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, ttl_seconds=60)
+    cache.put('a', 'draft a')
+
+    clock.now += 60
+    assert cache.get('a') == 'draft a'
+    clock.now += 1
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_expired_entries_are_not_reloaded(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, ttl_seconds=60)
+    cache.put('old', 'stale draft')
+    clock.now += 50
+    cache.put('new', 'fresh draft')
+    clock.now += 30
+
+    reloaded = DraftCache(str(tmp_path / 'drafts.jsonl'), ttl_seconds=60)
+    assert reloaded.get('old') is None
+    assert reloaded.get('new') == 'fresh draft'
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch, max_entries=2)
+    cache.put('a', 'draft a')
+    cache.put('b', 'draft b')
+    assert cache.get('a') == 'draft a'  # 'b' is now the least recently used
+    cache.put('c', 'draft c')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'draft a'
+    assert cache.get('c') == 'draft c'
+    assert len(cache) == 2
+
+
+def test_log_is_compacted_to_the_live_entries(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch, max_entries=3)
+    for i in range(7):
+        cache.put(f"k{i}", f"draft {i}")
+
+    lines = (tmp_path / 'drafts.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['k'] for line in lines] == ['k4', 'k5', 'k6']
+    reloaded = DraftCache(str(tmp_path / 'drafts.jsonl'), max_entries=3)
+    assert [reloaded.get(f"k{i}") for i in range(7)] == [None] * 4 + ['draft 4', 'draft 5', 'draft 6']
+
+
+class CountingModel(StubDraftModel):
+    name = 'counting'
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt, email):
+        self.calls += 1
+        return super().generate(prompt, email)
+
+
+def test_unchanged_email_reuses_the_cached_draft(store_backend, monkeypatch):
+    model = CountingModel()
+    monkeypatch.setattr(response, 'get_draft_model', lambda: model)
+    eid = store.upsert_email(EmailRow(id='e1', sender='ann@example.com', subject='Refund', body='Where is it?',
+                                      received_at=1_756_000_000, status=Status.PROCESSED))
+
+    first = response.generate_draft(eid)
+    assert response.generate_draft(eid) == first
+    assert model.calls == 1
+
+    store.update_email(eid, subject='Refund still missing')
+    response.generate_draft(eid)
+    assert model.calls == 2
@@ -0,0 +1,122 @@
+import base64
+import re
+import threading
+
+import pytest
+
+from app.config import get_settings
+from app.services import email_fetch, store
+from app.services.gmail_client import GmailClient
+from app.services.mailboxes import Mailbox, get_cursors, CURSOR_OVERLAP_SECONDS
+
+START = 1756000000
+
+
+class _Request:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self):
+        return self._result
+
+
+class FakeGmail:
+    """messages().list/get over a fixed message set, honouring the after: clause of the query"""
+
+    def __init__(self, count: int):
+        self.queries = []
+        self.by_id = {}
+        for i in range(count):
+            data = base64.urlsafe_b64encode(f"Please help with issue {i}".encode()).decode().rstrip('=')
+            self.by_id[f"m{i}"] = {
+                'id': f"m{i}", 'threadId': f"t{i}", 'internalDate': str((START + i * 3600) * 1000),
+                'payload': {
+                    'mimeType': 'text/plain',
+                    'headers': [{'name': 'Subject', 'value': f"Support request {i}"},
+                                {'name': 'From', 'value': f"user{i}@example.com"},
+                                {'name': 'Message-ID', 'value': f"<m{i}@example.com>"}],
+                    'parts': [{'mimeType': 'text/plain', 'body': {'data': data}}],
+                },
+            }
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId='me', q='', maxResults=100, pageToken=None):
+        self.queries.append(q)
+        after = re.search(r"after:(\d+)", q)
+        since = int(after.group(1)) if after else 0
+        ids = [m for m, msg in self.by_id.items() if int(msg['internalDate']) // 1000 > since]
+        return _Request({'messages': [{'id': m} for m in ids[:maxResults]]})
+
+    def get(self, userId='me', id='', format='full'):
+        return _Request(self.by_id[id])
+
+
+@pytest.fixture
+def gmail(store_backend, monkeypatch):
+    service = FakeGmail(5)
+    monkeypatch.setattr(email_fetch, '_get_gmail_service', lambda mailbox=None: (service, None))
+    return service
+
+
+def test_sync_advances_the_cursor(gmail):
+    mailbox = Mailbox('default')
+    assert email_fetch.fetch_mailbox(mailbox, limit=50)['stored'] == 5
+    newest = START + 4 * 3600
+    assert get_cursors().get('default') == newest
+
+    result = email_fetch.fetch_mailbox(mailbox, limit=50)
+    assert gmail.queries[-1].endswith(f"after:{newest - CURSOR_OVERLAP_SECONDS}")
+    assert result['stored'] == 0
+
+
+def test_clear_lets_synced_mail_load_again(gmail):
+    mailbox = Mailbox('default')
+    email_fetch.fetch_mailbox(mailbox, limit=50)
+
+    store.clear_all_data()
+    assert get_cursors().get('default') is None
+    assert email_fetch.fetch_mailbox(mailbox, limit=50)['stored'] == 5
+
+
+def test_cursor_without_stored_mail_is_ignored(gmail):
+    # e.g. a restart of the memory backend without snapshots: the state file outlived the emails
+    get_cursors().advance('default', START + 10 * 3600)
+    result = email_fetch.fetch_mailbox(Mailbox('default'), limit=50)
+    assert 'after:' not in gmail.queries[-1]
+    assert result['stored'] == 5
+
+
+def test_polls_reuse_the_same_worker_threads(gmail, monkeypatch):
+    threads = set()
+    get = gmail.get
+
+    def recording_get(**kwargs):
+        threads.add(threading.current_thread())
+        return get(**kwargs)
+
+    monkeypatch.setattr(gmail, 'get', recording_get)
+    mailbox = Mailbox('default')
+    email_fetch.fetch_mailbox(mailbox, limit=50)
+    store.clear_all_data()
+    email_fetch.fetch_mailbox(mailbox, limit=50)
+    assert 0 < len(threads) <= get_settings().gmail_fetch_concurrency
+
+
+def test_token_refresh_failure_is_an_error_not_an_exception():
+    class ExpiredCredentials:
+        valid = False
+        refresh_token = 'refresh'
+        expiry = None
+
+        def refresh(self, request):
+            raise RuntimeError('invalid_grant')
+
+    client = GmailClient(Mailbox('default'))
+    client.creds = ExpiredCredentials()
+    service, error = client.service()
+    assert service is None and 'invalid_grant' in error
@@ -0,0 +1,49 @@
+import smtplib
+
+import pytest
+
+from app.config import get_settings
+from app.services import email_send, store
+from app.services.outbox import get_outbox
+from app.services.records import EmailRow, Status
+
+
+@pytest.fixture
+def smtp(store_backend, monkeypatch):
+    """SMTP configured; every send is refused for good"""
+    monkeypatch.setenv('SMTP_HOST', 'localhost')
+    monkeypatch.setenv('SMTP_USER', 'support@example.com')
+    monkeypatch.setenv('SMTP_PASSWORD', 'secret')
+    get_settings.cache_clear()
+
+    def refuse(session, recipient, message):
+        raise smtplib.SMTPRecipientsRefused({recipient: (550, b'no such user')})
+
+    monkeypatch.setattr(email_send._SmtpSession, 'send', refuse)
+
+
+def _store(status: Status) -> str:
+    return store.upsert_email(EmailRow(id='e1', sender='ann@example.com', subject='Refund', body='Where is it?',
+                                       received_at=1_756_000_000, status=status))
+
+
+def test_reply_to_an_email_being_sent_is_rejected(smtp):
+    eid = _store(Status.SENDING)
+
+    result = email_send.send_email_reply(eid, 'Your refund is on its way')
+
+    assert result['success'] is False
+    assert sum(get_outbox().counts().values()) == 0
+    assert store.get_email(eid).status == Status.SENDING
+
+
+def test_final_failure_restores_the_status_before_the_send(smtp):
+    eid = _store(Status.PROCESSED)
+
+    result = email_send.send_email_reply(eid, 'Your refund is on its way')
+    again = email_send.send_email_reply(eid, 'Your refund is on its way, sorry for the delay')
+
+    assert result['status'] == 'failed'
+    assert store.get_email(eid).status == Status.PROCESSED
+    assert again['status'] == 'failed'
+    assert store.get_email(eid).status == Status.PROCESSED
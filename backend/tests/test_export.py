@@ -0,0 +1,95 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+
+from app.config import get_settings
+from app.services import store
+from app.services.export import export_chunks, parse_request
+from app.services.records import Category, EmailRow, Priority, Sentiment, Status, to_iso
+
+START = 1_756_000_000
+
+
+@pytest.fixture
+def emails(store_backend, monkeypatch):
+    """Twelve emails on each backend, exported three at a time so filters apply across batches"""
+    monkeypatch.setenv('EXPORT_BATCH_SIZE', '3')
+    get_settings.cache_clear()
+    store.upsert_many([
+        EmailRow(id=f"e{i:02d}", sender=f"c{i}@example.com", subject=f"Order {i}", body=f"Where is order {i}?",
+                 received_at=START + 3600 * i, message_id=f"<m{i}@example.com>",
+                 status=Status.RESPONDED if i % 3 == 0 else Status.PROCESSED,
+                 priority=Priority.URGENT if i % 4 == 0 else Priority.NOT_URGENT,
+                 sentiment=Sentiment.NEGATIVE if i % 2 else Sentiment.NEUTRAL,
+                 matched_category=Category.BILLING if i < 6 else Category.TECHNICAL,
+                 mailbox='support' if i % 2 else None)
+        for i in range(12)
+    ])
+    return store_backend
+
+
+def _export(fmt: str = 'ndjson', columns: str | None = 'id', compression: str | None = None, **options):
+    plan = parse_request(fmt, columns, compression, **options)
+    assert 'error' not in plan, plan
+    data = b''.join(export_chunks(plan))
+    if compression == 'gzip':
+        data = gzip.decompress(data)
+    text = data.decode('utf-8')
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def _ids(records):
+    return sorted(record['id'] for record in records)
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_export_filters(emails, fmt):
+    assert _ids(_export(fmt)) == [f"e{i:02d}" for i in range(12)]
+    assert _ids(_export(fmt, status='responded')) == ['e00', 'e03', 'e06', 'e09']
+    assert _ids(_export(fmt, priority='urgent')) == ['e00', 'e04', 'e08']
+    assert _ids(_export(fmt, sentiment='neutral', matched_category='billing')) == ['e00', 'e02', 'e04']
+    assert _ids(_export(fmt, mailbox='support')) == ['e01', 'e03', 'e05', 'e07', 'e09', 'e11']
+    assert _ids(_export(fmt, status='processed', mailbox='support')) == ['e01', 'e05', 'e07', 'e11']
+
+
+def test_export_time_bounds(emails):
+    records = _export(columns='id,received_at', since=to_iso(START + 3600 * 2), until=to_iso(START + 3600 * 5))
+
+    # 'from' is inclusive and 'to' exclusive
+    assert _ids(records) == ['e02', 'e03', 'e04']
+    assert {record['received_at'] for record in records} == {to_iso(START + 3600 * i) for i in range(2, 5)}
+    assert _ids(_export(since=to_iso(START + 3600 * 10))) == ['e10', 'e11']
+    assert _export(until=to_iso(START - 1)) == []
+
+
+def test_export_columns_and_drafts(emails):
+    store.add_response('e01', 'First draft', model='stub')
+    store.add_response('e01', 'Second draft', model='stub')
+
+    records = {record['id']: record for record in _export('csv', 'id,status,draft,draft_model', 'gzip')}
+
+    assert list(records['e01']) == ['id', 'status', 'draft', 'draft_model']
+    assert records['e01']['draft'] == 'Second draft' and records['e01']['draft_model'] == 'stub'
+    assert records['e02']['draft'] == '' and records['e03']['status'] == 'responded'
+    listed = _export(columns='id,references,received_at', priority='urgent')
+    assert listed[0] == {'id': 'e00', 'references': [], 'received_at': to_iso(START)}
+
+
+@pytest.mark.parametrize('options', [
+    {'status': 'archived'},
+    {'priority': 'high'},
+    {'sentiment': 'angry'},
+    {'matched_category': 'sales'},
+    {'sender': 'c1@example.com'},
+    {'since': 'yesterday'},
+    {'columns': 'id,nope'},
+    {'fmt': 'xml'},
+    {'compression': 'brotli'},
+])
+def test_export_rejects_invalid_requests(options):
+    request = {'fmt': 'csv', 'columns': None, 'compression': None, **options}
+    assert 'error' in parse_request(**request)
@@ -0,0 +1,22 @@
+from app.routes import emails as routes
+from app.services import store
+from app.services.records import EmailRow, Status
+
+
+def _row(eid: str, received_at: int, message_id: str, in_reply_to: str | None = None,
+         subject: str = 'Refund') -> EmailRow:
+    return EmailRow(id=eid, sender='ann@example.com', subject=subject, body='Where is my refund?',
+                    received_at=received_at, status=Status.PROCESSED, message_id=message_id,
+                    in_reply_to=in_reply_to, references=(in_reply_to,) if in_reply_to else ())
+
+
+def test_list_reports_thread_sizes(store_backend):
+    store.upsert_email(_row('a1', 1_700_000_000, '<a1@x>'))
+    store.upsert_email(_row('a2', 1_700_000_100, '<a2@x>', in_reply_to='<a1@x>'))
+    store.upsert_email(_row('a3', 1_700_000_200, '<a3@x>', in_reply_to='<a2@x>'))
+    store.upsert_email(_row('b1', 1_700_000_050, '<b1@x>', subject='Login fails'))
+
+    listed = {item['id']: item['thread_size'] for item in routes.list_emails(limit=10)}
+
+    assert listed == {'a3': 3, 'b1': 1}
+    assert store.thread_sizes([]) == {}
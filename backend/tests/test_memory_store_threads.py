@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from app.services import store
+from app.services.records import EmailRow, Sentiment, Priority, Status
+
+
+def _row(i: int) -> EmailRow:
+    return EmailRow(id=f"e{i}", sender=f"user{i % 50}@example.com", subject=f"Question {i % 200}",
+                    body='b', clean_body='b', received_at=1756000000 + i, sentiment=Sentiment.NEUTRAL,
+                    priority=Priority.NOT_URGENT, priority_score=float(i % 5), status=Status.PROCESSED,
+                    cluster_id=f"e{i - i % 10}" if i % 3 == 0 else None, mailbox='default')
+
+
+def test_concurrent_writers_and_readers_keep_the_indexes_in_step(store_backend):
+    if store_backend != 'memory':
+        pytest.skip("SQLite serialises writers itself")
+    errors = []
+
+    def write(offset: int):
+        try:
+            for i in range(offset, offset + 2000):
+                store.upsert_email(_row(i))
+                if i % 4 == 0:
+                    store.update_email(f"e{i}", status=Status.RESPONDED)
+                if i % 7 == 0:
+                    store.add_response(f"e{i}", 'draft')
+        except Exception as e:
+            errors.append(e)
+
+    def read(done: threading.Event):
+        try:
+            while not done.is_set():
+                store.latest_per_thread()
+                store.compute_stats()
+                store.list_clusters()
+                store.list_pending_without_draft(20)
+        except Exception as e:
+            errors.append(e)
+
+    done = threading.Event()
+    readers = [threading.Thread(target=read, args=(done,)) for _ in range(2)]
+    writers = [threading.Thread(target=write, args=(n * 2000,)) for n in range(4)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert store.count_emails() == 8000
+    assert store.count_pending_without_draft() == len(store.list_pending_without_draft())
+    heads = {row.thread_key: row for row in store.latest_per_thread()}
+    for row in store.get_backend().thread_members('e0'):
+        assert row.received_at <= heads[row.thread_key].received_at
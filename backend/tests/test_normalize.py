@@ -0,0 +1,26 @@
+from app.services.normalize import looks_like_html, normalize_body
+
+
+def test_html_is_detected_by_tags():
+    assert looks_like_html("<p>Hello</p>")
+    assert looks_like_html("Line one<br/>line two")
+    assert looks_like_html("<!DOCTYPE html><html><body>Hi</body></html>")
+    assert not looks_like_html("Order total < 50 and > 10, love it <3")
+    assert not looks_like_html("Reply to <ann@example.com> please")
+
+
+def test_comparisons_survive_csv_normalisation():
+    body = "The total was < 50 but I was charged > 80."
+    assert normalize_body(body, is_html=looks_like_html(body)) == body
+
+
+def test_sign_off_alone_on_its_line_starts_the_signature():
+    body = "Hi,\nMy order has not arrived.\n\nKind regards,\nAnn Smith\nAcme Corp"
+    assert normalize_body(body) == "Hi,\nMy order has not arrived."
+
+
+def test_sign_off_followed_by_more_text_is_kept():
+    body = "Hi,\nMy order has not arrived.\nThanks\nfor nothing. I want a refund by Friday."
+    assert normalize_body(body) == body
+    body = "Hi,\nThanks for the quick reply.\nThe login still fails."
+    assert normalize_body(body) == body
@@ -0,0 +1,111 @@
+import smtplib
+
+import pytest
+
+from app.config import get_settings
+from app.services import email_send, outbox, store
+from app.services.outbox import Outbox, idempotency_key
+from app.services.records import EmailRow, Status
+
+
+@pytest.fixture
+def box(tmp_path):
+    return Outbox(str(tmp_path / 'outbox.db'))
+
+
+def _enqueue(box: Outbox, email_id: str = 'e1', draft: str = 'Your refund is on its way'):
+    return box.enqueue(idempotency_key(email_id, draft), email_id, 'ann@example.com', draft, 'processed', 3)
+
+
+def test_same_reply_is_queued_once(box):
+    item, created = _enqueue(box)
+    again, created_again = _enqueue(box)
+
+    assert created and not created_again
+    assert again['id'] == item['id']
+    assert box.counts()['queued'] == 1
+
+
+def test_second_draft_for_a_queued_email_is_refused(box):
+    _enqueue(box)
+    assert _enqueue(box, draft='A different reply') == (None, False)
+
+
+def test_only_one_worker_claims_an_item(box):
+    item, _ = _enqueue(box)
+
+    claimed = box.claim(item['id'], 'worker-a')
+    assert claimed['attempts'] == 1
+    assert box.claim(item['id'], 'worker-b') is None
+    assert box.claim_next('worker-b') is None
+    # completions are fenced on the claim
+    assert not box.mark_sent(item['id'], 'worker-b')
+    assert box.mark_sent(item['id'], 'worker-a')
+    assert box.get(item['id'])['status'] == 'sent'
+
+
+def test_retry_waits_for_its_backoff(box, monkeypatch):
+    clock = [1_756_000_000.0]
+    monkeypatch.setattr(outbox.time, 'time', lambda: clock[0])
+    item, _ = _enqueue(box)
+    box.claim(item['id'], 'worker-a')
+
+    assert box.mark_failed(item['id'], 'worker-a', 'connection reset', retry_in=30)
+    assert box.claim_next('worker-a') is None
+    clock[0] += 30
+    retried = box.claim_next('worker-a')
+    assert retried['attempts'] == 2
+    assert retried['last_error'] == 'connection reset'
+
+
+def test_failed_reply_can_be_queued_again(box):
+    item, _ = _enqueue(box)
+    box.claim(item['id'], 'worker-a')
+    box.mark_failed(item['id'], 'worker-a', 'mailbox full', retry_in=None)
+    assert box.get(item['id'])['status'] == 'failed'
+
+    requeued, created = _enqueue(box)
+    assert created
+    assert requeued['status'] == 'queued' and requeued['attempts'] == 0
+
+
+def test_expired_claims_return_to_the_queue(box, monkeypatch):
+    clock = [1_756_000_000.0]
+    monkeypatch.setattr(outbox.time, 'time', lambda: clock[0])
+    item, _ = _enqueue(box)
+    box.claim(item['id'], 'worker-a')
+
+    assert box.recover_stale(lease_seconds=300) == 0
+    clock[0] += 301
+    assert box.recover_stale(lease_seconds=300) == 1
+    assert box.claim_next('worker-b')['id'] == item['id']
+    # the first worker lost its lease and cannot complete the item any more
+    assert not box.mark_sent(item['id'], 'worker-a')
+
+
+def test_transient_failure_is_retried_and_sent_once(store_backend, monkeypatch):
+    monkeypatch.setenv('SMTP_HOST', 'localhost')
+    monkeypatch.setenv('SMTP_USER', 'support@example.com')
+    monkeypatch.setenv('SMTP_PASSWORD', 'secret')
+    monkeypatch.setenv('OUTBOX_RETRY_BASE_SECONDS', '0')
+    get_settings.cache_clear()
+    attempts = []
+
+    def flaky(session, recipient, message):
+        attempts.append(recipient)
+        if len(attempts) == 1:
+            raise smtplib.SMTPServerDisconnected('connection reset')
+
+    monkeypatch.setattr(email_send._SmtpSession, 'send', flaky)
+    eid = store.upsert_email(EmailRow(id='e1', sender='ann@example.com', subject='Refund', body='Where is it?',
+                                      received_at=1_756_000_000, status=Status.PROCESSED))
+
+    first = email_send.send_email_reply(eid, 'Your refund is on its way')
+    assert first['status'] == 'queued'
+    assert store.get_email(eid).status == Status.SENDING
+    assert email_send.send_email_reply(eid, 'Your refund is on its way')['error'] == "Reply already sent or being sent"
+
+    assert email_send.drain_outbox(concurrency=2)['sent'] == 1
+    assert email_send.drain_outbox(concurrency=2)['sent'] == 0
+    assert attempts == ['ann@example.com', 'ann@example.com']
+    assert store.get_email(eid).status == Status.RESPONDED
@@ -0,0 +1,47 @@
+from app.services import store
+from app.services.clustering import assign_clusters
+from app.services.metrics import PENDING_DEPTH
+from app.services.records import EmailRow, Sentiment, Priority, Status
+
+OUTAGE = "I cannot access my account since this morning, the login page keeps saying the service is down, please help"
+
+
+def _row(sender: str, received_at: int, subject: str, body: str, message_id: str | None = None,
+         in_reply_to: str | None = None) -> EmailRow:
+    return EmailRow(id='', sender=sender, subject=subject, body=body, clean_body=body, received_at=received_at,
+                    sentiment=Sentiment.NEUTRAL, priority=Priority.NOT_URGENT, priority_score=0.0,
+                    status=Status.PROCESSED, message_id=message_id, in_reply_to=in_reply_to,
+                    references=(in_reply_to,) if in_reply_to else ())
+
+
+def _assert_count():
+    assert store.count_pending_without_draft() == len(store.list_pending_without_draft())
+    return store.count_pending_without_draft()
+
+
+def test_pending_count_follows_the_pending_list(store_backend):
+    rows = [_row(f"user{i}@example.com", 1756000000 + i, f"Question {i}", f"Distinct question number {i} about plan {i * 7}")
+            for i in range(5)]
+    rows += [_row(f"{name}@example.com", 1756000100 + i, "Cannot access account", OUTAGE)
+             for i, name in enumerate(['ann', 'bob'])]
+    rows[0].message_id = '<q0@example.com>'
+    assign_clusters(rows)
+    store.upsert_many(rows)
+    # five conversations and the first email of the cluster
+    assert _assert_count() == 6
+
+    # a follow-up takes over its conversation's head
+    store.upsert_many([_row('user0@example.com', 1756000200, 'Re: Question 0', 'Any news?',
+                            in_reply_to='<q0@example.com>')])
+    assert _assert_count() == 6
+
+    store.add_response(rows[1].id, 'A draft')
+    assert _assert_count() == 5
+    store.update_email(rows[2].id, status=Status.RESPONDED)
+    assert _assert_count() == 4
+    store.update_email(rows[2].id, status=Status.PENDING)
+    assert _assert_count() == 5
+    assert PENDING_DEPTH.render().rstrip().endswith(' 5')
+
+    store.clear_all_data()
+    assert _assert_count() == 0
@@ -0,0 +1,101 @@
+import pytest
+
+from app.services import store
+from app.services.clustering import assign_clusters
+from app.services.records import EmailRow, Priority, Sentiment, Status
+from app.services.snapshot import SnapshotManager
+
+START = 1_756_000_000
+OUTAGE = "I cannot access my account since this morning, the login page keeps saying the service is down, please help"
+
+
+def _rows():
+    rows = []
+    for i in range(40):
+        replying = i % 4 == 3
+        rows.append(EmailRow(
+            id=f"e{i}", sender=f"c{i % 7}@example.com", received_at=START + 600 * i,
+            subject=f"Re: Order {i - 1}" if replying else f"Order {i}",
+            body=OUTAGE if i % 5 == 0 else f"Where is order {i}?",
+            clean_body=OUTAGE if i % 5 == 0 else f"Where is order {i}?",
+            message_id=f"<m{i}@example.com>", in_reply_to=f"<m{i - 1}@example.com>" if replying else None,
+            sentiment=Sentiment.NEGATIVE if i % 3 == 0 else Sentiment.NEUTRAL,
+            priority=Priority.URGENT if i % 2 else Priority.NOT_URGENT, priority_score=float(i % 9),
+            status=Status.RESPONDED if i % 6 == 0 else Status.PROCESSED,
+            responded_at=START + 600 * i + 90 * i if i % 6 == 0 else None, mailbox='support' if i % 2 else None,
+        ))
+    return rows
+
+
+def _state():
+    return {
+        'heads': sorted(row.id for row in store.latest_per_thread()),
+        'listed': [row.id for row in store.list_emails_sorted(limit=100)],
+        'pending': [row.id for row in store.list_pending_without_draft()],
+        'pending_count': store.count_pending_without_draft(),
+        'sizes': store.thread_sizes([row.thread_key for row in store.latest_per_thread()]),
+        'clusters': store.list_clusters(min_size=1),
+        'stats': store.compute_stats(),
+        'series': store.rollup_timeseries(START - 86400, START + 2 * 86400, 'hour'),
+        'mailbox': store.has_mailbox_emails('support'),
+        'draft': store.latest_open_draft('e1'),
+    }
+
+
+def test_bulk_restore_matches_incremental_writes(store_backend, tmp_path):
+    if store_backend == 'sqlite':
+        pytest.skip("snapshots persist the memory store")
+    manager = SnapshotManager(str(tmp_path), interval_seconds=3600)
+    manager.restore()
+    rows = _rows()
+    assign_clusters(rows)
+    store.upsert_many(rows)
+    store.add_response('e1', 'Your order ships today')
+    manager.stop()
+    written = _state()
+    assert written['clusters'] and written['pending_count']
+
+    store.get_backend().clear()
+    restored = SnapshotManager(str(tmp_path), interval_seconds=3600)
+    result = restored.restore()
+    try:
+        assert result['restored'] == len(rows)
+        assert result['replayed'] == 0
+        assert _state() == written
+        assert store.get_email('e3').body == rows[3].body
+    finally:
+        restored.stop()
+
+
+def test_changes_after_the_checkpoint_are_replayed(store_backend, tmp_path):
+    if store_backend == 'sqlite':
+        pytest.skip("snapshots persist the memory store")
+    manager = SnapshotManager(str(tmp_path), interval_seconds=3600)
+    manager.restore()
+    rows = _rows()
+    store.upsert_many(rows[:30])
+    manager.checkpoint(force=True)
+    # after the checkpoint: only in changes.log
+    store.upsert_many(rows[30:])
+    store.update_email('e2', status=Status.RESPONDED, responded_at=START + 3600)
+    store.add_response('e5', 'Draft after the checkpoint')
+    written = _state()
+    # the process dies: no final checkpoint, and the last journal line is torn
+    manager.log.close()
+    with open(tmp_path / 'changes.log', 'a', encoding='utf-8') as f:
+        f.write('{"op": "upsert", "da')
+    store.CHANGE_LISTENERS.remove(manager._on_change)
+
+    store.get_backend().clear()
+    restored = SnapshotManager(str(tmp_path), interval_seconds=3600)
+    result = restored.restore()
+    try:
+        assert result['restored'] == 30
+        assert result['replayed'] == 12
+        assert _state() == written
+        assert store.get_email('e2').status == Status.RESPONDED
+        # a second checkpoint moves the lazy bodies to the new snapshot
+        restored.checkpoint(force=True)
+        assert store.get_email('e7').body == rows[7].body
+    finally:
+        restored.stop()
@@ -0,0 +1,49 @@
+import dataclasses
+
+import pytest
+
+from app.services import store
+from app.services.rollups import HOUR
+from app.services.records import EmailRow, Status
+
+RECEIVED = 1_700_000_000
+
+
+def _row(eid: str, message_id: str) -> EmailRow:
+    return EmailRow(id=eid, sender='ann@example.com', subject='Order status', body='Where is my order?',
+                    received_at=RECEIVED, status=Status.PROCESSED, message_id=message_id)
+
+
+def _answer(eid: str):
+    store.update_email(eid, status=Status.RESPONDED, responded_at=RECEIVED + 600)
+
+
+def _total_rollup() -> int:
+    start = RECEIVED - RECEIVED % HOUR
+    bucket = store.get_backend().rollups(HOUR, start, start + HOUR).get(start, {})
+    return bucket.get(('total', ''), 0)
+
+
+def test_reupsert_updates_in_place(store_backend):
+    store.upsert_email(_row('e1', '<m1@example.com>'))
+    _answer('e1')
+    store.upsert_email(dataclasses.replace(store.get_email('e1'), subject='Order status (edited)'))
+
+    row = store.get_email('e1')
+    assert row.subject == 'Order status (edited)'
+    assert row.status == Status.RESPONDED
+    assert store.count_emails() == 1
+    assert _total_rollup() == 1
+
+
+def test_second_copy_of_a_message_keeps_the_stored_row(store_backend):
+    if store_backend != 'sqlite':
+        pytest.skip("the memory store indexes message_id but does not enforce it")
+    store.upsert_email(_row('e1', '<m1@example.com>'))
+    _answer('e1')
+    store.upsert_email(_row('e2', '<m1@example.com>'))
+
+    assert store.find_by_message_id('<m1@example.com>').id == 'e1'
+    assert store.get_email('e1').status == Status.RESPONDED
+    assert store.count_emails() == 1
+    assert _total_rollup() == 1
@@ -0,0 +1,25 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'benchmarks'))
+import importtime  # noqa: E402
+
+# as many cold import pairs as the script takes by default; fewer let one noisy run decide the median
+RUNS = 7
+
+
+def test_optional_integrations_stay_lazy():
+    # deterministic: which modules load does not depend on how busy the machine is
+    modules = importtime.app_modules()
+    assert 'app.main' in modules
+    assert importtime.offenders(modules) == []
+
+
+@pytest.mark.skipif(not os.environ.get('RUN_TIMING_TESTS'), reason="wall-clock budget; set RUN_TIMING_TESTS=1")
+def test_import_budget():
+    overhead_ms, _ = importtime.measure(RUNS)
+    assert overhead_ms <= importtime.BUDGET_MS, \
+        f"app.main adds {overhead_ms:.1f} ms over the framework (budget {importtime.BUDGET_MS:.0f} ms)"
@@ -0,0 +1,76 @@
+from app.services import store
+from app.services.clustering import store_clustered
+from app.services.records import EmailRow, Priority, Sentiment, Status
+
+START = 1_756_000_000
+OUTAGE = "I cannot access my account since this morning, the login page keeps saying the service is down, please help"
+
+
+def _rows():
+    rows = []
+    for i in range(30):
+        replying = i % 5 == 4
+        duplicate = i % 7 == 0
+        rows.append(EmailRow(
+            id=f"e{i:02d}", sender=f"c{i % 6}@example.com", received_at=START + 900 * i,
+            subject=f"Re: Order {i - 1}" if replying else ("Cannot access account" if duplicate else f"Order {i}"),
+            body=OUTAGE if duplicate else f"Where is order {i}? It was due on day {i}.",
+            clean_body=OUTAGE if duplicate else f"Where is order {i}? It was due on day {i}.",
+            message_id=f"<m{i}@example.com>", in_reply_to=f"<m{i - 1}@example.com>" if replying else None,
+            references=(f"<m{i - 1}@example.com>",) if replying else (),
+            sentiment=(Sentiment.NEGATIVE, Sentiment.NEUTRAL, Sentiment.POSITIVE)[i % 3],
+            priority=Priority.URGENT if i % 4 == 0 else Priority.NOT_URGENT, priority_score=round(i * 0.37 % 5, 2),
+            status=Status.PROCESSED, mailbox='support' if i % 2 else None,
+        ))
+    return rows
+
+
+def _docs(rows):
+    return [row.to_doc() for row in rows]
+
+
+def _scenario():
+    """The same writes on whichever backend is active, and everything the app reads back"""
+    rows = _rows()
+    store_clustered(rows[:15])
+    store_clustered(rows[15:])
+    store.update_email('e03', status=Status.RESPONDED, responded_at=START + 900 * 3 + 1800)
+    store.update_email('e08', priority=Priority.URGENT, priority_score=4.5)
+    claimed = store.transition_status('e10', [Status.PROCESSED], Status.SENDING)
+    lost = store.transition_status('e10', [Status.PROCESSED], Status.SENDING)
+    store.add_response('e05', 'First draft')
+    store.add_response('e05', 'Second draft')
+    store.add_response('e12', 'Draft for twelve')
+    clusters = store.list_clusters(min_size=1)
+    return {
+        'claims': (claimed, lost),
+        'count': store.count_emails(),
+        'email': store.get_email('e08').to_doc(),
+        'by_message_id': store.find_by_message_id('<m9@example.com>').id,
+        'thread': [row.id for row in store.thread_members('e09')],
+        'heads': sorted(row.id for row in store.latest_per_thread()),
+        'sizes': store.thread_sizes([row.thread_key for row in store.latest_per_thread()]),
+        'listed': _docs(store.list_emails_sorted(limit=50)),
+        'pending': [row.id for row in store.list_pending_without_draft()],
+        'pending_count': store.count_pending_without_draft(),
+        'draft': store.latest_open_draft('e05')['draft'],
+        'drafts': {eid: d['draft'] for eid, d in store.latest_open_drafts(['e05', 'e12', 'e13']).items()},
+        'stats': store.compute_stats(),
+        'series': store.rollup_timeseries(START - 3600, START + 2 * 86400, 'hour'),
+        'clusters': clusters,
+        'members': {c['id']: [row.id for row in store.cluster_members(c['id'])] for c in clusters},
+        'mailboxes': (store.has_mailbox_emails('support'), store.has_mailbox_emails('sales')),
+        'exported': [row.id for batch in store.iter_emails({'status': Status.PROCESSED}, START, None, 7)
+                     for row in batch],
+    }
+
+
+def test_memory_and_sqlite_agree(use_backend):
+    use_backend('memory')
+    memory = _scenario()
+    use_backend('sqlite')
+    sqlite = _scenario()
+
+    assert memory['clusters'] and memory['sizes'] != {key: 1 for key in memory['sizes']}
+    for name in memory:
+        assert sqlite[name] == memory[name], name
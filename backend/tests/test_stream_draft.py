@@ -0,0 +1,52 @@
+import pytest
+
+from app.services import response, store
+from app.services.llm import DraftModel, DraftModelError
+from app.services.records import EmailRow, Status
+
+
+class BrokenModel(DraftModel):
+    """Streams ``pieces`` and then fails"""
+    name = 'broken'
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    def generate(self, prompt, email):
+        raise DraftModelError('down')
+
+    def stream(self, prompt, email):
+        yield from self.pieces
+        raise DraftModelError('connection reset')
+
+
+@pytest.fixture
+def email_id(store_backend):
+    return store.upsert_email(EmailRow(id='e1', sender='ann@example.com', subject='Cannot log in',
+                                       body='The login page keeps failing', received_at=1_700_000_000,
+                                       status=Status.PROCESSED))
+
+
+def test_failure_after_partial_output_is_marked_and_not_stored(email_id, monkeypatch):
+    monkeypatch.setattr(response, 'get_draft_model', lambda: BrokenModel(['Dear ann,', ' we are']))
+
+    text = ''.join(response.stream_draft(email_id))
+
+    assert text.startswith('Dear ann, we are')
+    assert response.STREAM_ERROR_MARKER in text
+    assert store.latest_open_draft(email_id) is None
+    assert len(response.get_draft_cache()) == 0
+
+
+def test_failure_before_output_streams_the_fallback(email_id, monkeypatch):
+    monkeypatch.setattr(response, 'get_draft_model', lambda: BrokenModel([]))
+
+    text = ''.join(response.stream_draft(email_id))
+
+    assert response.STREAM_ERROR_MARKER not in text
+    assert store.latest_open_draft(email_id)['draft'] == text
+
+
+def test_draft_model_is_abstract():
+    with pytest.raises(TypeError):
+        DraftModel()
@@ -0,0 +1,76 @@
+"""Expand the sample support dataset into large synthetic corpora.
+
+Usage (from the repo root):
+    python benchmarks/corpus.py 10000 100000 1000000
+
+Writes benchmarks/data/emails_<n>.csv with a ``sender,subject,body,sent_date``
+header. Output is deterministic for a given size and seed.
+"""
+import csv
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SAMPLE_CSV = ROOT / '68b1acd44f393_Sample_Support_Emails_Dataset.csv'
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+SIZES = [10_000, 100_000, 1_000_000]
+
+OPENERS = ["", "Hi team,\n", "Hello,\n", "Dear support,\n"]
+CLOSERS = ["", "\nThanks", "\n\nRegards,\nA customer", "\n\nSent from my iPhone"]
+EXTRAS = [
+    "",
+    " This is urgent, our team cannot access the dashboard.",
+    " I am frustrated that this is still not fixed.",
+    " Thanks, I appreciate the quick help.",
+    " You can reach me at +1 555 {phone} or {email}.",
+]
+# Share of emails that are follow-ups in an existing conversation
+REPLY_RATE = 0.2
+
+
+def sample_rows(path: Path = SAMPLE_CSV) -> list[tuple[str, str, str, str]]:
+    """(sender, subject, body, sent_date) rows; columns are read by position because the header is malformed"""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))[1:]
+    return [tuple(r[:4]) for r in rows if len(r) >= 4]
+
+
+def generate(rows: int, path: Path, seed: int = 7) -> Path:
+    rng = random.Random(seed)
+    samples = sample_rows()
+    customers = max(1, rows // 3)
+    base = datetime(2025, 9, 1)
+    conversations: list[tuple[str, str]] = []
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sender', 'subject', 'body', 'sent_date'])
+        for i in range(rows):
+            _, subject, body, _ = rng.choice(samples)
+            if conversations and rng.random() < REPLY_RATE:
+                sender, subject = rng.choice(conversations)
+                subject = f"Re: {subject}"
+            else:
+                sender = f"customer{rng.randrange(customers)}@example.com"
+                subject = f"{subject} #{i}"
+                conversations.append((sender, subject))
+            extra = rng.choice(EXTRAS).format(phone=rng.randrange(1000, 9999), email=sender)
+            body = f"{rng.choice(OPENERS)}{body}{extra}{rng.choice(CLOSERS)}"
+            sent = base - timedelta(seconds=rng.randrange(30 * 24 * 3600))
+            writer.writerow([sender, subject, body, sent.strftime('%Y-%m-%d %H:%M:%S')])
+    return path
+
+
+def corpus_path(rows: int) -> Path:
+    """Path of the corpus with ``rows`` emails, generated on first use"""
+    path = DATA_DIR / f'emails_{rows}.csv'
+    if not path.exists():
+        generate(rows, path)
+    return path
+
+
+if __name__ == '__main__':
+    for n in [int(a) for a in sys.argv[1:]] or SIZES:
+        print(corpus_path(n))
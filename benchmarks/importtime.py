@@ -0,0 +1,106 @@
+"""Startup import budget for the API; exits non-zero when it is exceeded.
+
+Usage (from the repo root):
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --budget-ms 150 --runs 9 --top 15
+
+backend/tests/test_startup.py runs the same checks under pytest.
+
+Runs ``python -X importtime -c "import app.main"`` in fresh processes, alternating
+with a process that imports only the web framework (FastAPI, Starlette, pydantic).
+The budget applies to the median difference, the cost of the app's own imports,
+which keeps the check stable on machines where the framework alone varies a lot.
+It also fails if any optional integration (Gmail client, Mongo, SMTP, numpy,
+pyarrow, embeddings) was imported at module load. Those belong in the lifespan or
+at first use.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+
+# top-level packages that must not load just because the API module was imported
+LAZY_MODULES = [
+    'googleapiclient', 'google_auth_oauthlib', 'google.auth', 'google.oauth2', 'httplib2',
+    'pymongo', 'smtplib', 'numpy', 'pyarrow', 'sentence_transformers', 'httpx',
+]
+
+BUDGET_MS = 150.0
+APP_IMPORT = 'import app.main'
+FRAMEWORK_IMPORT = ('import fastapi, fastapi.responses, fastapi.middleware.cors, starlette.testclient, '
+                    'pydantic_settings')
+
+
+def _run_once(code: str) -> tuple[dict, int]:
+    """(module name -> (self us, cumulative us), total us of top-level imports) for one cold import"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                         cwd=BACKEND, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"{code} failed:\n{out.stderr[-2000:]}")
+    modules = {}
+    total = 0
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+        if not name[1:].startswith(' '):
+            total += int(cumulative_us)
+    return modules, total
+
+
+def offenders(modules: dict) -> list[str]:
+    """Imported modules that belong to LAZY_MODULES"""
+    return sorted(name for name in modules
+                  if any(name == lazy or name.startswith(lazy + '.') for lazy in LAZY_MODULES))
+
+
+def app_modules() -> dict:
+    """Modules one cold app.main import loads"""
+    return _run_once(APP_IMPORT)[0]
+
+
+def measure(runs: int) -> tuple[float, dict]:
+    """(median ms app.main adds on top of the framework, modules of the last app.main import)"""
+    overheads = []
+    for _ in range(runs):
+        _, framework = _run_once(FRAMEWORK_IMPORT)
+        last, app = _run_once(APP_IMPORT)
+        overheads.append((app - framework) / 1000)
+    return statistics.median(overheads), last
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help="maximum median import time of the app's own modules on top of the framework")
+    parser.add_argument('--runs', type=int, default=7, help='cold import pairs to take the median of')
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to list')
+    args = parser.parse_args()
+
+    total_ms, last = measure(args.runs)
+    print(f"app.main: {last['app.main'][1] / 1000:.1f} ms in total, {total_ms:.1f} ms over the framework "
+          f"(median of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    print("slowest modules (cumulative):")
+    for name, (_, cumulative) in sorted(last.items(), key=lambda kv: kv[1][1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = offenders(last)
+    if loaded:
+        failed = True
+        print(f"FAIL: optional integrations imported at startup: {', '.join(loaded[:10])}")
+    if total_ms > args.budget_ms:
+        failed = True
+        print(f"FAIL: app import time {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Stand-ins for the external services the backend talks to.
+
+MockGmailService mimics the discovery-built Gmail client
+(``service.users().messages().list/get(...).execute()``) with a configurable
+per-call latency, list paging and, optionally, Gmail's per-user quota: calls
+beyond ``quota_units_per_second`` in any one-second window fail with a 429
+HttpError, as Gmail does. SmtpSink is a minimal SMTP server that accepts and counts
+messages without delivering them.
+"""
+import base64
+import collections
+import random
+import socketserver
+import threading
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+
+class _Request:
+    def __init__(self, service: 'MockGmailService', result):
+        self._service = service
+        self._result = result
+
+    def execute(self):
+        self._service.charge(5)
+        if self._service.latency:
+            time.sleep(self._service.latency)
+        return self._result
+
+
+class _Messages:
+    def __init__(self, service: 'MockGmailService'):
+        self._service = service
+
+    def list(self, userId='me', q='', maxResults=100, pageToken=None, **kwargs):
+        start = int(pageToken or 0)
+        page = self._service.messages[start:start + maxResults]
+        result = {'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in page],
+                  'resultSizeEstimate': len(page)}
+        if start + maxResults < len(self._service.messages):
+            result['nextPageToken'] = str(start + maxResults)
+        return _Request(self._service, result)
+
+    def get(self, userId='me', id='', format='full', **kwargs):
+        return _Request(self._service, self._service.by_id[id])
+
+
+class _Users:
+    def __init__(self, service: 'MockGmailService'):
+        self._service = service
+
+    def messages(self):
+        return _Messages(self._service)
+
+
+class MockGmailService:
+    """One mailbox; ``prefix`` keeps message and thread ids distinct between mailboxes"""
+
+    def __init__(self, rows: list, latency_ms: float = 0.0, seed: int = 7, prefix: str = '',
+                 quota_units_per_second: float | None = None):
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        self.latency = latency_ms / 1000
+        self.quota = quota_units_per_second
+        self.rate_limited = 0
+        self._window = collections.deque()
+        self._lock = threading.Lock()
+        self.messages = []
+        for i, (sender, subject, body, _) in enumerate(rows):
+            sent = now - timedelta(seconds=rng.randrange(7 * 24 * 3600))
+            data = base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii').rstrip('=')
+            self.messages.append({
+                'id': f'{prefix}m{i:08d}',
+                'threadId': f'{prefix}t{i // 3:08d}',
+                'internalDate': str(int(sent.timestamp() * 1000)),
+                'payload': {
+                    'mimeType': 'multipart/alternative',
+                    'headers': [
+                        {'name': 'Subject', 'value': f"{subject} #{i}"},
+                        {'name': 'From', 'value': sender},
+                        {'name': 'Date', 'value': format_datetime(sent)},
+                        {'name': 'Message-ID', 'value': f'<bench-{prefix}{i}@example.com>'},
+                    ],
+                    'parts': [{'mimeType': 'text/plain', 'body': {'data': data}}],
+                },
+            })
+        self.by_id = {m['id']: m for m in self.messages}
+
+    def charge(self, units: int):
+        """Spend quota units; 429 when the last second's calls already used the quota"""
+        if self.quota is None:
+            return
+        from googleapiclient.errors import HttpError
+        import httplib2
+
+        with self._lock:
+            now = time.monotonic()
+            while self._window and self._window[0][0] <= now - 1.0:
+                self._window.popleft()
+            if sum(u for _, u in self._window) + units > self.quota:
+                self.rate_limited += 1
+                raise HttpError(httplib2.Response({'status': 429}), b'{"error": {"code": 429, "message": '
+                                b'"User-rate limit exceeded", "errors": [{"reason": "rateLimitExceeded"}]}}')
+            self._window.append((now, units))
+
+    def users(self):
+        return _Users(self)
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        self._reply("220 bench-sink ESMTP")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode('utf-8', errors='ignore').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                # one write per reply: split writes stall on delayed ACKs
+                self._reply("250-bench-sink\r\n250 AUTH PLAIN LOGIN")
+            elif verb == 'AUTH':
+                if command.upper().startswith('AUTH LOGIN'):
+                    self._reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self._reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self._reply("235 Authentication successful")
+            elif verb == 'DATA':
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.sink.received += 1
+                self._reply("250 OK queued")
+            elif verb == 'QUIT':
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SmtpSink:
+    """Local SMTP server on a free port; counts accepted messages. No STARTTLS."""
+
+    def __init__(self):
+        self.received = 0
+        self._server = _Server(('127.0.0.1', 0), _SmtpHandler)
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
@@ -0,0 +1,107 @@
+"""Memory per stored email and CSV ingest throughput for the in-memory store.
+
+Usage (from the repo root):
+    python benchmarks/record_memory.py 100000 1000000
+    python benchmarks/record_memory.py --rss-only 1000000
+
+tracemalloc roughly triples the memory of the run it traces, so at a million
+emails it needs more than 5 GB; --rss-only skips it and reports only the
+resident-memory growth of the untraced run (Linux), which also counts
+allocator overhead and freed-but-unreturned memory.
+"""
+import csv
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'backend'))
+
+from app.services import store  # noqa: E402
+from app.services.csv_ingest import load_csv  # noqa: E402
+
+SUBJECTS = [
+    "Help required with account verification",
+    "Urgent request: system access blocked",
+    "Immediate support needed for billing error",
+    "Query about product pricing",
+    "Support needed for login issue",
+]
+BODIES = [
+    "Hi team, I am unable to log into my account since yesterday. Could you please help me resolve this issue?",
+    "Hello, I wanted to understand the pricing tiers better. Could you share a detailed breakdown?",
+    "Do you support integration with third-party APIs? Specifically, I'm looking for CRM integration options.",
+    "There is a billing error where I was charged twice. This needs immediate correction.",
+]
+
+
+def write_csv(path: Path, rows: int, seed: int = 7):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sender', 'subject', 'body', 'sent_date'])
+        for i in range(rows):
+            writer.writerow([
+                f"customer{rng.randrange(rows)}@example.com",
+                f"{rng.choice(SUBJECTS)} #{i}",
+                f"{rng.choice(BODIES)} Ref {i}, call +1 555 {rng.randrange(1000, 9999)}.",
+                f"2025-08-{rng.randrange(1, 29):02d} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00",
+            ])
+
+
+def _rss() -> int | None:
+    """Resident bytes of this process, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def _ingest(path: Path, trace: bool) -> tuple[int, float, int]:
+    """(stored, seconds, bytes): traced bytes with ``trace``, otherwise resident growth (0 if unknown)"""
+    store.clear_all_data()
+    gc.collect()
+    before = _rss()
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    stored = load_csv(str(path))['stored']
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    if trace:
+        grown, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        after = _rss()
+        grown = after - before if before is not None and after is not None else 0
+    store.clear_all_data()
+    return stored, elapsed, grown
+
+
+def measure(rows: int, traced: bool = True) -> dict:
+    """Throughput and resident growth from an untraced run; memory from a second run under tracemalloc"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'emails.csv'
+        write_csv(path, rows)
+        stored, elapsed, rss = _ingest(path, trace=False)
+        result = {
+            'rows': rows,
+            'stored': stored,
+            'rss_bytes_per_email': round(rss / max(stored, 1)),
+            'ingest_emails_per_sec': round(stored / elapsed),
+        }
+        if traced:
+            result['bytes_per_email'] = round(_ingest(path, trace=True)[2] / max(stored, 1))
+    return result
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    rss_only = '--rss-only' in args
+    for n in [int(a) for a in args if a != '--rss-only'] or [100_000]:
+        print(measure(n, traced=not rss_only))
@@ -0,0 +1,275 @@
+"""End-to-end benchmarks with mocked Gmail and SMTP; results are written as JSON.
+
+Usage (from the repo root):
+    python benchmarks/run.py --size 10000
+    python benchmarks/run.py --size 100000 --gmail-latency-ms 50 --only csv_ingest,endpoints
+    python benchmarks/run.py --size 100000 --backend sqlite --only csv_ingest,endpoints
+    python benchmarks/run.py --only gmail_ingest --mailboxes 4
+    python benchmarks/run.py --compare benchmarks/results/old.json benchmarks/results/new.json
+
+Each run writes benchmarks/results/<commit>-<size>[-<backend>].json unless --output is given.
+The SQLite backend writes its database to a temporary directory.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / 'results'
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(BENCH_DIR))
+
+# Settings are read once, so keep the benchmark away from real data and services before importing the app
+_TMP = tempfile.mkdtemp(prefix='bench-')
+os.environ.update({
+    'SNAPSHOT_ENABLED': 'false',
+    'PREDRAFT_ENABLED': 'false',
+    'PROFILING_ENABLED': 'false',
+    'DRAFT_MODEL': 'stub',
+    'DRAFT_CACHE_PATH': str(Path(_TMP) / 'draft_cache.jsonl'),
+    'OUTBOX_PATH': str(Path(_TMP) / 'outbox.db'),
+    'OUTBOX_WORKER_ENABLED': 'false',
+    'MAILBOX_STATE_PATH': str(Path(_TMP) / 'mailbox_state.json'),
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.config import get_settings  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import email_fetch, export, response, store  # noqa: E402
+from app.services.csv_ingest import load_csv  # noqa: E402
+from app.services.draft_cache import DraftCache  # noqa: E402
+from app.services.email_send import send_bulk_replies  # noqa: E402
+from app.services.mailboxes import Mailbox  # noqa: E402
+from corpus import corpus_path, sample_rows  # noqa: E402
+from mocks import MockGmailService, SmtpSink  # noqa: E402
+
+BENCHMARKS = ['csv_ingest', 'gmail_ingest', 'endpoints', 'drafts', 'bulk_send', 'export']
+
+
+def _percentiles(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+    }
+
+
+def bench_csv_ingest(args) -> dict:
+    path = corpus_path(args.size)
+    store.clear_all_data()
+    started = time.perf_counter()
+    result = load_csv(str(path))
+    elapsed = time.perf_counter() - started
+    return {'rows': result['rows'], 'stored': result['stored'], 'seconds': round(elapsed, 3),
+            'emails_per_sec': round(result['stored'] / elapsed)}
+
+
+def bench_gmail_ingest(args) -> dict:
+    """Every mailbox gets its own message set and a mock that returns 429 past Gmail's per-user quota"""
+    samples = sample_rows()
+    rows = [samples[i % len(samples)] for i in range(args.gmail_messages)]
+    mailboxes = [Mailbox(f'mb{i}') for i in range(args.mailboxes)]
+    services = {m.name: MockGmailService(rows, latency_ms=args.gmail_latency_ms, prefix=f'{m.name}-',
+                                         quota_units_per_second=args.gmail_quota)
+                for m in mailboxes}
+    originals = email_fetch._get_gmail_service, email_fetch.load_mailboxes
+    email_fetch._get_gmail_service = lambda mailbox=None: (services[mailbox.name], None)
+    email_fetch.load_mailboxes = lambda: mailboxes
+    get_settings().gmail_quota_units_per_second = args.gmail_quota
+    try:
+        store.clear_all_data()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = email_fetch.fetch_from_gmail_inbox(limit=args.gmail_messages)
+        elapsed = time.perf_counter() - started
+    finally:
+        email_fetch._get_gmail_service, email_fetch.load_mailboxes = originals
+    messages = args.gmail_messages * args.mailboxes
+    return {'latency_ms': args.gmail_latency_ms, 'mailboxes': args.mailboxes, 'messages': messages,
+            'fetched': result.get('fetched', 0), 'stored': result.get('stored', 0), 'seconds': round(elapsed, 3),
+            'messages_per_sec': round(messages / elapsed) if elapsed else None,
+            'rate_limited': sum(s.rate_limited for s in services.values()), 'reason': result.get('reason')}
+
+
+def bench_endpoints(args) -> dict:
+    if store.count_emails() < args.size // 2:
+        bench_csv_ingest(args)
+    results = {'store_size': store.count_emails()}
+    with TestClient(app) as client:
+        for name, url in (('list', '/emails/?limit=50'), ('stats', '/emails/stats'),
+                          ('timeseries', '/emails/stats/timeseries?from=2025-01-01T00:00:00&to=2026-01-01T00:00:00')):
+            client.get(url)
+            samples = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                client.get(url).raise_for_status()
+                samples.append(time.perf_counter() - started)
+            results[name] = _percentiles(samples)
+    return results
+
+
+def bench_drafts(args) -> dict:
+    if not store.count_emails():
+        bench_csv_ingest(args)
+    response._draft_cache = DraftCache(None)
+    ids = [e.id for e in store.list_pending_without_draft(limit=args.drafts)]
+    results = {'emails': len(ids)}
+    for phase in ('cold', 'warm'):
+        started = time.perf_counter()
+        for eid in ids:
+            response.generate_draft(eid)
+        elapsed = time.perf_counter() - started
+        results[phase] = {'seconds': round(elapsed, 3), 'drafts_per_sec': round(len(ids) / elapsed) if elapsed else None}
+    return results
+
+
+def bench_bulk_send(args) -> dict:
+    if not any(store.latest_open_draft(e.id) for e in store.latest_per_thread()):
+        bench_drafts(args)
+    settings = get_settings()
+    saved = {k: getattr(settings, k) for k in ('smtp_host', 'smtp_port', 'smtp_user', 'smtp_password', 'smtp_starttls')}
+    with SmtpSink() as sink:
+        settings.smtp_host, settings.smtp_port = '127.0.0.1', sink.port
+        settings.smtp_user, settings.smtp_password, settings.smtp_starttls = 'bench@example.com', 'x', False
+        try:
+            started = time.perf_counter()
+            result = send_bulk_replies()
+            elapsed = time.perf_counter() - started
+        finally:
+            for k, v in saved.items():
+                setattr(settings, k, v)
+    return {'sent': result['sent'], 'failed': result['failed'], 'received': sink.received,
+            'seconds': round(elapsed, 3), 'sends_per_sec': round(result['sent'] / elapsed) if elapsed else None}
+
+
+def _rss_anon_mb() -> float | None:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def bench_export(args) -> dict:
+    if store.count_emails() < args.size // 2:
+        bench_csv_ingest(args)
+    results = {'emails': store.count_emails()}
+    formats = [('csv', 'gzip'), ('ndjson', None)]
+    if importlib.util.find_spec('pyarrow') is not None:
+        formats.append(('parquet', 'zstd'))
+    for fmt, compression in formats:
+        plan = export.parse_request(fmt, None, compression)
+        before = peak = _rss_anon_mb()
+        written = 0
+        started = time.perf_counter()
+        for chunk in export.export_chunks(plan):
+            written += len(chunk)
+            if before is not None:
+                peak = max(peak, _rss_anon_mb())
+        elapsed = time.perf_counter() - started
+        # the peak should track EXPORT_BATCH_SIZE, not the number of emails
+        results[fmt] = {'mb': round(written / 2 ** 20, 1), 'seconds': round(elapsed, 3),
+                        'emails_per_sec': round(results['emails'] / elapsed) if elapsed else None,
+                        'rss_growth_mb': round(peak - before, 1) if before is not None else None}
+    return results
+
+
+def _commit() -> str:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def run(args) -> dict:
+    selected = args.only.split(',') if args.only else BENCHMARKS
+    # the store backend is created on first use, so switching settings here is enough
+    settings = get_settings()
+    settings.store_backend = args.backend
+    settings.sqlite_path = str(Path(_TMP) / 'store.db')
+    report = {
+        'commit': _commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'size': args.size,
+        'backend': args.backend,
+        'results': {},
+    }
+    for name in BENCHMARKS:
+        if name not in selected:
+            continue
+        print(f"running {name} ...", flush=True)
+        report['results'][name] = globals()[f'bench_{name}'](args)
+        print(f"  {json.dumps(report['results'][name])}", flush=True)
+    return report
+
+
+def _flatten(data: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str):
+    """Print every numeric result side by side with the relative change"""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{old['commit']} -> {new['commit']} (size {old['size']} -> {new['size']}, "
+          f"backend {old.get('backend', 'memory')} -> {new.get('backend', 'memory')})")
+    old_flat, new_flat = _flatten(old['results']), _flatten(new['results'])
+    for key in sorted(set(old_flat) & set(new_flat)):
+        a, b = old_flat[key], new_flat[key]
+        change = f"{(b - a) / a * 100:+.1f}%" if a else 'n/a'
+        print(f"{key:45} {a:>12} {b:>12} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=10_000, help='emails in the synthetic corpus')
+    parser.add_argument('--gmail-latency-ms', type=float, default=20.0, help='simulated latency per Gmail API call')
+    parser.add_argument('--mailboxes', type=int, default=1, help='mock Gmail mailboxes synced concurrently')
+    parser.add_argument('--gmail-messages', type=int, default=200, help='messages per mock mailbox')
+    parser.add_argument('--gmail-quota', type=float, default=250.0,
+                        help='quota units per second per mailbox; the mock returns 429 beyond it')
+    parser.add_argument('--requests', type=int, default=20, help='requests per endpoint')
+    parser.add_argument('--drafts', type=int, default=200, help='emails to draft (and then send)')
+    parser.add_argument('--backend', choices=('memory', 'sqlite'), default='memory', help='store backend')
+    parser.add_argument('--only', help=f"comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument('--output', help='result file (default benchmarks/results/<commit>-<size>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args)
+    suffix = '' if args.backend == 'memory' else f"-{args.backend}"
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['commit']}-{args.size}{suffix}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"wrote {output}")
+
+
+if __name__ == '__main__':
+    main()
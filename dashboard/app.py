@@ -4,6 +4,8 @@ import os
 import pandas as pd
 
 API_BASE = os.environ.get('API_BASE', 'http://localhost:8000')
+# backend response.STREAM_ERROR_MARKER: the model failed part-way through a streamed draft
+DRAFT_STREAM_ERROR = '[draft generation failed]'
 
 st.set_page_config(page_title="Support AI Inbox", layout="wide")
 
@@ -112,7 +114,8 @@ if emails:
             "Help": "🤝", "Billing": "💰", "Technical": "🔧", "Account": "👤"
         }.get(category, "📂")
         
-        preview = f"{priority_icon} {sentiment_icon} {category_icon} {category} | {email.get('subject', 'No Subject')[:50]}..."
+        thread_note = f" ({email['thread_size']} msgs)" if email.get('thread_size', 1) > 1 else ""
+        preview = f"{priority_icon} {sentiment_icon} {category_icon} {category} | {email.get('subject', 'No Subject')[:50]}...{thread_note}"
         email_options.append((email['id'], preview))
     
     selected = st.selectbox(
@@ -165,10 +168,26 @@ if selected:
                 if extraction.get('urgency_reason'):
                     st.write("⚡ **Urgency Trigger:**", extraction['urgency_reason'])
         
+        # Pre-generated drafts are returned with the email; load one when switching emails
+        if st.session_state.get('draft_email') != selected:
+            st.session_state['draft'] = detail.get('draft') or ''
+            st.session_state['draft_email'] = selected
+
         if st.button("🤖 Generate Draft"):
             try:
-                d = requests.post(f"{API_BASE}/emails/{selected}/draft").json()
-                st.session_state['draft'] = d.get('draft','')
+                # Stream tokens so the first words appear before the whole draft is ready
+                live = st.empty()
+                text = ''
+                with requests.get(f"{API_BASE}/emails/{selected}/draft/stream", stream=True) as r:
+                    r.encoding = 'utf-8'
+                    for chunk in r.iter_content(chunk_size=None, decode_unicode=True):
+                        text += chunk
+                        live.markdown(text)
+                live.empty()
+                if DRAFT_STREAM_ERROR in text:
+                    st.error("Draft generation failed part-way; please try again")
+                else:
+                    st.session_state['draft'] = text
             except Exception as e:
                 st.error(f"Draft generation failed: {e}")
         draft = st.text_area("Draft", value=st.session_state.get('draft',''), height=200)
@@ -233,5 +252,14 @@ if st.session_state.get('show_stats'):
         
         st.subheader("Sentiment Distribution")
         st.bar_chart(pd.DataFrame.from_dict(stats.get('sentiment_counts', {}), orient='index', columns=['count']))
+
+        series = requests.get(f"{API_BASE}/emails/stats/timeseries", params={'granularity': 'day'}).json()
+        points = series.get('points', [])
+        if points:
+            days = [p['start'][:10] for p in points]
+            st.subheader("Daily Volume by Category (last 30 days)")
+            st.bar_chart(pd.DataFrame([p['category_counts'] for p in points], index=days).fillna(0))
+            st.subheader("Response Time Percentiles (minutes)")
+            st.line_chart(pd.DataFrame([p['response_time_minutes'] for p in points], index=days))
     except Exception as e:
         st.error(f"Failed to load stats: {e}")